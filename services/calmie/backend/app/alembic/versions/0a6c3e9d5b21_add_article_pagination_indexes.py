@@ -0,0 +1,30 @@
+"""Add composite indexes for article cursor pagination
+
+Revision ID: 0a6c3e9d5b21
+Revises: f29b6d0e8c14
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a6c3e9d5b21'
+down_revision: Union[str, None] = 'f29b6d0e8c14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # (public_at, id) の降順で読むカーソルページング用
+    op.create_index('ix_articles_public_at_id', 'articles', ['public_at', 'id'])
+    op.create_index(
+        'ix_articles_create_user_id_public_at_id', 'articles', ['create_user_id', 'public_at', 'id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_articles_create_user_id_public_at_id', table_name='articles')
+    op.drop_index('ix_articles_public_at_id', table_name='articles')
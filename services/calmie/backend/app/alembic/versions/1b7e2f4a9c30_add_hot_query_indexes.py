@@ -0,0 +1,47 @@
+"""Add composite, GIN and partial indexes for hot queries
+
+Revision ID: 1b7e2f4a9c30
+Revises: 0a6c3e9d5b21
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1b7e2f4a9c30'
+down_revision: Union[str, None] = '0a6c3e9d5b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (インデックス名, テーブル, カラム, 部分インデックスの条件)
+BTREE_INDEXES = [
+    # トレンド・バッチの期間集計（削除済みのいいね／コメントは集計対象外）
+    ('ix_article_likes_article_id_created_at', 'article_likes', ['article_id', 'created_at'], 'deleted_at IS NULL'),
+    ('ix_article_likes_created_at', 'article_likes', ['created_at'], 'deleted_at IS NULL'),
+    # 記事ページのコメント取得は削除済みも含めて読むため部分インデックスにしない
+    ('ix_article_comments_article_id_created_at', 'article_comments', ['article_id', 'created_at'], None),
+    ('ix_article_comments_created_at', 'article_comments', ['created_at'], 'deleted_at IS NULL'),
+    ('ix_daily_rating_article_id_created_at', 'daily_rating', ['article_id', 'created_at'], None),
+    ('ix_daily_rating_created_at', 'daily_rating', ['created_at'], None),
+    ('ix_media_files_uploaded_by_created_at', 'media_files', ['uploaded_by', 'created_at'], 'deleted_at IS NULL'),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns, where in BTREE_INDEXES:
+        op.create_index(
+            name, table, columns,
+            postgresql_where=sa.text(where) if where else None,
+        )
+    # category @> ARRAY['...'] の絞り込み用
+    op.create_index('ix_articles_category', 'articles', ['category'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_articles_category', table_name='articles')
+    for name, table, _columns, _where in reversed(BTREE_INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,48 @@
+"""Add transcode_jobs table and media_files.status
+
+Revision ID: 2c8d5e1f7a43
+Revises: 1b7e2f4a9c30
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c8d5e1f7a43'
+down_revision: Union[str, None] = '1b7e2f4a9c30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'media_files',
+        sa.Column('status', sa.String, nullable=False, server_default='ready'),
+    )
+    op.create_table(
+        'transcode_jobs',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column('media_id', sa.Integer, sa.ForeignKey('media_files.id'), nullable=True),
+        sa.Column('source_path', sa.String, nullable=False),
+        sa.Column('status', sa.String, nullable=False, server_default='queued'),
+        sa.Column('attempts', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('last_error', sa.Text, nullable=True),
+        sa.Column('locked_at', sa.TIMESTAMP, nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP, nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP, nullable=False),
+        sa.Column('finished_at', sa.TIMESTAMP, nullable=True),
+    )
+    op.create_index(
+        'ix_transcode_jobs_pending', 'transcode_jobs', ['status', 'id'],
+        postgresql_where=sa.text("status IN ('queued', 'processing')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transcode_jobs_pending', table_name='transcode_jobs')
+    op.drop_table('transcode_jobs')
+    op.drop_column('media_files', 'status')
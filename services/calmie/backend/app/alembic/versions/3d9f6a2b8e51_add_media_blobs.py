@@ -0,0 +1,50 @@
+"""Add content-addressed media_blobs and media_files.content_hash
+
+Revision ID: 3d9f6a2b8e51
+Revises: 2c8d5e1f7a43
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9f6a2b8e51'
+down_revision: Union[str, None] = '2c8d5e1f7a43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'media_blobs',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column('sha256', sa.String(64), nullable=False),
+        sa.Column('variant', sa.String, nullable=False),
+        sa.Column('stored_filename', sa.String, nullable=False),
+        sa.Column('thumbnail_filename', sa.String, nullable=True),
+        sa.Column('file_size', sa.Integer, nullable=False),
+        sa.Column('ref_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('created_at', sa.TIMESTAMP, nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP, nullable=False),
+        sa.UniqueConstraint('sha256', 'variant', name='uq_media_blobs_sha256_variant'),
+    )
+    op.create_index('ix_media_blobs_stored_filename', 'media_blobs', ['stored_filename'])
+
+    # 同じ内容のメディアは同じファイルを指すため、stored_filename の一意制約を外す
+    op.drop_constraint('media_files_stored_filename_key', 'media_files', type_='unique')
+    op.create_index('ix_media_files_stored_filename', 'media_files', ['stored_filename'])
+    op.add_column('media_files', sa.Column('content_hash', sa.String(64), nullable=True))
+    op.create_index('ix_media_files_content_hash', 'media_files', ['content_hash'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_media_files_content_hash', table_name='media_files')
+    op.drop_column('media_files', 'content_hash')
+    op.drop_index('ix_media_files_stored_filename', table_name='media_files')
+    op.create_unique_constraint('media_files_stored_filename_key', 'media_files', ['stored_filename'])
+    op.drop_index('ix_media_blobs_stored_filename', table_name='media_blobs')
+    op.drop_table('media_blobs')
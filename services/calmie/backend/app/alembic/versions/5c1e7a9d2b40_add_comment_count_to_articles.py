@@ -0,0 +1,45 @@
+"""Add comment_count to articles
+
+Revision ID: 5c1e7a9d2b40
+Revises: 10943b67dc32, add_media_management
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e7a9d2b40'
+down_revision: Union[str, Sequence[str], None] = ('10943b67dc32', 'add_media_management')
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 記事ごとのコメント数を非正規化して保持する
+    op.add_column(
+        'articles',
+        sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False),
+    )
+
+    # 既存コメントから初期値を設定
+    op.execute(
+        """
+        UPDATE articles AS a
+        SET comment_count = c.cnt
+        FROM (
+            SELECT article_id, COUNT(*) AS cnt
+            FROM article_comments
+            WHERE deleted_at IS NULL
+            GROUP BY article_id
+        ) AS c
+        WHERE a.id = c.article_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('articles', 'comment_count')
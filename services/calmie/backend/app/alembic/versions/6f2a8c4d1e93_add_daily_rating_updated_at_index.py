@@ -0,0 +1,26 @@
+"""Add index on daily_rating.updated_at
+
+Revision ID: 6f2a8c4d1e93
+Revises: 9e4b7d1c2a65
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f2a8c4d1e93'
+down_revision: Union[str, None] = '9e4b7d1c2a65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 日次ランキングは過去24時間に更新された行を読む（差分集計は増減がある記事の行だけを更新する）
+    op.create_index('ix_daily_rating_updated_at', 'daily_rating', ['updated_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_daily_rating_updated_at', table_name='daily_rating')
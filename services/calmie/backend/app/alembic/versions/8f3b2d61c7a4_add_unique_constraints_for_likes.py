@@ -0,0 +1,66 @@
+"""Add unique constraints for article likes and history rating
+
+Revision ID: 8f3b2d61c7a4
+Revises: 5c1e7a9d2b40
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3b2d61c7a4'
+down_revision: Union[str, None] = '5c1e7a9d2b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # history_rating の重複レコードを統合（最小IDの行に最大値を残す）
+    op.execute(
+        """
+        UPDATE history_rating AS h
+        SET access_count = d.access_count,
+            like_count = d.like_count,
+            super_like_count = d.super_like_count
+        FROM (
+            SELECT article_id,
+                   MIN(id) AS keep_id,
+                   MAX(access_count) AS access_count,
+                   MAX(like_count) AS like_count,
+                   MAX(super_like_count) AS super_like_count
+            FROM history_rating
+            GROUP BY article_id
+            HAVING COUNT(*) > 1
+        ) AS d
+        WHERE h.id = d.keep_id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM history_rating AS h
+        USING history_rating AS h2
+        WHERE h.article_id = h2.article_id AND h.id > h2.id
+        """
+    )
+    op.create_unique_constraint('uq_history_rating_article_id', 'history_rating', ['article_id'])
+
+    # 同一ユーザーの重複いいねを削除
+    op.execute(
+        """
+        DELETE FROM article_likes AS l
+        USING article_likes AS l2
+        WHERE l.user_id = l2.user_id
+          AND l.article_id = l2.article_id
+          AND l.id > l2.id
+        """
+    )
+    op.create_unique_constraint('uq_article_likes_user_article', 'article_likes', ['user_id', 'article_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_article_likes_user_article', 'article_likes', type_='unique')
+    op.drop_constraint('uq_history_rating_article_id', 'history_rating', type_='unique')
@@ -0,0 +1,51 @@
+"""Add summary to articles
+
+Revision ID: 9e4b7d1c2a65
+Revises: 3d9f6a2b8e51
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.summary import make_summary
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4b7d1c2a65'
+down_revision: Union[str, None] = '3d9f6a2b8e51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def upgrade() -> None:
+    # 一覧用の要約（一覧では本文を読み込まずにこれを返す）
+    op.add_column('articles', sa.Column('summary', sa.Text(), nullable=True))
+
+    # 既存記事の要約を作成（Markdown 記号の除去は Python 側で行う）
+    conn = op.get_bind()
+    update = sa.text("UPDATE articles SET summary = :summary WHERE id = :id")
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.text(
+                "SELECT id, content FROM articles "
+                "WHERE id > :last_id ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        conn.execute(update, [
+            {"id": row.id, "summary": make_summary(row.content)}
+            for row in rows
+        ])
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    op.drop_column('articles', 'summary')
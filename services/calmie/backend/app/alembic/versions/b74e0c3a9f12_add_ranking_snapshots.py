@@ -0,0 +1,34 @@
+"""Add ranking_snapshots table
+
+Revision ID: b74e0c3a9f12
+Revises: 8f3b2d61c7a4
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b74e0c3a9f12'
+down_revision: Union[str, None] = '8f3b2d61c7a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ranking_snapshots',
+        sa.Column('id', sa.Integer, primary_key=True, index=True),
+        sa.Column('period', sa.String, nullable=False),
+        sa.Column('version', sa.Integer, nullable=False),
+        sa.Column('payload', sa.Text, nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP, nullable=False),
+        sa.UniqueConstraint('period', 'version', name='uq_ranking_snapshots_period_version'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ranking_snapshots')
@@ -0,0 +1,38 @@
+"""Add unique constraint to aggregate_points
+
+Revision ID: c2d9a4e81b57
+Revises: b74e0c3a9f12
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2d9a4e81b57'
+down_revision: Union[str, None] = 'b74e0c3a9f12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 重複レコードは最新（最大ID）のものだけ残す
+    op.execute(
+        """
+        DELETE FROM aggregate_points AS p
+        USING aggregate_points AS p2
+        WHERE p.article_id = p2.article_id
+          AND p.target_type = p2.target_type
+          AND p.id < p2.id
+        """
+    )
+    op.create_unique_constraint(
+        'uq_aggregate_points_article_target', 'aggregate_points', ['article_id', 'target_type']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_aggregate_points_article_target', 'aggregate_points', type_='unique')
@@ -0,0 +1,32 @@
+"""Add batch_watermarks table
+
+Revision ID: d81f5c3e6a27
+Revises: c2d9a4e81b57
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81f5c3e6a27'
+down_revision: Union[str, None] = 'c2d9a4e81b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'batch_watermarks',
+        sa.Column('name', sa.String, primary_key=True),
+        sa.Column('last_id', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('last_run_at', sa.TIMESTAMP, nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP, nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('batch_watermarks')
@@ -0,0 +1,54 @@
+"""Add partitioned article_access_events table
+
+Revision ID: e4a7c19b3f60
+Revises: d81f5c3e6a27
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c19b3f60'
+down_revision: Union[str, None] = 'd81f5c3e6a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def upgrade() -> None:
+    # 追記専用の閲覧ログ（viewed_at の月単位でパーティション分割）
+    op.execute("""
+        CREATE TABLE article_access_events (
+            id BIGSERIAL NOT NULL,
+            viewed_at TIMESTAMP NOT NULL,
+            article_id INTEGER NOT NULL,
+            views INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (id, viewed_at)
+        ) PARTITION BY RANGE (viewed_at)
+    """)
+    op.execute("CREATE INDEX ix_article_access_events_viewed_at ON article_access_events (viewed_at)")
+
+    # 範囲外の行を受け止めるデフォルトパーティションと、当月から3か月分のパーティション
+    # （以降の月はバッチ処理が事前に作成する）
+    op.execute("CREATE TABLE article_access_events_default PARTITION OF article_access_events DEFAULT")
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for offset in range(3):
+        start = _add_months(month_start, offset)
+        end = _add_months(month_start, offset + 1)
+        op.execute(
+            f"CREATE TABLE article_access_events_{start:%Y%m} PARTITION OF article_access_events "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('article_access_events')
@@ -0,0 +1,56 @@
+"""Add full-text search vector to articles
+
+Revision ID: f29b6d0e8c14
+Revises: e4a7c19b3f60
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.search import search_document
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f29b6d0e8c14'
+down_revision: Union[str, None] = 'e4a7c19b3f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def upgrade() -> None:
+    op.add_column('articles', sa.Column('search_vector', postgresql.TSVECTOR, nullable=True))
+
+    # 既存記事の検索用ベクトルを作成（バイグラム分解は Python 側で行う）
+    conn = op.get_bind()
+    update = sa.text("UPDATE articles SET search_vector = CAST(:document AS tsvector) WHERE id = :id")
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.text(
+                "SELECT id, title, content, category FROM articles "
+                "WHERE id > :last_id ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        conn.execute(update, [
+            {"id": row.id, "document": search_document(row.title, row.content, row.category)}
+            for row in rows
+        ])
+        last_id = rows[-1].id
+
+    op.create_index(
+        'ix_articles_search_vector', 'articles', ['search_vector'], postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_articles_search_vector', table_name='articles')
+    op.drop_column('articles', 'search_vector')
@@ -1,6 +1,10 @@
 import os
+import threading
+import time
 from pathlib import Path
 from sqlalchemy import create_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -24,9 +28,102 @@ if not DATABASE_URL:
     DATABASE_URL = "postgresql://hitoiki_user:hitoiki_password@db:5432/hitoiki_db"
     print(f"⚠️ DATABASE_URL未設定: デフォルトURL使用 -> {DATABASE_URL}")
 
+# コネクションプール設定（環境変数で調整可能）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # 接続待ちの上限（秒）
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 接続を作り直す間隔（秒）
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 は無制限
+
+
+class PoolMetrics:
+    """プールからの接続取得待ち時間を集計する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, wait_seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait_seconds / attempts * 1000, 3) if attempts else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            }
+
+
+# pool.recreate() でも引き継がれるよう、メトリクスはクラス単位で持つ
+pool_metrics = {"sync": PoolMetrics(), "async": PoolMetrics()}
+
+
+class _WaitTimeMixin:
+    metrics_key = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            pool_metrics[self.metrics_key].record(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics[self.metrics_key].record(time.perf_counter() - started)
+        return conn
+
+
+class InstrumentedQueuePool(_WaitTimeMixin, QueuePool):
+    metrics_key = "sync"
+
+
+class InstrumentedAsyncQueuePool(_WaitTimeMixin, AsyncAdaptedQueuePool):
+    metrics_key = "async"
+
+
+def pool_options(url: str, poolclass) -> dict:
+    """PostgreSQL 用のプール・タイムアウト設定（SQLite では使わない）"""
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def statement_timeout_connect_args(url: str) -> dict:
+    """ドライバごとの statement_timeout 指定"""
+    if not DB_STATEMENT_TIMEOUT_MS or url.startswith("sqlite"):
+        return {}
+    if "+asyncpg" in url:
+        return {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+
+
 try:
     # エンジンとセッションの設定
-    engine = create_engine(DATABASE_URL, echo=False)
+    engine = create_engine(
+        DATABASE_URL,
+        echo=False,
+        connect_args=statement_timeout_connect_args(DATABASE_URL),
+        **pool_options(DATABASE_URL, InstrumentedQueuePool),
+    )
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     Base = declarative_base()
     print("✅ データベース設定完了")
@@ -46,3 +143,70 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# 非同期ドライバ（asyncpg）用のURLに変換
+def to_async_database_url(url: str):
+    for prefix in ("postgresql+psycopg2://", "postgresql+psycopg://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return None
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_database_url(DATABASE_URL)
+
+# 非同期エンジンとセッションの設定（asyncpg が使えない場合は無効）
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DATABASE_URL:
+    try:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            echo=False,
+            connect_args=statement_timeout_connect_args(ASYNC_DATABASE_URL),
+            **pool_options(ASYNC_DATABASE_URL, InstrumentedAsyncQueuePool),
+        )
+        # 非同期セッションでは遅延ロードできないため、コミット後も属性を保持する
+        AsyncSessionLocal = async_sessionmaker(
+            bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+        print("✅ 非同期データベース設定完了")
+    except Exception as e:
+        print(f"⚠️ 非同期データベース設定エラー: {e}")
+
+# 非同期DBセッション取得
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("非同期データベースエンジンが利用できません")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _pool_status(pool, metrics: PoolMetrics) -> dict:
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": DB_MAX_OVERFLOW,
+        })
+    status.update(metrics.snapshot())
+    return status
+
+# コネクションプールの状態（ワーカー数とDB接続数の調整用）
+def get_pool_stats() -> dict:
+    stats = {
+        "config": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+        },
+        "sync": _pool_status(engine.pool, pool_metrics["sync"]),
+    }
+    if async_engine is not None:
+        stats["async"] = _pool_status(async_engine.pool, pool_metrics["async"])
+    return stats
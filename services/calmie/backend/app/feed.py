@@ -0,0 +1,183 @@
+"""
+記事一覧（フィード）の組み立てヘルパー
+
+一覧系エンドポイントでは記事ごとに HistoryRating・ArticleComment・User を
+個別に問い合わせていたため、1ページで 60〜120 回のクエリが発生していた。
+ここでは1ページ分の記事に対する統計情報と投稿者名を IN 句でまとめて取得し、
+記事数に関係なく一定回数のクエリで済ませる。
+コメント数は articles.comment_count（書き込み時に更新）をそのまま使う。
+
+同期セッション用と非同期セッション用（*_async）の両方を用意しているが、
+発行する SQL は共通の select 文を使う。
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Article, HistoryRating, User
+
+
+def _counters_stmt(ids: List[int]):
+    return (
+        select(HistoryRating.article_id, HistoryRating.like_count, HistoryRating.access_count)
+        .where(HistoryRating.article_id.in_(ids))
+        .order_by(HistoryRating.id)
+    )
+
+
+def _build_counters(rows) -> Dict[int, Tuple[int, int]]:
+    counters: Dict[int, Tuple[int, int]] = {}
+    for article_id, like_count, access_count in rows:
+        # 重複レコードがある場合は従来の .first() と同じく最初の1件を採用
+        counters.setdefault(article_id, (like_count or 0, access_count or 0))
+    return counters
+
+
+def _usernames_stmt(ids: List[int]):
+    return select(User.id, User.username).where(User.id.in_(ids))
+
+
+def _missing_history_stmt(rows: List[dict]):
+    # 同時リクエストで作成済みの場合は何もしない
+    return (
+        pg_insert(HistoryRating)
+        .values(rows)
+        .on_conflict_do_nothing(constraint="uq_history_rating_article_id")
+    )
+
+
+def load_counters(db: Session, article_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+    """記事IDごとの (like_count, access_count) を history_rating から1クエリで取得"""
+    ids = list(set(article_ids))
+    if not ids:
+        return {}
+    return _build_counters(db.execute(_counters_stmt(ids)).all())
+
+
+async def load_counters_async(db: AsyncSession, article_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+    """load_counters の非同期版"""
+    ids = list(set(article_ids))
+    if not ids:
+        return {}
+    return _build_counters((await db.execute(_counters_stmt(ids))).all())
+
+
+def load_usernames(db: Session, user_ids: Iterable[int]) -> Dict[int, str]:
+    """ユーザーIDごとのユーザー名を1クエリで取得"""
+    ids = list(set(user_ids))
+    if not ids:
+        return {}
+    return {user_id: username for user_id, username in db.execute(_usernames_stmt(ids)).all()}
+
+
+async def load_usernames_async(db: AsyncSession, user_ids: Iterable[int]) -> Dict[int, str]:
+    """load_usernames の非同期版"""
+    ids = list(set(user_ids))
+    if not ids:
+        return {}
+    rows = (await db.execute(_usernames_stmt(ids))).all()
+    return {user_id: username for user_id, username in rows}
+
+
+class FeedContext:
+    """1ページ分の記事に紐づく統計情報・投稿者名をまとめて保持する"""
+
+    def __init__(
+        self,
+        counters: Dict[int, Tuple[int, int]],
+        comment_counts: Dict[int, int],
+        usernames: Dict[int, str],
+    ):
+        self.counters = counters
+        self.comment_counts = comment_counts
+        self.usernames = usernames
+
+    def has_history(self, article_id: int) -> bool:
+        return article_id in self.counters
+
+    def like_count(self, article_id: int) -> int:
+        return self.counters.get(article_id, (0, 0))[0]
+
+    def access_count(self, article_id: int) -> int:
+        return self.counters.get(article_id, (0, 0))[1]
+
+    def comment_count(self, article_id: int) -> int:
+        return self.comment_counts.get(article_id, 0)
+
+    def username(self, user_id: int, default: Optional[str] = None) -> Optional[str]:
+        return self.usernames.get(user_id, default)
+
+
+def load_feed_context(
+    db: Session,
+    articles: List[Article],
+    with_users: bool = False,
+) -> FeedContext:
+    """
+    記事リストに対する統計情報をまとめて読み込む
+    記事数に関係なく最大2クエリ（history_rating / users）
+    """
+    usernames = (
+        load_usernames(db, [article.create_user_id for article in articles])
+        if with_users
+        else {}
+    )
+    return FeedContext(
+        counters=load_counters(db, [article.id for article in articles]),
+        comment_counts={article.id: article.comment_count or 0 for article in articles},
+        usernames=usernames,
+    )
+
+
+async def load_feed_context_async(
+    db: AsyncSession,
+    articles: List[Article],
+    with_users: bool = False,
+) -> FeedContext:
+    """load_feed_context の非同期版"""
+    usernames = (
+        await load_usernames_async(db, [article.create_user_id for article in articles])
+        if with_users
+        else {}
+    )
+    return FeedContext(
+        counters=await load_counters_async(db, [article.id for article in articles]),
+        comment_counts={article.id: article.comment_count or 0 for article in articles},
+        usernames=usernames,
+    )
+
+
+def _missing_history_rows(feed: FeedContext, article_ids: Iterable[int]) -> List[dict]:
+    return [
+        {"article_id": article_id, "like_count": 0, "access_count": 0, "super_like_count": 0}
+        for article_id in dict.fromkeys(article_ids)
+        if not feed.has_history(article_id)
+    ]
+
+
+def create_missing_history(db: Session, feed: FeedContext, article_ids: Iterable[int]) -> None:
+    """history_rating が存在しない記事の初期レコードを一括作成"""
+    missing = _missing_history_rows(feed, article_ids)
+    if not missing:
+        return
+
+    db.execute(_missing_history_stmt(missing))
+    db.commit()
+    # 作成直後の値は全て0なので、再読込せずにカウンタへ反映する
+    for row in missing:
+        feed.counters.setdefault(row["article_id"], (0, 0))
+
+
+async def create_missing_history_async(db: AsyncSession, feed: FeedContext, article_ids: Iterable[int]) -> None:
+    """create_missing_history の非同期版"""
+    missing = _missing_history_rows(feed, article_ids)
+    if not missing:
+        return
+
+    await db.execute(_missing_history_stmt(missing))
+    await db.commit()
+    for row in missing:
+        feed.counters.setdefault(row["article_id"], (0, 0))
@@ -0,0 +1,130 @@
+"""
+画像処理のプロセスプール
+
+アップロード時の EXIF 回転・LANCZOS リサイズ・JPEG 最適化エンコードは
+1枚あたり数百ミリ秒 CPU を占有する。async ハンドラ内で直接実行すると
+その間イベントループが止まり、同じワーカーの他のリクエストもすべて待たされる。
+ここでは画像処理を ProcessPoolExecutor で別プロセスに逃がし、結果を await で受け取る。
+
+同時に受け付ける処理数には上限を設け（実行中 + 待ち）、空きが出るまで一定時間待っても
+受け付けられない場合は 503 を返してクライアントに再試行してもらう（バックプレッシャー）。
+プールに渡す関数はファイルパスを受け取り、結果もファイルに書き出すトップレベル関数にする
+（pickle 可能にするため。また大きな画像データをプロセス間で受け渡さないため）。
+画像の変換処理そのものは app/media_pipeline.py にある。
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", str(min(2, os.cpu_count() or 1))))
+IMAGE_PROCESS_MAX_PENDING = int(os.getenv("IMAGE_PROCESS_MAX_PENDING", str(IMAGE_PROCESS_WORKERS * 4)))  # 実行中 + 待ちの上限
+IMAGE_PROCESS_QUEUE_TIMEOUT = float(os.getenv("IMAGE_PROCESS_QUEUE_TIMEOUT", "5"))  # 空きを待つ秒数
+IMAGE_PROCESS_RETRY_AFTER = 5  # 503 のときに返す Retry-After（秒）
+
+
+class ImageProcessor:
+    """画像処理をプロセスプールで実行し、同時実行数を制限する"""
+
+    def __init__(self, workers: int, max_pending: int, queue_timeout: float):
+        self._workers = max(1, workers)
+        self._max_pending = max(self._workers, max_pending)
+        self._queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        # メトリクス
+        self._in_flight = 0
+        self._processed = 0
+        self._rejected = 0
+        self._failures = 0
+        self._last_ms = 0.0
+
+    def start(self) -> None:
+        """プールを作成（ワーカープロセスは最初の処理時に起動される）"""
+        with self._lock:
+            if self._executor is None:
+                # API プロセスのスレッドやDB接続を引き継がないよう spawn で起動する
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """ワーカーが異常終了した場合はプールを作り直す"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.start()
+
+    async def run(self, fn: Callable, *args):
+        """
+        fn(*args) をプロセスプールで実行して結果を返す
+        上限まで処理中で queue_timeout 秒待っても空かなければ 503
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self._queue_timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            print(f"⚠️ 画像処理が混雑しています（処理中 {self._in_flight} 件）")
+            raise HTTPException(
+                status_code=503,
+                detail="画像処理が混雑しています。しばらくしてから再度お試しください。",
+                headers={"Retry-After": str(IMAGE_PROCESS_RETRY_AFTER)},
+            )
+
+        self._in_flight += 1
+        started = time.perf_counter()
+        executor = None
+        try:
+            self.start()
+            executor = self._executor
+            return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            self._failures += 1
+            print("❌ 画像処理プロセスが異常終了したため、プールを再作成します")
+            self._restart(executor)
+            raise
+        except Exception:
+            self._failures += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            self._processed += 1
+            self._last_ms = (time.perf_counter() - started) * 1000
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self._workers,
+            "max_pending": self._max_pending,
+            "in_flight": self._in_flight,
+            "processed": self._processed,
+            "rejected": self._rejected,
+            "failures": self._failures,
+            "last_ms": round(self._last_ms, 2),
+        }
+
+
+image_processor = ImageProcessor(
+    workers=IMAGE_PROCESS_WORKERS,
+    max_pending=IMAGE_PROCESS_MAX_PENDING,
+    queue_timeout=IMAGE_PROCESS_QUEUE_TIMEOUT,
+)
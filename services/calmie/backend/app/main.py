@@ -1,32 +1,47 @@
 import os
 import jwt
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Form
-from fastapi.responses import RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Form, Request, Response
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from firebase_admin import auth
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.database import SessionLocal
 from app import models
 from app.models import User
 from app import firebase
 from app.database import engine
-import uuid
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from app.models import Article, HistoryRating, ArticleComment, MediaFile  # Articleモデルをインポート
+from app.models import Article, HistoryRating, ArticleComment, ArticleLike, MediaFile, TranscodeJob  # Articleモデルをインポート
 from app.database import get_db  # データベースセッションを取得する関数をインポート
+from app.database import get_async_db  # 非同期セッション（読み取りの多いエンドポイント用）
+from app.database import get_pool_stats
+from app.feed import load_feed_context, load_counters, load_feed_context_async, create_missing_history_async
+from app.view_counter import view_counter
+from app.search import (
+    SEARCH_DEFAULT_LIMIT, SEARCH_MAX_RESULTS, build_tsquery, clamp_page, search_filter, search_vector
+)
+from app.search_index import search_index
+from app.image_processing import image_processor
+from app.media_pipeline import ogp_filename, negotiate_image, preferred_format, MEDIA_TYPES
+from app.rendition_cache import rendition_cache, ladder, RENDITION_WIDTHS
+from app.media_delivery import file_response, media_access_counter
+from app.response_cache import response_cache, make_etag, not_modified, validator_headers, http_date
+from app.summary import LIST_OPTIONS, make_summary, parse_fields, pick_fields
+from app.transcode_queue import VIDEO_EXTENSIONS, enqueue_transcode, latest_transcode, job_status
+from app.uploads import ALLOWED_EXTENSIONS, receive_upload
+from app.media_store import VARIANT_MEDIA, VARIANT_COVER, VARIANT_RAW, store_upload, release_files, arelease_files, static_filename
+from app.pagination import (
+    PAGE_DEFAULT_LIMIT, clamp_limit, keyset_page, split_page, offset_from_cursor, offset_cursor
+)
+from app.ranking import get_ranking
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy import String, cast, or_
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy import String, cast, or_, select
 from datetime import datetime, timedelta
-import aiofiles
 import json
 import shutil
-from PIL import Image, ImageOps
-from io import BytesIO
 import urllib.parse
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -71,19 +86,10 @@ class CommentRequest(BaseModel):
     user_id: int
     comment: str
 
-# データベースセッション依存関係
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 app = FastAPI()
 UPLOAD_DIRECTORY = "./static"
 MAX_FILE_SIZE_MB = 100  # 100MBまで許可（大きめに）
-MAX_IMAGE_WIDTH = 1280  # 画像の最大幅を制限
-ALLOWED_EXTENSIONS = ["jpg", "jpeg", "png", "mp4", "mov", "avi", "webm"]  # .mov を許可
+MAX_UPLOAD_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
 
 # ベースURL設定（環境に応じて動的に決定）
 def get_base_url():
@@ -119,6 +125,25 @@ def convert_url_for_environment(url: str) -> str:
     
     return url
 
+def image_url(filename: str) -> str:
+    """画像のレンディションのURL（/images/ から Accept に応じて AVIF・WebP・JPEG を配信）"""
+    return f"{get_base_url()}/images/{filename}"
+
+def image_srcset(url: Optional[str]) -> Optional[str]:
+    """/images/ の画像URLの srcset（幅ごとの画像 /images/{filename}/w/{width}、それ以外のURLは None）"""
+    if not url or "/images/" not in url:
+        return None
+    url = convert_url_for_environment(url).split("?", 1)[0]
+    return ", ".join(f"{url}/w/{width} {width}w" for width in ladder(static_filename(url)))
+
+def media_srcset(media: MediaFile) -> Optional[str]:
+    """画像メディアの srcset（幅ごとの画像 /v2/media/{media_id}/w/{width}）"""
+    if not media.thumbnail_url:
+        return None
+    return ", ".join(
+        f"{get_base_url()}/v2/media/{media.id}/w/{width} {width}w" for width in ladder(media.stored_filename)
+    )
+
 # ディレクトリが存在しない場合は作成
 if not os.path.exists(UPLOAD_DIRECTORY):
     os.makedirs(UPLOAD_DIRECTORY)
@@ -126,7 +151,14 @@ if not os.path.exists(UPLOAD_DIRECTORY):
 # staticディレクトリの絶対パスを確認
 print(f"📁 UPLOAD_DIRECTORY: {os.path.abspath(UPLOAD_DIRECTORY)}")
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# static 配下のファイルを配信（ETag・Range・X-Accel-Redirect に対応、app/media_delivery.py）
+@app.api_route("/static/{file_path:path}", methods=["GET", "HEAD"])
+def get_static_file(file_path: str, request: Request):
+    static_root = os.path.realpath(UPLOAD_DIRECTORY)
+    path = os.path.realpath(os.path.join(static_root, file_path))
+    if not path.startswith(static_root + os.sep):
+        raise HTTPException(status_code=404, detail="ファイルが見つかりません")
+    return file_response(request, path)
 
 # CORS設定を追加
 origins = [
@@ -144,6 +176,83 @@ app.add_middleware(
     allow_headers=["*"],  # 全てのHTTPヘッダーを許可
 )
 
+# 閲覧数バッファのフラッシュスレッドを起動・停止
+@app.on_event("startup")
+def start_view_counter():
+    view_counter.start()
+
+@app.on_event("shutdown")
+def stop_view_counter():
+    # 未反映の閲覧数をすべて書き込んでから終了
+    view_counter.stop()
+
+# 画像処理のプロセスプール（ワーカーは最初のアップロード時に起動）
+@app.on_event("startup")
+def start_image_processor():
+    image_processor.start()
+
+@app.on_event("shutdown")
+def stop_image_processor():
+    image_processor.stop()
+
+# メディアのアクセス数バッファ（一定間隔で media_files.access_count にまとめて加算）
+@app.on_event("startup")
+def start_media_access_counter():
+    media_access_counter.start()
+
+@app.on_event("shutdown")
+def stop_media_access_counter():
+    media_access_counter.stop()
+
+# 幅ごとの画像キャッシュ（既存のファイルを読み込む）
+@app.on_event("startup")
+def start_rendition_cache():
+    rendition_cache.start()
+
+# 検索インデックス（SEARCH_INDEX_ENABLED=true のときのみ）の読み込みと保存
+@app.on_event("startup")
+def start_search_index():
+    search_index.start()
+
+@app.on_event("shutdown")
+def stop_search_index():
+    search_index.stop()
+
+# 閲覧数バッファの状態（未反映の件数など）
+@app.get("/metrics/view-counter")
+def get_view_counter_metrics():
+    return view_counter.stats()
+
+# DBコネクションプールの状態（使用中・オーバーフロー・待ち時間）
+@app.get("/metrics/db-pool")
+def get_db_pool_metrics():
+    return get_pool_stats()
+
+# 検索インデックスの状態
+@app.get("/metrics/search-index")
+def get_search_index_metrics():
+    return search_index.stats()
+
+# 画像処理プールの状態（処理中・混雑で断った件数など）
+@app.get("/metrics/image-processing")
+def get_image_processing_metrics():
+    return image_processor.stats()
+
+# メディアのアクセス数バッファの状態
+@app.get("/metrics/media-access")
+def get_media_access_metrics():
+    return media_access_counter.stats()
+
+# 記事一覧のレスポンスキャッシュの状態（ヒット率・無効化の回数など）
+@app.get("/metrics/response-cache")
+def get_response_cache_metrics():
+    return response_cache.stats()
+
+# 幅ごとの画像キャッシュの状態（ヒット率・削除数など）
+@app.get("/metrics/rendition-cache")
+def get_rendition_cache_metrics():
+    return rendition_cache.stats()
+
 # ✅ ユーザー登録
 @app.post("/register")
 def register_user(request: RegisterRequest, db: Session = Depends(get_db)):
@@ -312,146 +421,169 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
+# 一覧の各記事の項目（fields= で絞り込める項目）
+LATEST_FIELDS = (
+    "id", "title", "summary", "thumbnail_url", "thumbnail_srcset", "public_at",
+    "like_count", "access_count", "comment_count", "category",
+)
+ARTICLES_PAGE_FIELDS = LATEST_FIELDS + ("username", "user_id")
+RANKING_FIELDS = (
+    "id", "title", "summary", "thumbnail_url", "public_at",
+    "like_count", "access_count", "comment_count", "category",
+)
+SEARCH_FIELDS = (
+    "id", "title", "summary", "thumbnail_image", "category", "public_at", "created_at",
+    "likes_count", "access_count", "comment_count", "username",
+)
+
+def search_result_item(article: Article, feed) -> dict:
+    """検索結果の1件（/search・/articles/search 共通、本文は含めない）"""
+    return {
+        "id": article.id,
+        "title": article.title,
+        "summary": article.summary,
+        "thumbnail_image": article.thumbnail_image,
+        "category": article.category or [],
+        "public_at": article.public_at.isoformat() if article.public_at else None,
+        "created_at": article.created_at.isoformat() if article.created_at else None,
+        "likes_count": feed.like_count(article.id),
+        "access_count": feed.access_count(article.id),
+        "comment_count": feed.comment_count(article.id),
+        "username": feed.username(article.create_user_id),
+    }
+
 # 記事一覧(最新)を取得
 @app.get("/")
-def read_root(db: Session = Depends(get_db)):
-    # articles テーブルから最新 30 件を取得
-    articles = db.query(Article).order_by(Article.public_at.desc()).limit(30).all()
+async def read_root(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_DEFAULT_LIMIT,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    names = parse_fields(fields, LATEST_FIELDS)
+    # 全員に同じ内容なので、結果をキャッシュする（記事・いいね・コメントの変更で無効化）
+    return await response_cache.aget_or_build(request, lambda: build_latest_articles(cursor, limit, names, db))
+
+async def build_latest_articles(cursor: Optional[str], limit: int, names: Optional[List[str]], db: AsyncSession):
+    # articles テーブルから最新の記事を1ページ分取得（cursor 以降、本文は読み込まない）
+    limit = clamp_limit(limit)
+    rows = (
+        await db.execute(keyset_page(select(Article).options(*LIST_OPTIONS), cursor, limit))
+    ).scalars().all()
+    articles, next_cursor = split_page(rows, limit)
+
+    # いいね数・閲覧数・コメント数をまとめて取得
+    feed = await load_feed_context_async(db, articles)
     
     # 結果リストを構築
     result = []
     for article in articles:
-        # history_rating から like_count と access_count を取得
-        history = (
-            db.query(HistoryRating)
-            .filter(HistoryRating.article_id == article.id)
-            .first()
-        )
-        
-        # article_comments からコメント数を取得
-        comment_count = (
-            db.query(ArticleComment)
-            .filter(ArticleComment.article_id == article.id)
-            .count()
-        )
-        
         result.append({
             "id": article.id,
             "title": article.title,
-            "content": article.content,
+            "summary": article.summary,
             "thumbnail_url": convert_url_for_environment(article.thumbnail_image),
+            "thumbnail_srcset": image_srcset(article.thumbnail_image),
             "public_at": article.public_at,
-            "like_count": history.like_count if history else 0,
-            "access_count": history.access_count if history else 0,
-            "comment_count": comment_count,
+            "like_count": feed.like_count(article.id),
+            "access_count": feed.access_count(article.id),
+            "comment_count": feed.comment_count(article.id),
             "category": article.category,
         })
     
-    return result
+    return {"articles": pick_fields(result, names), "next_cursor": next_cursor}
 
 # 記事一覧(最新)を取得 - /articlesエンドポイント（修正版）
 @app.get("/articles")
-def get_articles(db: Session = Depends(get_db)):
-    # articles テーブルから最新 30 件を取得
-    articles = db.query(Article).order_by(Article.public_at.desc()).limit(30).all()
+async def get_articles(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_DEFAULT_LIMIT,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    names = parse_fields(fields, ARTICLES_PAGE_FIELDS)
+    # 全員に同じ内容なので、結果をキャッシュする（記事・いいね・コメントの変更で無効化）
+    return await response_cache.aget_or_build(request, lambda: build_articles_page(cursor, limit, names, db))
+
+async def build_articles_page(cursor: Optional[str], limit: int, names: Optional[List[str]], db: AsyncSession):
+    # articles テーブルから最新の記事を1ページ分取得（cursor 以降、本文は読み込まない）
+    limit = clamp_limit(limit)
+    rows = (
+        await db.execute(keyset_page(select(Article).options(*LIST_OPTIONS), cursor, limit))
+    ).scalars().all()
+    articles, next_cursor = split_page(rows, limit)
+    
+    # いいね数・閲覧数・コメント数・ユーザー名をまとめて取得
+    feed = await load_feed_context_async(db, articles, with_users=True)
     
     # 結果リストを構築（既存記事の修正対応）
     result = []
     for article in articles:
-        # history_rating から like_count と access_count を取得
-        history = (
-            db.query(HistoryRating)
-            .filter(HistoryRating.article_id == article.id)
-            .first()
-        )
-        
-        # 🔧 history_ratingが存在しない場合は作成
-        if not history:
-            history = HistoryRating(
-                article_id=article.id,
-                like_count=0,
-                access_count=0,
-                super_like_count=0
-            )
-            db.add(history)
-            db.commit()
-            db.refresh(history)
-        
-        # article_comments からコメント数を取得
-        comment_count = (
-            db.query(ArticleComment)
-            .filter(ArticleComment.article_id == article.id)
-            .count()
-        )
-        
-        # ユーザー情報も含める
-        user = db.query(User).filter(User.id == article.create_user_id).first()
-        
         result.append({
             "id": article.id,
             "title": article.title,
-            "content": article.content,
+            "summary": article.summary,
             "thumbnail_url": convert_url_for_environment(article.thumbnail_image),
-            "thumbnail_image": convert_url_for_environment(article.thumbnail_image),  # 両方のフィールド名に対応
+            "thumbnail_srcset": image_srcset(article.thumbnail_image),
             "public_at": article.public_at,
-            "like_count": history.like_count,
-            "likes_count": history.like_count,  # 複数の命名に対応
-            "access_count": history.access_count,
-            "comment_count": comment_count,
+            "like_count": feed.like_count(article.id),
+            "access_count": feed.access_count(article.id),
+            "comment_count": feed.comment_count(article.id),
             "category": article.category,
-            "username": user.username if user else "Unknown",
+            "username": feed.username(article.create_user_id, "Unknown"),
             "user_id": article.create_user_id,
         })
+
+    # 🔧 history_ratingが存在しない記事は初期レコードを一括作成
+    await create_missing_history_async(db, feed, [article.id for article in articles])
     
-    return result
+    return {"articles": pick_fields(result, names), "next_cursor": next_cursor}
 
 # 記事一覧(ランキング)を取得する
+def build_ranking(names: Optional[List[str]], db: Session):
+    articles = (
+        db.query(Article)
+        .options(*LIST_OPTIONS)
+        .join(HistoryRating, Article.id == HistoryRating.article_id, isouter=True)
+        .order_by(HistoryRating.like_count.desc().nullslast())
+        .limit(30)
+        .all()
+    )
+    
+    feed = load_feed_context(db, articles)
+
+    result = []
+    for article in articles:
+        result.append({
+            "id": article.id,
+            "title": article.title,
+            "summary": article.summary,
+            "thumbnail_url": article.thumbnail_image,
+            "public_at": article.public_at,
+            "like_count": feed.like_count(article.id),
+            "access_count": feed.access_count(article.id),
+            "comment_count": feed.comment_count(article.id),
+            "category": article.category,
+        })
+    
+    return pick_fields(result, names)
+
 @app.get("/articles/ranking")
-def get_articles_ranking(db: Session = Depends(get_db)):
+def get_articles_ranking(request: Request, fields: Optional[str] = None, db: Session = Depends(get_db)):
     # いいね数でソートしたランキングを返す
+    names = parse_fields(fields, RANKING_FIELDS)
     try:
-        articles = (
-            db.query(Article)
-            .join(HistoryRating, Article.id == HistoryRating.article_id, isouter=True)
-            .order_by(HistoryRating.like_count.desc().nullslast())
-            .limit(30)
-            .all()
-        )
-        
-        result = []
-        for article in articles:
-            history = (
-                db.query(HistoryRating)
-                .filter(HistoryRating.article_id == article.id)
-                .first()
-            )
-            
-            comment_count = (
-                db.query(ArticleComment)
-                .filter(ArticleComment.article_id == article.id)
-                .count()
-            )
-            
-            result.append({
-                "id": article.id,
-                "title": article.title,
-                "content": article.content,
-                "thumbnail_url": article.thumbnail_image,
-                "public_at": article.public_at,
-                "like_count": history.like_count if history else 0,
-                "access_count": history.access_count if history else 0,
-                "comment_count": comment_count,
-                "category": article.category,
-            })
-        
-        return result
+        # 全員に同じ内容なので、結果をキャッシュする（エラー時のダミーデータはキャッシュしない）
+        return response_cache.get_or_build(request, lambda: build_ranking(names, db))
     except Exception as e:
         # ダミーデータを返す
         return [
             {
                 "id": 1,
                 "title": "🏆 今週最も愛された子猫の動画",
-                "content": "多くの人に愛された癒しの動画をランキング形式でお届け",
+                "summary": "多くの人に愛された癒しの動画をランキング形式でお届け",
                 "thumbnail_url": "https://images.unsplash.com/photo-1514888286974-6c03e2ca1dba?w=400&h=300&fit=crop",
                 "public_at": "2024-01-01T00:00:00",
                 "like_count": 2500,
@@ -462,52 +594,48 @@ def get_articles_ranking(db: Session = Depends(get_db)):
         ]
 
 # 記事一覧(トレンド)を取得する
+def build_trend(names: Optional[List[str]], db: Session):
+    articles = (
+        db.query(Article)
+        .options(*LIST_OPTIONS)
+        .join(HistoryRating, Article.id == HistoryRating.article_id, isouter=True)
+        .order_by(HistoryRating.access_count.desc().nullslast())
+        .limit(30)
+        .all()
+    )
+    
+    feed = load_feed_context(db, articles)
+
+    result = []
+    for article in articles:
+        result.append({
+            "id": article.id,
+            "title": article.title,
+            "summary": article.summary,
+            "thumbnail_url": article.thumbnail_image,
+            "public_at": article.public_at,
+            "like_count": feed.like_count(article.id),
+            "access_count": feed.access_count(article.id),
+            "comment_count": feed.comment_count(article.id),
+            "category": article.category,
+        })
+    
+    return pick_fields(result, names)
+
 @app.get("/articles/trend")
-def get_articles_trend(db: Session = Depends(get_db)):
+def get_articles_trend(request: Request, fields: Optional[str] = None, db: Session = Depends(get_db)):
     # アクセス数でソートしたトレンドを返す
+    names = parse_fields(fields, RANKING_FIELDS)
     try:
-        articles = (
-            db.query(Article)
-            .join(HistoryRating, Article.id == HistoryRating.article_id, isouter=True)
-            .order_by(HistoryRating.access_count.desc().nullslast())
-            .limit(30)
-            .all()
-        )
-        
-        result = []
-        for article in articles:
-            history = (
-                db.query(HistoryRating)
-                .filter(HistoryRating.article_id == article.id)
-                .first()
-            )
-            
-            comment_count = (
-                db.query(ArticleComment)
-                .filter(ArticleComment.article_id == article.id)
-                .count()
-            )
-            
-            result.append({
-                "id": article.id,
-                "title": article.title,
-                "content": article.content,
-                "thumbnail_url": article.thumbnail_image,
-                "public_at": article.public_at,
-                "like_count": history.like_count if history else 0,
-                "access_count": history.access_count if history else 0,
-                "comment_count": comment_count,
-                "category": article.category,
-            })
-        
-        return result
+        # 全員に同じ内容なので、結果をキャッシュする（エラー時のダミーデータはキャッシュしない）
+        return response_cache.get_or_build(request, lambda: build_trend(names, db))
     except Exception as e:
         # ダミーデータを返す
         return [
             {
                 "id": 2,
                 "title": "📈 話題沸騰！赤ちゃんパンダの成長記録",
-                "content": "多くの人が注目している話題の記事をトレンド形式でお届け",
+                "summary": "多くの人が注目している話題の記事をトレンド形式でお届け",
                 "thumbnail_url": "https://images.unsplash.com/photo-1539681944080-d63d2ad9f92b?w=400&h=300&fit=crop",
                 "public_at": "2024-01-01T00:00:00",
                 "like_count": 1800,
@@ -518,51 +646,77 @@ def get_articles_trend(db: Session = Depends(get_db)):
         ]
 
 @app.get("/articles/search")
-def search_articles(category: Optional[str] = None, query: Optional[str] = None, db: Session = Depends(get_db)):
-    base_query = db.query(Article)
-
-    if category:
-        base_query = base_query.filter(Article.category.any(category))
-    elif query:
-        base_query = base_query.filter(
-            or_(
-                Article.title.ilike(f"%{query}%"),
-                Article.content.ilike(f"%{query}%"),
-                Article.category.any(query)
-            )
-        )
+def search_articles(
+    category: Optional[str] = None,
+    query: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    names = parse_fields(fields, SEARCH_FIELDS)
+    # 一覧の項目だけを読み込む（本文は返さない）
+    base_query = db.query(Article).options(*LIST_OPTIONS)
+
+    if query and not category:
+        # 関連度順なので (public_at, id) ではなく上限付きの位置でページングする
+        limit, offset = clamp_page(limit, offset_from_cursor(cursor))
+        tsquery = build_tsquery(query)
+        if not tsquery:
+            return {"articles": [], "next_cursor": None}
+        matches, rank = search_filter(Article.search_vector, tsquery)
+        articles = base_query.filter(matches).order_by(
+            rank.desc(), Article.public_at.desc()
+        ).offset(offset).limit(limit).all()
+        next_cursor = offset_cursor(offset, limit, len(articles), SEARCH_MAX_RESULTS)
+    else:
+        if category:
+            # = ANY(category) は GIN インデックスを使えないため @> で絞り込む
+            base_query = base_query.filter(Article.category.op("@>")(cast([category], ARRAY(String))))
+        limit = clamp_limit(limit, SEARCH_DEFAULT_LIMIT)
+        articles, next_cursor = split_page(keyset_page(base_query, cursor, limit).all(), limit)
 
-    return base_query.order_by(Article.public_at.desc()).all()
+    feed = load_feed_context(db, articles, with_users=True)
+    results = [search_result_item(article, feed) for article in articles]
+    return {"articles": pick_fields(results, names), "next_cursor": next_cursor}
 
 
 # 記事一つ(セレクトしたもの)を取得する、このときに閲覧数を増やす、限定公開の場合はログインが必要
 @app.get("/articles/{id}")
-def get_article(id: int, db: Session = Depends(get_db)):
+async def get_article(id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
     # 記事を取得
-    article = db.query(Article).filter(Article.id == id).first()
+    article = await db.scalar(select(Article).where(Article.id == id))
     if not article:
         raise HTTPException(status_code=404, detail="Article not found")
 
     # 閲覧数・いいね数などの履歴情報取得 or 初期化
-    history = db.query(HistoryRating).filter(HistoryRating.article_id == article.id).first()
+    history_query = select(HistoryRating).where(HistoryRating.article_id == article.id).order_by(HistoryRating.id)
+    history = (await db.execute(history_query)).scalars().first()
     if not history:
-        history = HistoryRating(article_id=article.id, like_count=0, access_count=1)
-        db.add(history)
-    else:
-        history.access_count += 1
-    db.commit()
-    db.refresh(history)
+        # 同時アクセスで作成済みの場合は何もしない
+        await db.execute(
+            pg_insert(HistoryRating)
+            .values(article_id=article.id, like_count=0, access_count=0, super_like_count=0)
+            .on_conflict_do_nothing(constraint="uq_history_rating_article_id")
+        )
+        await db.commit()
+        history = (await db.execute(history_query)).scalars().first()
+
+    # 閲覧数はバッファに貯めてまとめて反映する（閲覧ごとの行ロックを避ける）
+    view_counter.add(article.id)
 
     like_count = history.like_count
-    access_count = history.access_count
+    access_count = (history.access_count or 0) + view_counter.pending(article.id)
 
     # 記事の作成者情報を取得
-    user = db.query(User).filter(User.id == article.create_user_id).first()
+    user = await db.scalar(select(User).where(User.id == article.create_user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     # コメント情報を取得
-    comments = db.query(ArticleComment).filter(ArticleComment.article_id == id).all()
+    comments = (
+        await db.execute(select(ArticleComment).where(ArticleComment.article_id == id))
+    ).scalars().all()
     comment_data = [
         {
             "id": comment.id,
@@ -580,43 +734,66 @@ def get_article(id: int, db: Session = Depends(get_db)):
     if not primary_category_number:
         raise HTTPException(status_code=404, detail="No category found for the article")
 
+    # 関連記事の取得と JSON 変換の前に ETag を確認し、変わっていなければ 304 を返す
+    # ETag はこの記事自身のデータ（記事・作成者の更新日時、いいね数、コメント）だけから作る
+    # 閲覧数は閲覧のたびに増えるので含めない（閲覧数だけが違う場合は同じ内容として扱う）
+    # 関連記事・ユーザーの他の記事は含めない（他の記事の変更ではこの記事の 304 を無効にしない）
+    etag = make_etag(
+        article.id,
+        article.updated_at,
+        like_count,
+        len(comments),
+        user.updated_at,
+        [(comment.id, comment.comment_likes) for comment in comments],
+    )
+    validators = {"Last-Modified": http_date(article.updated_at)}
+    cached = not_modified(request, etag, headers=validators)
+    if cached is not None:
+        return cached
+    response.headers.update({**validator_headers(etag), **validators})
+
     # 同じカテゴリの記事
     recommended_articles = []
-    related_articles = db.query(Article).filter(
-        Article.id != id,
-        cast([primary_category_number], ARRAY(String)).op("@>")(Article.category)
-    ).order_by(Article.public_at.desc()).limit(10).all()
+    related_articles = (await db.execute(
+        select(Article).where(
+            Article.id != id,
+            cast([primary_category_number], ARRAY(String)).op("@>")(Article.category)
+        ).order_by(Article.public_at.desc()).limit(10)
+    )).scalars().all()
+
+    # 他のユーザーの記事
+    user_articles = []
+    other_articles = (await db.execute(
+        select(Article).where(
+            Article.create_user_id == user.id, Article.id != id
+        ).order_by(Article.public_at.desc()).limit(10)
+    )).scalars().all()
+
+    # 関連記事・ユーザー記事の統計情報をまとめて取得
+    feed = await load_feed_context_async(db, list(related_articles) + list(other_articles))
 
     for art in related_articles:
-        related_history = db.query(HistoryRating).filter(HistoryRating.article_id == art.id).first()
-        comment_count = db.query(ArticleComment).filter(ArticleComment.article_id == art.id).count()
         recommended_articles.append({
             "id": art.id,
             "title": art.title,
             "thumbnail_url": art.thumbnail_image,
+            "thumbnail_srcset": image_srcset(art.thumbnail_image),
             "public_at": art.public_at,
-            "like_count": related_history.like_count if related_history else 0,
-            "access_count": related_history.access_count if related_history else 0,
-            "comment_count": comment_count,
+            "like_count": feed.like_count(art.id),
+            "access_count": feed.access_count(art.id),
+            "comment_count": feed.comment_count(art.id),
         })
 
-    # 他のユーザーの記事
-    user_articles = []
-    other_articles = db.query(Article).filter(
-        Article.create_user_id == user.id, Article.id != id
-    ).order_by(Article.public_at.desc()).limit(10).all()
-
     for art in other_articles:
-        user_history = db.query(HistoryRating).filter(HistoryRating.article_id == art.id).first()
-        comment_count = db.query(ArticleComment).filter(ArticleComment.article_id == art.id).count()
         user_articles.append({
             "id": art.id,
             "title": art.title,
             "thumbnail_url": art.thumbnail_image,
+            "thumbnail_srcset": image_srcset(art.thumbnail_image),
             "public_at": art.public_at,
-            "like_count": user_history.like_count if user_history else 0,
-            "access_count": user_history.access_count if user_history else 0,
-            "comment_count": comment_count,
+            "like_count": feed.like_count(art.id),
+            "access_count": feed.access_count(art.id),
+            "comment_count": feed.comment_count(art.id),
         })
 
     return {
@@ -624,6 +801,7 @@ def get_article(id: int, db: Session = Depends(get_db)):
         "title": article.title,
         "content": article.content,
         "thumbnail_url": convert_url_for_environment(article.thumbnail_image),
+        "thumbnail_srcset": image_srcset(article.thumbnail_image),
         "like_count": like_count,
         "access_count": access_count,
         "category": article.category,
@@ -644,132 +822,34 @@ def get_article(id: int, db: Session = Depends(get_db)):
 
 # ファイルアップロード
 @app.post("/upload/media/")
-async def upload_media(file: UploadFile = File(...)):
+async def upload_media(file: UploadFile = File(...), db: Session = Depends(get_db)):
     try:
-        # **ファイルサイズのチェック**
-        file_size = 0
-        async for chunk in file.stream(1024 * 1024):
-            file_size += len(chunk)
-            if file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
-                raise HTTPException(status_code=413, detail="ファイルサイズが大きすぎます。（最大100MB）")
-
         # **拡張子を取得**
         extension = file.filename.split(".")[-1].lower()
         if extension not in ALLOWED_EXTENSIONS:
             raise HTTPException(status_code=400, detail=f"{file.filename} は無効な形式です。許可されているのは {ALLOWED_EXTENSIONS} です。")
 
-        new_filename = f"{uuid.uuid4()}.{extension}"  # UUIDで重複防止
+        # **一時ファイルへストリーミング保存（サイズ上限のチェックも同時に行う）**
+        with await receive_upload(file, UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES) as upload:
+            # **内容のハッシュで保存（同じ内容のファイルがあれば変換せずに再利用）**
+            # 画像は本体（full）とサムネイルを1回のデコードで作成、それ以外はそのまま保存
+            variant = VARIANT_MEDIA if extension in ["jpg", "jpeg", "png"] else VARIANT_RAW
+            new_filename, thumb_filename, created = await store_upload(
+                upload, variant, extension, UPLOAD_DIRECTORY
+            )
         file_path = os.path.join(UPLOAD_DIRECTORY, new_filename)
 
-        # **画像の場合は圧縮・リサイズ（高速化）**
         if extension in ["jpg", "jpeg", "png"]:
-            # ファイルの先頭に戻す
-            await file.seek(0)
-            image_data = await file.read()
-            image = Image.open(BytesIO(image_data))
-            
-            # 画像の向きを自動修正（EXIF情報対応）
-            image = ImageOps.exif_transpose(image)
-            
-            # RGBモードに変換（PNG透明度対応）
-            if image.mode in ('RGBA', 'P'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            width, height = image.size
-
-            # **画像が大きすぎる場合はリサイズ（高速化）**
-            if width > MAX_IMAGE_WIDTH or height > MAX_IMAGE_WIDTH:
-                # より効率的なリサイズ計算
-                if width > height:
-                    new_width = MAX_IMAGE_WIDTH
-                    new_height = int((MAX_IMAGE_WIDTH / width) * height)
-                else:
-                    new_height = MAX_IMAGE_WIDTH
-                    new_width = int((MAX_IMAGE_WIDTH / height) * width)
-                
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            # **最適化された圧縮設定（通信量削減）**
-            buffer = BytesIO()
-            image.save(buffer, 
-                      format="JPEG", 
-                      quality=60,  # 品質を60%に調整（通信量削減）
-                      optimize=True,  # ファイルサイズ最適化
-                      progressive=True)  # プログレッシブJPEG（読み込み高速化）
-            
-            async with aiofiles.open(file_path, "wb") as out_file:
-                await out_file.write(buffer.getvalue())
-            
-            # **サムネイル画像の作成（さらなる通信量削減）**
-            thumbnail_size = (400, 400)  # 400x400のサムネイル
-            thumb_image = image.copy()
-            thumb_image.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-            
-            # サムネイル用ファイル名
-            thumb_filename = f"{uuid.uuid4()}_thumb.jpg"
-            thumb_path = os.path.join(UPLOAD_DIRECTORY, thumb_filename)
-            
-            # サムネイル保存（さらに低品質で圧縮）
-            thumb_buffer = BytesIO()
-            thumb_image.save(thumb_buffer, 
-                           format="JPEG", 
-                           quality=50,  # サムネイルは50%品質
-                           optimize=True)
-            
-            async with aiofiles.open(thumb_path, "wb") as thumb_file:
-                await thumb_file.write(thumb_buffer.getvalue())
-            
             # サムネイルURLも返す
-            thumbnail_url = f"{get_base_url()}/static/{thumb_filename}"
-
-        elif extension in ["mp4", "mov", "avi", "mkv"]:
-            # **動画ファイルの圧縮処理**
-            import ffmpeg
-            
-            # 一時的に元ファイルを保存
-            temp_path = f"{file_path}.temp"
-            async with aiofiles.open(temp_path, "wb") as temp_file:
-                content = await file.read()
-                await temp_file.write(content)
-            
-            try:
-                # FFmpegで動画を圧縮
-                (
-                    ffmpeg
-                    .input(temp_path)
-                    .output(
-                        file_path,
-                        vcodec='libx264',  # H.264コーデック
-                        crf=28,           # 圧縮率（18-28推奨、大きいほど圧縮）
-                        preset='fast',    # エンコード速度
-                        acodec='aac',     # 音声コーデック
-                        audio_bitrate='128k',  # 音声ビットレート
-                        vf='scale=1280:720',   # 720p解像度に制限
-                        movflags='faststart'   # Web最適化
-                    )
-                    .overwrite_output()  # 既存ファイル上書き
-                    .run(quiet=True)     # ログ抑制
-                )
-                
-                # 一時ファイル削除
-                os.remove(temp_path)
-                
-            except Exception as video_error:
-                # 動画圧縮に失敗した場合は元ファイルをそのまま使用
-                print(f"動画圧縮エラー: {video_error}")
-                if os.path.exists(temp_path):
-                    os.rename(temp_path, file_path)
+            thumbnail_url = image_url(thumb_filename)
+            file_url = image_url(new_filename)
         else:
-            # **その他のファイルはそのまま保存**
-            async with aiofiles.open(file_path, "wb") as out_file:
-                content = await file.read()
-                await out_file.write(content)
-
-        file_url = f"{get_base_url()}/static/{new_filename}"
+            file_url = f"{get_base_url()}/static/{new_filename}"
+        if extension in VIDEO_EXTENSIONS:
+            # **動画は元ファイルを保存して変換ジョブを登録（変換は transcode_worker.py）**
+            # 同じ動画がすでにあれば、そのファイルの最新の変換ジョブ（失敗していればその状態）を返す
+            job = enqueue_transcode(db, file_path) if created else latest_transcode(db, file_path)
+            db.commit()
         
         # 画像の場合はサムネイルURLも返す
         if extension in ["jpg", "jpeg", "png"]:
@@ -778,6 +858,14 @@ async def upload_media(file: UploadFile = File(...)):
                 "url": file_url,
                 "thumbnail_url": thumbnail_url  # サムネイル用URL
             }
+        elif extension in VIDEO_EXTENSIONS:
+            # 変換が終わるまでは元の動画が配信される（状況は /media/transcode-jobs/{job_id} で確認）
+            return {
+                "filename": new_filename,
+                "url": file_url,
+                "job_id": job.id if job else None,
+                "status": job.status if job else "done",
+            }
         else:
             return {"filename": new_filename, "url": file_url}
 
@@ -805,58 +893,18 @@ async def post_article(
 
         if thumbnail:
             ext = thumbnail.filename.split(".")[-1].lower()
-            unique_name = f"{uuid.uuid4()}.{ext}"
-            thumb_path = os.path.join(UPLOAD_DIRECTORY, unique_name)
-
-            # **サムネイル画像も最適化処理**
-            if ext in ["jpg", "jpeg", "png"]:
-                await thumbnail.seek(0)
-                thumbnail_data = await thumbnail.read()
-                image = Image.open(BytesIO(thumbnail_data))
-                
-                # 画像の向きを自動修正
-                image = ImageOps.exif_transpose(image)
-                
-                # RGBモードに変換
-                if image.mode in ('RGBA', 'P'):
-                    background = Image.new('RGB', image.size, (255, 255, 255))
-                    background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                    image = background
-                elif image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                width, height = image.size
-                
-                # サムネイルサイズに最適化（800px制限）
-                if width > 800 or height > 800:
-                    if width > height:
-                        new_width = 800
-                        new_height = int((800 / width) * height)
-                    else:
-                        new_height = 800
-                        new_width = int((800 / height) * width)
-                    
-                    image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # 通信量削減のための圧縮
-                buffer = BytesIO()
-                image.save(buffer, 
-                          format="JPEG", 
-                          quality=60,  # 通信量削減のため品質を下げる
-                          optimize=True,
-                          progressive=True)
-                
-                async with aiofiles.open(thumb_path, "wb") as f:
-                    await f.write(buffer.getvalue())
-            else:
-                # 非画像ファイルはそのまま保存
-                thumbnail_content = await thumbnail.read()
-                async with aiofiles.open(thumb_path, "wb") as f:
-                    await f.write(thumbnail_content)
+
+            with await receive_upload(thumbnail, UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES) as upload:
+                # **サムネイル画像はカバー画像と SNS 共有用の OGP 画像を作成（非画像ファイルはそのまま保存）**
+                variant = VARIANT_COVER if ext in ["jpg", "jpeg", "png"] else VARIANT_RAW
+                unique_name, _, _ = await store_upload(upload, variant, ext, UPLOAD_DIRECTORY)
 
             # **ファイル名をURL安全にエンコード（改行対策）**
             safe_filename = urllib.parse.quote(unique_name, safe='.')
-            thumbnail_url = f"{get_base_url()}/static/{safe_filename}"
+            if variant == VARIANT_COVER:
+                thumbnail_url = image_url(safe_filename)
+            else:
+                thumbnail_url = f"{get_base_url()}/static/{safe_filename}"
         else:
             thumbnail_url = None
 
@@ -871,11 +919,14 @@ async def post_article(
             create_user_id=create_user_id,
             created_at=datetime.utcnow(),
             public_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            updated_at=datetime.utcnow(),
+            summary=make_summary(content),
+            search_vector=search_vector(title, content, category_list)
         )
         db.add(new_article)
         db.commit()
         db.refresh(new_article)
+        search_index.index_article(new_article)
 
         # ✅ `history_rating` に初期レコードを追加
         new_history = HistoryRating(
@@ -886,17 +937,16 @@ async def post_article(
         )
         db.add(new_history)
         db.commit()
+        # 記事一覧のキャッシュを無効化
+        await response_cache.ainvalidate()
 
-       # ✅ ファイルのアップロード処理（非同期 + 一意なファイル名）
+       # ✅ ファイルのアップロード処理（内容のハッシュをファイル名にして重複を排除）
         file_urls = []
         for file in files:
             extension = file.filename.split(".")[-1].lower()
-            unique_filename = f"{uuid.uuid4()}.{extension}"  # UUIDでユニーク化
-            file_path = os.path.join(UPLOAD_DIRECTORY, unique_filename)
 
-            async with aiofiles.open(file_path, "wb") as buffer:
-                content = await file.read()
-                await buffer.write(content)
+            with await receive_upload(file, UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES) as upload:
+                unique_filename, _, _ = await store_upload(upload, VARIANT_RAW, extension, UPLOAD_DIRECTORY)
 
             file_urls.append(f"{get_base_url()}/static/{unique_filename}")
 
@@ -906,6 +956,9 @@ async def post_article(
             "file_urls": file_urls,
         }
 
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"記事の投稿に失敗しました: {str(e)}")
@@ -964,105 +1017,93 @@ async def edit_article(
 
     article.title = title
     article.content = content
+    article.summary = make_summary(content)
     article.public_status = public_status
     article.update_user_id = update_user_id
     article.updated_at = datetime.utcnow()
 
     parsed_categories = json.loads(categories)
     article.category = [str(cat_id) for cat_id in parsed_categories]
+    article.search_vector = search_vector(title, content, article.category)
 
     # メディア保存（グローバル定数を使用）
     os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
+    # 差し替えられたファイル（コミット後に参照を解放する）
+    replaced_files = []
+
     # サムネイル処理
     if thumbnail and thumbnail.filename:
-        try:
-            # サムネイル画像の処理
-            extension = thumbnail.filename.split(".")[-1].lower()
-            unique_filename = f"{uuid.uuid4()}.{extension}"
-            file_path = os.path.join(UPLOAD_DIRECTORY, unique_filename)
-            
-            # PIL を使用してサムネイル画像を処理
-            from PIL import Image
-            import io
-            
-            # 画像を読み込み
-            image_data = await thumbnail.read()
-            image = Image.open(io.BytesIO(image_data))
-            
-            # EXIF 情報に基づいて画像を回転
-            from PIL import ImageOps
-            if hasattr(image, '_getexif') and image._getexif() is not None:
-                image = ImageOps.exif_transpose(image)
-            
-            # RGB モードに変換（RGBA や P モードの場合）
-            if image.mode in ('RGBA', 'P'):
-                image = image.convert('RGB')
-            
-            # サムネイル用にリサイズ（最大400x400）
-            image.thumbnail((400, 400), Image.Resampling.LANCZOS)
-            
-            # 品質を下げて保存（60%品質）
-            image.save(file_path, format='JPEG', quality=60, optimize=True)
-            
-            # 環境に応じたURLを生成
-            base_url = get_base_url()
-            thumbnail_url = f"{base_url}/static/{unique_filename}"
-            
+        # サムネイル画像の処理
+        extension = thumbnail.filename.split(".")[-1].lower()
+
+        # 一時ファイルへストリーミング保存（サイズ超過の 413 はそのまま返す）
+        with await receive_upload(thumbnail, UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES) as upload:
+            try:
+                # カバー画像と SNS 共有用の OGP 画像を作成（記事投稿と同じレンディション）
+                # 同じ画像がすでに保存されていれば変換せずに再利用する
+                unique_filename, _, _ = await store_upload(upload, VARIANT_COVER, extension, UPLOAD_DIRECTORY)
+
+                # 環境に応じたURLを生成
+                thumbnail_url = image_url(unique_filename)
+            except HTTPException:
+                # 画像処理の混雑（503）は元画像で代用せずにそのまま返す
+                raise
+            except Exception as e:
+                print(f"サムネイル処理エラー: {e}")
+                # エラーが発生した場合は元のファイルをそのまま保存
+                try:
+                    unique_filename, _, _ = await store_upload(upload, VARIANT_RAW, extension, UPLOAD_DIRECTORY)
+                    thumbnail_url = f"{get_base_url()}/static/{unique_filename}"
+                except Exception as fallback_error:
+                    print(f"サムネイルフォールバック処理エラー: {fallback_error}")
+                    # 完全に失敗した場合はサムネイルを更新しない
+                    thumbnail_url = None
+
+        if thumbnail_url:
+            # 同じ画像でも store_upload で参照を1つ取得しているので、元の画像の参照は必ず解放する
+            replaced_files.append(static_filename(article.thumbnail_image))
             article.thumbnail_url = thumbnail_url
             article.thumbnail_image = thumbnail_url
-            
-        except Exception as e:
-            print(f"サムネイル処理エラー: {e}")
-            # エラーが発生した場合は元のファイルをそのまま保存
-            try:
-                await thumbnail.seek(0)
-                thumbnail_content = await thumbnail.read()
-                with open(file_path, "wb") as buffer:
-                    buffer.write(thumbnail_content)
-                
-                base_url = get_base_url()
-                thumbnail_url = f"{base_url}/static/{unique_filename}"
-                article.thumbnail_url = thumbnail_url
-                article.thumbnail_image = thumbnail_url
-            except Exception as fallback_error:
-                print(f"サムネイルフォールバック処理エラー: {fallback_error}")
-                # 完全に失敗した場合はサムネイルを更新しない
-                pass
 
     if files:
         saved_paths = []
         for file in files:
             if file.filename:  # ファイル名が存在することを確認
                 extension = file.filename.split(".")[-1].lower()
-                unique_filename = f"{uuid.uuid4()}.{extension}"
-                file_path = os.path.join(UPLOAD_DIRECTORY, unique_filename)
 
                 try:
-                    # 非同期でファイル内容を読み込み
-                    file_content = await file.read()
-                    
-                    # ファイルサイズをチェック
-                    if len(file_content) > 0:
-                        # 非同期でファイルを保存
-                        async with aiofiles.open(file_path, "wb") as buffer:
-                            await buffer.write(file_content)
-
-                        # 環境に応じた完全URLを生成（post-articleと同じ形式）
-                        base_url = get_base_url()
-                        saved_paths.append(f"{base_url}/static/{unique_filename}")
-                        print(f"✅ ファイル保存成功: {file_path} ({len(file_content)} bytes)")
-                    else:
-                        print(f"⚠️ 空のファイルをスキップ: {file.filename}")
+                    # 一時ファイルへストリーミング保存
+                    with await receive_upload(file, UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES) as upload:
+                        # ファイルサイズをチェック
+                        if upload.size > 0:
+                            unique_filename, _, _ = await store_upload(
+                                upload, VARIANT_RAW, extension, UPLOAD_DIRECTORY
+                            )
+                            file_path = os.path.join(UPLOAD_DIRECTORY, unique_filename)
+
+                            # 環境に応じた完全URLを生成（post-articleと同じ形式）
+                            base_url = get_base_url()
+                            saved_paths.append(f"{base_url}/static/{unique_filename}")
+                            print(f"✅ ファイル保存成功: {file_path} ({upload.size} bytes)")
+                        else:
+                            print(f"⚠️ 空のファイルをスキップ: {file.filename}")
                         
                 except Exception as file_error:
                     print(f"❌ ファイル保存エラー: {file.filename} - {file_error}")
         
         if saved_paths:  # 保存されたファイルがある場合のみ更新
+            replaced_files.extend(static_filename(url) for url in article.content_image or [])
             article.content_image = saved_paths
 
     db.commit()
     db.refresh(article)
+    search_index.index_article(article)
+    await response_cache.ainvalidate()
+
+    # 差し替えられたファイルの参照を解放（他から参照されていなければ削除）
+    # media_blobs で管理していない移行前のファイルは、他の記事から参照されている可能性があるので残す
+    await arelease_files([name for name in replaced_files if name], UPLOAD_DIRECTORY)
     return {"message": "記事が更新されました", "article_id": article.id}
 
 
@@ -1076,36 +1117,52 @@ def delete_article(article_id: int, db: Session = Depends(get_db)):
         if not article:
             raise HTTPException(status_code=404, detail="記事が見つかりません")
         
-        # 関連するファイルも削除
-        if article.content_image:
-            for image_url in article.content_image:
-                if image_url.startswith("/static/"):
-                    file_path = os.path.join("static", image_url.replace("/static/", ""))
-                    if os.path.exists(file_path):
-                        try:
-                            os.remove(file_path)
-                        except Exception as e:
-                            print(f"ファイル削除エラー: {e}")
-        
-        # サムネイル画像も削除
+        # 関連するファイル（本文の画像とサムネイル）は記事の削除をコミットした後に参照を解放する
+        # 内容のハッシュで保存したファイルは他の記事やメディアと共有されている場合がある
+        legacy_paths = {}
+        for image_url in article.content_image or []:
+            if image_url.startswith("/static/"):
+                legacy_paths[static_filename(image_url)] = os.path.join("static", image_url.replace("/static/", ""))
         if article.thumbnail_image and article.thumbnail_image.startswith(f"{get_base_url()}/static/"):
             thumbnail_filename = article.thumbnail_image.replace(f"{get_base_url()}/static/", "")
-            thumbnail_path = os.path.join("static", thumbnail_filename)
-            if os.path.exists(thumbnail_path):
-                try:
-                    os.remove(thumbnail_path)
-                except Exception as e:
-                    print(f"サムネイル削除エラー: {e}")
+            legacy_paths[static_filename(article.thumbnail_image)] = os.path.join("static", thumbnail_filename)
+        article_files = [
+            name for name in
+            [static_filename(url) for url in article.content_image or []] + [static_filename(article.thumbnail_image)]
+            if name
+        ]
         
         # 関連するhistory_ratingレコードも削除
         db.query(HistoryRating).filter(HistoryRating.article_id == article_id).delete()
         
-        # 関連するコメントも削除
+        # 関連するコメントも削除（comment_count は記事と同じトランザクションで消える）
+        # コメントへのいいねはコメントを参照しているので先に削除する
+        comment_ids = select(ArticleComment.id).where(ArticleComment.article_id == article_id)
+        db.query(models.CommentsLike).filter(
+            models.CommentsLike.comment_id.in_(comment_ids)
+        ).delete(synchronize_session=False)
         db.query(ArticleComment).filter(ArticleComment.article_id == article_id).delete()
+
+        # いいね・集計結果も記事を参照しているので、同じトランザクションで削除する
+        db.query(ArticleLike).filter(ArticleLike.article_id == article_id).delete()
+        db.query(models.DailyRating).filter(models.DailyRating.article_id == article_id).delete()
+        db.query(models.AggregatePoints).filter(models.AggregatePoints.article_id == article_id).delete()
         
         # 記事を削除
         db.delete(article)
         db.commit()
+        search_index.remove_article(article_id)
+        response_cache.invalidate()
+
+        # 参照がなくなったファイルを削除
+        # media_blobs で管理していない移行前のファイルは従来どおり削除する
+        for filename in release_files(article_files, UPLOAD_DIRECTORY):
+            file_path = legacy_paths.get(filename)
+            if file_path and os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except Exception as e:
+                    print(f"ファイル削除エラー: {e}")
         
         return {"message": "記事が削除されました", "article_id": article_id}
         
@@ -1115,28 +1172,54 @@ def delete_article(article_id: int, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"記事の削除に失敗しました: {str(e)}")
 
-# 記事にいいね
+# 記事にいいね（1ユーザー1回まで、何度呼ばれても結果は同じ）
 @app.post("/articles/{id}/like")
-def like_article(id: int, db: Session = Depends(get_db)):
+def like_article(id: int, user_id: int, db: Session = Depends(get_db)):
     # 記事を取得
-    article = db.query(Article).filter(Article.id == id).first()
+    article = db.query(Article.id).filter(Article.id == id).first()
     if not article:
         raise HTTPException(status_code=404, detail="Article not found")
-    
-    # history_rating からいいね数を更新
-    history = (
-        db.query(HistoryRating)
-        .filter(HistoryRating.article_id == id)
-        .first()
-    )
-    if history:
-        history.like_count += 1
+
+    user = db.query(User.id).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # article_likes に登録（既にいいね済みなら何もしない、取り消し済みなら復活）
+    now = datetime.utcnow()
+    inserted = db.execute(
+        pg_insert(ArticleLike)
+        .values(user_id=user_id, article_id=id, created_at=now, updated_at=now)
+        .on_conflict_do_update(
+            constraint="uq_article_likes_user_article",
+            set_={"deleted_at": None, "updated_at": now},
+            where=ArticleLike.deleted_at.isnot(None),
+        )
+        .returning(ArticleLike.id)
+    ).first()
+
+    if inserted:
+        # history_rating のいいね数を1文でアトミックに加算（行がなければ作成）
+        like_count = db.execute(
+            pg_insert(HistoryRating)
+            .values(article_id=id, like_count=1, access_count=0, super_like_count=0)
+            .on_conflict_do_update(
+                constraint="uq_history_rating_article_id",
+                set_={"like_count": func.coalesce(HistoryRating.like_count, 0) + 1},
+            )
+            .returning(HistoryRating.like_count)
+        ).scalar()
     else:
-        new_history = HistoryRating(article_id=id, like_count=1, access_count=0)
-        db.add(new_history)
+        like_count = db.query(HistoryRating.like_count).filter(HistoryRating.article_id == id).scalar() or 0
 
     db.commit()
-    return {"message": "いいねしました", "like_count": history.like_count if history else 1}
+    if inserted:
+        # いいね数が変わったので記事一覧のキャッシュを無効化
+        response_cache.invalidate()
+    return {
+        "message": "いいねしました" if inserted else "既にいいねしています",
+        "like_count": like_count,
+        "liked": True,
+    }
 
 # コメントを投稿
 @app.post("/articles/{article_id}/comments")
@@ -1162,10 +1245,16 @@ def post_comment(article_id: int, request: CommentRequest, db: Session = Depends
         updated_at=datetime.utcnow(),
     )
 
-    # データベースに保存
+    # データベースに保存（コメント数も同じトランザクションで加算）
     db.add(new_comment)
+    db.query(Article).filter(Article.id == article_id).update(
+        {Article.comment_count: Article.comment_count + 1},
+        synchronize_session=False,
+    )
     db.commit()
     db.refresh(new_comment)
+    # コメント数が変わったので記事一覧のキャッシュを無効化
+    response_cache.invalidate()
 
     return {"message": "コメントが投稿されました", "comment": {
         "id": new_comment.id,
@@ -1179,11 +1268,13 @@ async def upload_media(file: UploadFile = File(...)):
     if not os.path.exists(UPLOAD_DIRECTORY):
         os.makedirs(UPLOAD_DIRECTORY)
     try:
-        file_path = os.path.join(UPLOAD_DIRECTORY, file.filename)
-        async with aiofiles.open(file_path, "wb") as out_file:
-            content = await file.read()
-            await out_file.write(content)
-        return {"filename": file.filename, "url": f"/static/{file.filename}"}
+        # ファイル名は内容のハッシュから決める（同じ名前の別ファイルを上書きしない）
+        extension = os.path.basename(file.filename).split(".")[-1].lower()
+        with await receive_upload(file, UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES) as upload:
+            filename, _, _ = await store_upload(upload, VARIANT_RAW, extension, UPLOAD_DIRECTORY)
+        return {"filename": filename, "url": f"/static/{filename}"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="ファイルのアップロードに失敗しました。")
     
@@ -1208,7 +1299,12 @@ def like_comment(comment_id: int, user_id: int, db: Session = Depends(get_db)):
     
 #  マイページ表示（統計情報付き）
 @app.get("/mypage/{user_id}")
-def get_mypage(user_id: int, db: Session = Depends(get_db)):
+def get_mypage(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_DEFAULT_LIMIT,
+    db: Session = Depends(get_db)
+):
     print(f"🔍 マイページリクエスト受信: user_id={user_id}")
     
     user = db.query(User).filter(User.id == user_id).first()
@@ -1218,54 +1314,44 @@ def get_mypage(user_id: int, db: Session = Depends(get_db)):
     
     print(f"✅ ユーザー確認: username={user.username}")
 
-    # ユーザーの記事を取得
-    articles = (
-        db.query(Article)
-        .filter(Article.create_user_id == user_id)
-        .order_by(Article.public_at.desc())
-        .all()
-    )
+    # ユーザーの記事を1ページ分取得（cursor 以降）
+    limit = clamp_limit(limit)
+    rows = keyset_page(
+        db.query(Article).filter(Article.create_user_id == user_id), cursor, limit
+    ).all()
+    articles, next_cursor = split_page(rows, limit)
 
-    # 記事データと統計情報を計算
+    # 記事データを作成
     article_data = []
-    total_likes = 0
-    total_access = 0
-    total_comments = 0
+    feed = load_feed_context(db, articles)
     
     for article in articles:
-        history = (
-            db.query(HistoryRating)
-            .filter(HistoryRating.article_id == article.id)
-            .first()
-        )
-        comment_count = (
-            db.query(ArticleComment)
-            .filter(ArticleComment.article_id == article.id)
-            .count()
-        )
-
-        like_count = history.like_count if history else 0
-        access_count = history.access_count if history else 0
-        
-        # 統計に加算
-        total_likes += like_count
-        total_access += access_count
-        total_comments += comment_count
-
         article_data.append({
             "id": article.id,
             "title": article.title,
             "thumbnail_url": convert_url_for_environment(article.thumbnail_image),
+            "thumbnail_srcset": image_srcset(article.thumbnail_image),
             "public_at": article.public_at,
-            "like_count": like_count,
-            "access_count": access_count,
-            "comment_count": comment_count,
+            "like_count": feed.like_count(article.id),
+            "access_count": feed.access_count(article.id),
+            "comment_count": feed.comment_count(article.id),
             "category": article.category,
         })
 
-    # 統計情報
+    # 統計情報は全記事分を集計クエリで取得（ページングに関係なく全件の合計）
+    total_articles, total_comments = db.query(
+        func.count(Article.id),
+        func.coalesce(func.sum(Article.comment_count), 0),
+    ).filter(Article.create_user_id == user_id).one()
+    total_likes, total_access = db.query(
+        func.coalesce(func.sum(HistoryRating.like_count), 0),
+        func.coalesce(func.sum(HistoryRating.access_count), 0),
+    ).join(
+        Article, Article.id == HistoryRating.article_id
+    ).filter(Article.create_user_id == user_id).one()
+
     stats = {
-        "total_articles": len(articles),
+        "total_articles": total_articles,
         "total_likes": total_likes,
         "total_access": total_access,
         "total_comments": total_comments,
@@ -1285,6 +1371,7 @@ def get_mypage(user_id: int, db: Session = Depends(get_db)):
             "email": user.email,
         },
         "articles": article_data,
+        "next_cursor": next_cursor,
         "stats": stats,
     }
     
@@ -1294,7 +1381,7 @@ def get_mypage(user_id: int, db: Session = Depends(get_db)):
 # 🌐 記事専用HTMLページ（OGP対応）
 @app.get("/articles/{article_id}/html")
 @app.head("/articles/{article_id}/html")
-def get_article_html(article_id: int, db: Session = Depends(get_db)):
+def get_article_html(article_id: int, request: Request, db: Session = Depends(get_db)):
     """記事詳細のHTMLページを生成（OGP対応）"""
     print(f"🔍 記事HTML生成: article_id={article_id}")
     
@@ -1303,6 +1390,10 @@ def get_article_html(article_id: int, db: Session = Depends(get_db)):
     if not article:
         raise HTTPException(status_code=404, detail="Article not found")
     
+    # 閲覧数はバッファ経由で記録（HEADリクエストは数えない）
+    if request.method == "GET":
+        view_counter.add(article.id)
+    
     # 記事の統計情報を取得
     history = (
         db.query(HistoryRating)
@@ -1313,15 +1404,8 @@ def get_article_html(article_id: int, db: Session = Depends(get_db)):
     # 記事作成者の情報を取得
     author = db.query(User).filter(User.id == article.create_user_id).first()
     
-    # OGP用の説明文を生成（最初の150文字）
-    import re
-    description = article.content or ""
-    # Markdown記号とMedia参照を除去
-    description = re.sub(r'!\[Media\]\([^)]*\)', '', description)  # ![Media](URL)を除去
-    description = re.sub(r'[#*`_\[\]()!]', '', description)  # Markdown記号を除去
-    description = re.sub(r'\n+', ' ', description)  # 改行をスペースに変換
-    description = re.sub(r'\s+', ' ', description).strip()  # 複数スペースを1つに
-    description = description[:150] + '...' if len(description) > 150 else description
+    # OGP用の説明文（一覧の要約と同じ、Markdown記号とMedia参照を除いた最初の150文字）
+    description = article.summary if article.summary is not None else make_summary(article.content)
     
     # 空の場合はデフォルト説明文を使用
     if not description.strip():
@@ -1334,6 +1418,13 @@ def get_article_html(article_id: int, db: Session = Depends(get_db)):
     else:
         thumbnail_url = f"{get_base_url()}/static/cat_icon.png"
         print(f"🐱 デフォルト画像使用: {thumbnail_url}")
+
+    # SNS共有用には 1200x630 の OGP 画像があればそれを使う（カバー画像のアップロード時に作成）
+    og_image_url = thumbnail_url
+    if article.thumbnail_image:
+        ogp_name = ogp_filename(os.path.basename(urllib.parse.urlparse(article.thumbnail_image).path))
+        if os.path.exists(os.path.join(UPLOAD_DIRECTORY, ogp_name)):
+            og_image_url = f"{get_base_url()}/static/{ogp_name}"
     
     # HTMLテンプレートを生成
     html_content = f"""<!doctype html>
@@ -1355,8 +1446,8 @@ def get_article_html(article_id: int, db: Session = Depends(get_db)):
     <meta property="og:title" content="{article.title}" />
     <meta property="og:description" content="{description}" />
     <meta property="og:url" content="{get_base_url().replace('/api', '')}/articles/{article.id}" />
-    <meta property="og:image" content="{thumbnail_url}" />
-    <meta property="og:image:secure_url" content="{thumbnail_url}" />
+    <meta property="og:image" content="{og_image_url}" />
+    <meta property="og:image:secure_url" content="{og_image_url}" />
     <meta property="og:image:width" content="1200" />
     <meta property="og:image:height" content="630" />
     <meta property="og:image:alt" content="{article.title}" />
@@ -1371,7 +1462,7 @@ def get_article_html(article_id: int, db: Session = Depends(get_db)):
     <meta name="twitter:creator" content="@calmie_news" />
     <meta name="twitter:title" content="{article.title}" />
     <meta name="twitter:description" content="{description}" />
-    <meta name="twitter:image" content="{thumbnail_url}" />
+    <meta name="twitter:image" content="{og_image_url}" />
     <meta name="twitter:image:alt" content="{article.title}" />
     <meta name="twitter:domain" content="calmie.jp" />
     <meta name="twitter:url" content="{get_base_url()}/articles/{article.id}/html" />
@@ -1435,26 +1526,29 @@ async def edit_user(
     if user_icon and user_icon.filename:
         print(f"🖼 アップロードされたファイル名: {user_icon.filename}")
         extension = user_icon.filename.split(".")[-1].lower()
-        filename = f"{uuid.uuid4()}.{extension}"
-        file_path = os.path.join(UPLOAD_DIRECTORY, filename)
 
-        # 保存先確認
-        print(f"💾 ファイル保存先: {file_path}")
+        with await receive_upload(user_icon, UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES) as upload:
+            filename, _, _ = await store_upload(upload, VARIANT_RAW, extension, UPLOAD_DIRECTORY)
 
-        async with aiofiles.open(file_path, "wb") as out_file:
-            content = await user_icon.read()
-            await out_file.write(content)
+        # 保存先確認
+        print(f"💾 ファイル保存先: {os.path.join(UPLOAD_DIRECTORY, filename)}")
 
-        # URLに設定
+        # URLに設定（元のアイコンの参照はコミット後に解放する）
+        replaced_icon = static_filename(user.user_icon)
         user.user_icon = f"{get_base_url()}/static/{filename}"
         print(f"✅ 保存完了: user_icon = {user.user_icon}")
     else:
+        replaced_icon = None
         print("🕳 ユーザーアイコンは未変更")
 
     user.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(user)
 
+    # 元のアイコンの参照を解放（他から参照されていなければ削除、移行前のファイルは残す）
+    if replaced_icon:
+        await arelease_files([replaced_icon], UPLOAD_DIRECTORY)
+
     print("✅ プロフィール更新完了")
     return {"message": "プロフィール更新完了"}
 
@@ -1479,42 +1573,40 @@ def get_user_likes(user_id: int, db: Session = Depends(get_db)):
 
 #  作成した記事一覧
 @app.get("/mypage/{user_id}/articles")
-def get_user_articles(user_id: int, db: Session = Depends(get_db)):
+def get_user_articles(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_DEFAULT_LIMIT,
+    db: Session = Depends(get_db)
+):
     try:
-        articles = (
-            db.query(Article)
-            .filter(Article.create_user_id == user_id)
-            .order_by(Article.public_at.desc())
-            .all()
-        )
+        limit = clamp_limit(limit)
+        rows = keyset_page(
+            db.query(Article).filter(Article.create_user_id == user_id), cursor, limit
+        ).all()
+        articles, next_cursor = split_page(rows, limit)
         
+        feed = load_feed_context(db, articles)
+
         article_data = []
         for article in articles:
-            history = (
-                db.query(HistoryRating)
-                .filter(HistoryRating.article_id == article.id)
-                .first()
-            )
-            comment_count = (
-                db.query(ArticleComment)
-                .filter(ArticleComment.article_id == article.id)
-                .count()
-            )
-
             article_data.append({
                 "id": article.id,
                 "title": article.title,
                 "thumbnail_url": convert_url_for_environment(article.thumbnail_image),
+                "thumbnail_srcset": image_srcset(article.thumbnail_image),
                 "public_at": article.public_at,
-                "like_count": history.like_count if history else 0,
-                "access_count": history.access_count if history else 0,
-                "comment_count": comment_count,
+                "like_count": feed.like_count(article.id),
+                "access_count": feed.access_count(article.id),
+                "comment_count": feed.comment_count(article.id),
                 "category": article.category,
             })
         
-        return {"articles": article_data}
+        return {"articles": article_data, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
-        return {"message": "記事の取得に失敗しました", "articles": []}
+        return {"message": "記事の取得に失敗しました", "articles": [], "next_cursor": None}
 
 # 申請中の記事一覧
 @app.get("/mypage/{user_id}/applications")
@@ -1610,45 +1702,57 @@ def get_user_info(user_id: int, db: Session = Depends(get_db)):
 
 # 記事の検索
 @app.get("/search")
-def search_articles(query: str, db: Session = Depends(get_db)):
+def search_articles(
+    query: str,
+    cursor: Optional[str] = None,
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    names = parse_fields(fields, SEARCH_FIELDS)
+    # 関連度順なので (public_at, id) ではなく上限付きの位置でページングする
+    limit, offset = clamp_page(limit, offset_from_cursor(cursor))
     try:
-        articles = db.query(Article).join(
-            User, Article.create_user_id == User.id
-        ).filter(
-            Article.deleted_at.is_(None),
-            Article.public_status == models.PublicStatus.public,
-            (Article.content.ilike(f"%{query}%") |
-             Article.title.ilike(f"%{query}%") |
-             Article.category.any(query))
-        ).all()
-
-        results = []
-        for article in articles:
-            history = db.query(HistoryRating).filter(HistoryRating.article_id == article.id).first()
-            comment_count = db.query(ArticleComment).filter(ArticleComment.article_id == article.id).count()
-            user = db.query(User).filter(User.id == article.create_user_id).first()
-            
-            results.append({
-                "id": article.id,
-                "title": article.title,
-                "content": article.content,
-                "thumbnail_image": article.thumbnail_image,
-                "category": article.category or [],
-                "public_at": article.public_at.isoformat() if article.public_at else None,
-                "created_at": article.created_at.isoformat() if article.created_at else None,
-                "likes_count": history.like_count if history else 0,
-                "access_count": history.access_count if history else 0,
-                "comment_count": comment_count,
-                "username": user.username if user else None,
-            })
+        tsquery = build_tsquery(query)
+        articles = []
+        matched = 0  # インデックス上の一致件数（次ページの有無の判定用）
+        if search_index.ready:
+            # プロセス内の転置インデックス（BM25）で記事IDを求め、一覧の項目だけDBから読む
+            ids = search_index.search(query, limit, offset)
+            matched = len(ids)
+            found = {
+                article.id: article
+                for article in db.query(Article).options(*LIST_OPTIONS).filter(
+                    Article.id.in_(ids),
+                    Article.deleted_at.is_(None),
+                    Article.public_status == models.PublicStatus.public
+                ).all()
+            } if ids else {}
+            articles = [found[article_id] for article_id in ids if article_id in found]
+        elif tsquery:
+            # 全文検索インデックス（GIN）で絞り込み、関連度順に返す
+            matches, rank = search_filter(Article.search_vector, tsquery)
+            articles = db.query(Article).options(*LIST_OPTIONS).join(
+                User, Article.create_user_id == User.id
+            ).filter(
+                Article.deleted_at.is_(None),
+                Article.public_status == models.PublicStatus.public,
+                matches
+            ).order_by(
+                rank.desc(), Article.public_at.desc()
+            ).offset(offset).limit(limit).all()
+            matched = len(articles)
+
+        feed = load_feed_context(db, articles, with_users=True)
+        results = [search_result_item(article, feed) for article in articles]
         
         # 検索結果がない場合のダミーデータ
-        if not results and query:
+        if not results and query and offset == 0:
             results = [
                 {
                     "id": 999,
                     "title": f"🔍 「{query}」に関連する癒しの記事",
-                    "content": f"「{query}」についての癒しの情報をお探しですね。",
+                    "summary": f"「{query}」についての癒しの情報をお探しですね。",
                     "thumbnail_image": None,
                     "category": ["検索", "癒し"],
                     "public_at": datetime.utcnow().isoformat(),
@@ -1660,10 +1764,13 @@ def search_articles(query: str, db: Session = Depends(get_db)):
                 }
             ]
         
-        return results
+        return {
+            "articles": pick_fields(results, names),
+            "next_cursor": offset_cursor(offset, limit, matched, SEARCH_MAX_RESULTS),
+        }
     except Exception as e:
         print(f"検索エラー: {e}")
-        return []
+        return {"articles": [], "next_cursor": None}
 
 
 
@@ -1675,45 +1782,8 @@ def search_articles(query: str, db: Session = Depends(get_db)):
 def get_daily_ranking(db: Session = Depends(get_db)):
     """1日ごとのランキング"""
     try:
-        # 過去24時間のランキング
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        
-        # DailyRatingテーブルから日次データを取得
-        daily_ranking = db.query(
-            models.DailyRating.article_id,
-            models.DailyRating.like_count,
-            models.DailyRating.access_count,
-            models.Article.title,
-            models.Article.thumbnail_image,
-            models.Article.category,
-            models.Article.created_at,
-            models.User.username
-        ).join(
-            models.Article, models.DailyRating.article_id == models.Article.id
-        ).join(
-            models.User, models.Article.create_user_id == models.User.id
-        ).filter(
-            models.Article.deleted_at.is_(None),
-            models.Article.public_status == models.PublicStatus.public,
-            models.DailyRating.created_at >= yesterday
-        ).order_by(
-            (models.DailyRating.like_count + models.DailyRating.access_count).desc()
-        ).limit(20).all()
-        
-        ranking_articles = []
-        for rank, item in enumerate(daily_ranking, 1):
-            ranking_articles.append({
-                "id": item.article_id,
-                "title": item.title,
-                "thumbnail_image": item.thumbnail_image,
-                "likes_count": item.like_count,
-                "access_count": item.access_count,
-                "category": item.category or [],
-                "username": item.username,
-                "created_at": item.created_at.isoformat() if item.created_at else None,
-                "rank": rank,
-                "score": item.like_count + item.access_count
-            })
+        # バッチで作成したスナップショット（メモリキャッシュ）から取得
+        ranking_articles = get_ranking(db, "daily")
         
         # データがない場合はダミーデータ
         if not ranking_articles:
@@ -1753,45 +1823,8 @@ def get_daily_ranking(db: Session = Depends(get_db)):
 def get_weekly_ranking(db: Session = Depends(get_db)):
     """1週間のランキング"""
     try:
-        # 過去7日間のランキング
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        
-        # AggregatePointsテーブルから週次データを取得
-        weekly_ranking = db.query(
-            models.AggregatePoints.article_id,
-            models.AggregatePoints.like_weekly,
-            models.AggregatePoints.access_weekly,
-            models.Article.title,
-            models.Article.thumbnail_image,
-            models.Article.category,
-            models.Article.created_at,
-            models.User.username
-        ).join(
-            models.Article, models.AggregatePoints.article_id == models.Article.id
-        ).join(
-            models.User, models.Article.create_user_id == models.User.id
-        ).filter(
-            models.Article.deleted_at.is_(None),
-            models.Article.public_status == models.PublicStatus.public,
-            models.AggregatePoints.updated_at >= week_ago
-        ).order_by(
-            (models.AggregatePoints.like_weekly + models.AggregatePoints.access_weekly).desc()
-        ).limit(20).all()
-        
-        ranking_articles = []
-        for rank, item in enumerate(weekly_ranking, 1):
-            ranking_articles.append({
-                "id": item.article_id,
-                "title": item.title,
-                "thumbnail_image": item.thumbnail_image,
-                "likes_count": item.like_weekly,
-                "access_count": item.access_weekly,
-                "category": item.category or [],
-                "username": item.username,
-                "created_at": item.created_at.isoformat() if item.created_at else None,
-                "rank": rank,
-                "score": item.like_weekly + item.access_weekly
-            })
+        # バッチで作成したスナップショット（メモリキャッシュ）から取得
+        ranking_articles = get_ranking(db, "weekly")
         
         # データがない場合はダミーデータ
         if not ranking_articles:
@@ -1831,45 +1864,8 @@ def get_weekly_ranking(db: Session = Depends(get_db)):
 def get_monthly_ranking(db: Session = Depends(get_db)):
     """1ヶ月のランキング"""
     try:
-        # 過去30日間のランキング
-        month_ago = datetime.utcnow() - timedelta(days=30)
-        
-        # AggregatePointsテーブルから月次データを取得
-        monthly_ranking = db.query(
-            models.AggregatePoints.article_id,
-            models.AggregatePoints.like_monthly,
-            models.AggregatePoints.access_monthly,
-            models.Article.title,
-            models.Article.thumbnail_image,
-            models.Article.category,
-            models.Article.created_at,
-            models.User.username
-        ).join(
-            models.Article, models.AggregatePoints.article_id == models.Article.id
-        ).join(
-            models.User, models.Article.create_user_id == models.User.id
-        ).filter(
-            models.Article.deleted_at.is_(None),
-            models.Article.public_status == models.PublicStatus.public,
-            models.AggregatePoints.updated_at >= month_ago
-        ).order_by(
-            (models.AggregatePoints.like_monthly + models.AggregatePoints.access_monthly).desc()
-        ).limit(20).all()
-        
-        ranking_articles = []
-        for rank, item in enumerate(monthly_ranking, 1):
-            ranking_articles.append({
-                "id": item.article_id,
-                "title": item.title,
-                "thumbnail_image": item.thumbnail_image,
-                "likes_count": item.like_monthly,
-                "access_count": item.access_monthly,
-                "category": item.category or [],
-                "username": item.username,
-                "created_at": item.created_at.isoformat() if item.created_at else None,
-                "rank": rank,
-                "score": item.like_monthly + item.access_monthly
-            })
+        # バッチで作成したスナップショット（メモリキャッシュ）から取得
+        ranking_articles = get_ranking(db, "monthly")
         
         # データがない場合はダミーデータ
         if not ranking_articles:
@@ -1906,102 +1902,105 @@ def get_monthly_ranking(db: Session = Depends(get_db)):
         return {"articles": [], "period": "monthly"}
 
 # 新しいトレンド機能（直近1時間）
+def build_hourly_trend(db: Session):
+    """直近1時間のトレンド（閲覧数といいね数、コメント数が多い順）"""
+    # 直近1時間
+    hour_ago = datetime.utcnow() - timedelta(hours=1)
+    
+    # 直近1時間のアクティビティを集計
+    trend_articles = db.query(
+        models.Article.id,
+        models.Article.title,
+        models.Article.thumbnail_image,
+        models.Article.category,
+        models.Article.created_at,
+        models.User.username,
+        func.count(models.ArticleLike.id).label('recent_likes'),
+        func.count(models.ArticleComment.id).label('recent_comments')
+    ).join(
+        models.User, models.Article.create_user_id == models.User.id
+    ).outerjoin(
+        models.ArticleLike, 
+        (models.ArticleLike.article_id == models.Article.id) & 
+        (models.ArticleLike.created_at >= hour_ago) &
+        (models.ArticleLike.deleted_at.is_(None))
+    ).outerjoin(
+        models.ArticleComment,
+        (models.ArticleComment.article_id == models.Article.id) &
+        (models.ArticleComment.created_at >= hour_ago) &
+        (models.ArticleComment.deleted_at.is_(None))
+    ).filter(
+        models.Article.deleted_at.is_(None),
+        models.Article.public_status == models.PublicStatus.public
+    ).group_by(
+        models.Article.id,
+        models.Article.title,
+        models.Article.thumbnail_image,
+        models.Article.category,
+        models.Article.created_at,
+        models.User.username
+    ).order_by(
+        (func.count(models.ArticleLike.id) + func.count(models.ArticleComment.id)).desc()
+    ).limit(20).all()
+    
+    # 全体のアクセス数をまとめて取得
+    counters = load_counters(db, [item.id for item in trend_articles])
+
+    trending_articles = []
+    for rank, item in enumerate(trend_articles, 1):
+        trending_articles.append({
+            "id": item.id,
+            "title": item.title,
+            "thumbnail_image": item.thumbnail_image,
+            "recent_likes": item.recent_likes,
+            "recent_comments": item.recent_comments,
+            "total_access": counters.get(item.id, (0, 0))[1],
+            "category": item.category or [],
+            "username": item.username,
+            "created_at": item.created_at.isoformat() if item.created_at else None,
+            "rank": rank,
+            "trend_score": item.recent_likes + item.recent_comments
+        })
+    
+    # データがない場合はダミーデータ
+    if not trending_articles:
+        trending_articles = [
+            {
+                "id": 1,
+                "title": "🔥 今話題！子犬の可愛い仕草",
+                "thumbnail_image": "/static/puppy_trend.png",
+                "recent_likes": 25,
+                "recent_comments": 8,
+                "total_access": 450,
+                "category": ["動物", "子犬"],
+                "username": "ペットラバー",
+                "created_at": datetime.utcnow().isoformat(),
+                "rank": 1,
+                "trend_score": 33
+            },
+            {
+                "id": 2,
+                "title": "💕 赤ちゃんの初めての笑顔",
+                "thumbnail_image": "/static/baby_first_smile.png",
+                "recent_likes": 18,
+                "recent_comments": 12,
+                "total_access": 320,
+                "category": ["赤ちゃん", "成長"],
+                "username": "新米パパ",
+                "created_at": datetime.utcnow().isoformat(),
+                "rank": 2,
+                "trend_score": 30
+            }
+        ]
+    
+    return {"articles": trending_articles, "period": "hourly"}
+
 @app.get("/articles/trend/hourly")
-def get_hourly_trend(db: Session = Depends(get_db)):
+def get_hourly_trend(request: Request, db: Session = Depends(get_db)):
     """直近1時間のトレンド（閲覧数といいね数、コメント数が多い順）"""
     try:
-        # 直近1時間
-        hour_ago = datetime.utcnow() - timedelta(hours=1)
-        
-        # 直近1時間のアクティビティを集計
-        trend_articles = db.query(
-            models.Article.id,
-            models.Article.title,
-            models.Article.thumbnail_image,
-            models.Article.category,
-            models.Article.created_at,
-            models.User.username,
-            func.count(models.ArticleLike.id).label('recent_likes'),
-            func.count(models.ArticleComment.id).label('recent_comments')
-        ).join(
-            models.User, models.Article.create_user_id == models.User.id
-        ).outerjoin(
-            models.ArticleLike, 
-            (models.ArticleLike.article_id == models.Article.id) & 
-            (models.ArticleLike.created_at >= hour_ago) &
-            (models.ArticleLike.deleted_at.is_(None))
-        ).outerjoin(
-            models.ArticleComment,
-            (models.ArticleComment.article_id == models.Article.id) &
-            (models.ArticleComment.created_at >= hour_ago) &
-            (models.ArticleComment.deleted_at.is_(None))
-        ).filter(
-            models.Article.deleted_at.is_(None),
-            models.Article.public_status == models.PublicStatus.public
-        ).group_by(
-            models.Article.id,
-            models.Article.title,
-            models.Article.thumbnail_image,
-            models.Article.category,
-            models.Article.created_at,
-            models.User.username
-        ).order_by(
-            (func.count(models.ArticleLike.id) + func.count(models.ArticleComment.id)).desc()
-        ).limit(20).all()
-        
-        trending_articles = []
-        for rank, item in enumerate(trend_articles, 1):
-            # 全体のアクセス数を取得
-            history = db.query(models.HistoryRating).filter(
-                models.HistoryRating.article_id == item.id
-            ).first()
-            
-            trending_articles.append({
-                "id": item.id,
-                "title": item.title,
-                "thumbnail_image": item.thumbnail_image,
-                "recent_likes": item.recent_likes,
-                "recent_comments": item.recent_comments,
-                "total_access": history.access_count if history else 0,
-                "category": item.category or [],
-                "username": item.username,
-                "created_at": item.created_at.isoformat() if item.created_at else None,
-                "rank": rank,
-                "trend_score": item.recent_likes + item.recent_comments
-            })
-        
-        # データがない場合はダミーデータ
-        if not trending_articles:
-            trending_articles = [
-                {
-                    "id": 1,
-                    "title": "🔥 今話題！子犬の可愛い仕草",
-                    "thumbnail_image": "/static/puppy_trend.png",
-                    "recent_likes": 25,
-                    "recent_comments": 8,
-                    "total_access": 450,
-                    "category": ["動物", "子犬"],
-                    "username": "ペットラバー",
-                    "created_at": datetime.utcnow().isoformat(),
-                    "rank": 1,
-                    "trend_score": 33
-                },
-                {
-                    "id": 2,
-                    "title": "💕 赤ちゃんの初めての笑顔",
-                    "thumbnail_image": "/static/baby_first_smile.png",
-                    "recent_likes": 18,
-                    "recent_comments": 12,
-                    "total_access": 320,
-                    "category": ["赤ちゃん", "成長"],
-                    "username": "新米パパ",
-                    "created_at": datetime.utcnow().isoformat(),
-                    "rank": 2,
-                    "trend_score": 30
-                }
-            ]
-        
-        return {"articles": trending_articles, "period": "hourly"}
+        # 全員に同じ内容なので、結果をキャッシュする（エラー時の空の結果はキャッシュしない）
+        return response_cache.get_or_build(request, lambda: build_hourly_trend(db))
     except Exception as e:
         print(f"時間別トレンド取得エラー: {e}")
         return {"articles": [], "period": "hourly"}
@@ -2011,11 +2010,12 @@ def get_hourly_trend(db: Session = Depends(get_db)):
 # 既存のstaticファイル配信と併用し、段階的に移行可能
 
 # 🔗 クリーンURL提供エンドポイント
-@app.get("/media/file/{file_id}")
-async def get_clean_media_url(file_id: str, db: Session = Depends(get_db)):
+@app.api_route("/media/file/{file_id}", methods=["GET", "HEAD"])
+def get_clean_media_url(file_id: str, request: Request, db: Session = Depends(get_db)):
     """
     ユーザーフレンドリーなURLでメディアファイルにアクセス
-    例: /media/file/cat_icon → /static/cat_icon.png へリダイレクト
+    例: /media/file/cat_icon → /static/cat_icon.png の内容を返す
+    リダイレクトせずにファイルを直接返す（画像は Accept に応じて AVIF・WebP も返す）
     """
     # 既存ファイルへの静的マッピング
     file_mapping = {
@@ -2027,20 +2027,25 @@ async def get_clean_media_url(file_id: str, db: Session = Depends(get_db)):
     }
     
     if file_id in file_mapping:
-        static_url = f"{get_base_url()}/static/{file_mapping[file_id]}"
-        return RedirectResponse(url=static_url, status_code=302)
+        return file_response(request, os.path.join(UPLOAD_DIRECTORY, file_mapping[file_id]))
     
-    # データベースから検索
-    media = db.query(MediaFile).filter(
-        MediaFile.id == file_id,
-        MediaFile.deleted_at.is_(None)
-    ).first()
+    # データベースから検索（id は数値のみ）
+    media = None
+    if file_id.isdigit():
+        media = db.query(MediaFile.id, MediaFile.stored_filename).filter(
+            MediaFile.id == int(file_id),
+            MediaFile.deleted_at.is_(None)
+        ).first()
     
     if media:
-        # アクセス数増加
-        media.access_count += 1
-        db.commit()
-        return RedirectResponse(url=media.file_url, status_code=302)
+        # アクセス数はバッファに貯めてまとめて加算（リクエストごとに COMMIT しない）
+        media_access_counter.add(media.id)
+        path, media_type = negotiate_image(
+            os.path.join(UPLOAD_DIRECTORY, os.path.basename(media.stored_filename)),
+            request.headers.get("accept"),
+        )
+        vary = "Accept" if media_type.startswith("image/") else None
+        return file_response(request, path, media_type=media_type, vary=vary)
     
     raise HTTPException(status_code=404, detail="ファイルが見つかりません")
 
@@ -2059,73 +2064,28 @@ async def upload_media_v2(
     既存の/upload-media/と併用可能
     """
     try:
-        # ファイルサイズ・種類チェック（既存ロジック再利用）
-        file_size = 0
-        async for chunk in file.stream(1024 * 1024):
-            file_size += len(chunk)
-            if file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
-                raise HTTPException(status_code=413, detail="ファイルサイズが大きすぎます。")
-
         extension = file.filename.split(".")[-1].lower()
         if extension not in ALLOWED_EXTENSIONS:
             raise HTTPException(status_code=400, detail=f"無効なファイル形式です。")
 
-        # UUIDベースのファイル名生成
-        stored_filename = f"{uuid.uuid4()}.{extension}"
-        file_path = os.path.join(UPLOAD_DIRECTORY, stored_filename)
-
-        # 既存の画像最適化ロジックを再利用
+        # 一時ファイルへストリーミング保存（サイズチェックも同時に行う）
+        # ファイル名は内容のハッシュから決め、同じ内容のファイルがあれば変換せずに再利用する
         thumbnail_url = None
-        if extension in ["jpg", "jpeg", "png"]:
-            await file.seek(0)
-            image_data = await file.read()
-            image = Image.open(BytesIO(image_data))
-            
-            # 画像最適化処理（既存ロジック）
-            image = ImageOps.exif_transpose(image)
-            if image.mode in ('RGBA', 'P'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            width, height = image.size
-            if width > MAX_IMAGE_WIDTH or height > MAX_IMAGE_WIDTH:
-                if width > height:
-                    new_width = MAX_IMAGE_WIDTH
-                    new_height = int((MAX_IMAGE_WIDTH / width) * height)
-                else:
-                    new_height = MAX_IMAGE_WIDTH
-                    new_width = int((MAX_IMAGE_WIDTH / height) * width)
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            # 最適化保存
-            buffer = BytesIO()
-            image.save(buffer, format="JPEG", quality=60, optimize=True, progressive=True)
-            
-            async with aiofiles.open(file_path, "wb") as out_file:
-                await out_file.write(buffer.getvalue())
-            
-            # サムネイル作成
-            thumb_filename = f"{uuid.uuid4()}_thumb.jpg"
-            thumb_path = os.path.join(UPLOAD_DIRECTORY, thumb_filename)
-            thumb_image = image.copy()
-            thumb_image.thumbnail((400, 400), Image.Resampling.LANCZOS)
-            
-            thumb_buffer = BytesIO()
-            thumb_image.save(thumb_buffer, format="JPEG", quality=50, optimize=True)
-            async with aiofiles.open(thumb_path, "wb") as thumb_file:
-                await thumb_file.write(thumb_buffer.getvalue())
-            
-            thumbnail_url = f"{get_base_url()}/static/{thumb_filename}"
+        with await receive_upload(file, UPLOAD_DIRECTORY, MAX_UPLOAD_BYTES) as upload:
+            file_size = upload.size
+            content_hash = upload.sha256
+            # 画像は本体（full）とサムネイルを作成（/upload/media/ と同じレンディション）
+            # 非画像ファイルはそのまま保存（動画はレコード作成後に変換ジョブを登録）
+            variant = VARIANT_MEDIA if extension in ["jpg", "jpeg", "png"] else VARIANT_RAW
+            stored_filename, thumb_filename, created = await store_upload(
+                upload, variant, extension, UPLOAD_DIRECTORY
+            )
+        file_path = os.path.join(UPLOAD_DIRECTORY, stored_filename)
+        if variant == VARIANT_MEDIA:
+            thumbnail_url = image_url(thumb_filename)
+            file_url = image_url(stored_filename)
         else:
-            # 非画像ファイル
-            async with aiofiles.open(file_path, "wb") as out_file:
-                content = await file.read()
-                await out_file.write(content)
-
-        file_url = f"{get_base_url()}/static/{stored_filename}"
+            file_url = f"{get_base_url()}/static/{stored_filename}"
 
         # 🆕 データベースに記録
         media_record = MediaFile(
@@ -2136,6 +2096,7 @@ async def upload_media_v2(
             thumbnail_url=thumbnail_url,
             file_type=file.content_type,
             file_size=file_size,
+            content_hash=content_hash,
             alt_text=alt_text or file.filename,
             caption=caption,
             uploaded_by=user_id,
@@ -2145,11 +2106,27 @@ async def upload_media_v2(
         )
         
         db.add(media_record)
+        db.flush()
+
+        job = None
+        if extension in VIDEO_EXTENSIONS:
+            if created:
+                job = enqueue_transcode(db, file_path, media_record)
+            else:
+                # 同じ動画を変換中なら、その完了時にこのメディアも ready になる
+                # 変換に失敗した動画なら、このメディアも failed（元ファイルのまま配信）
+                job = latest_transcode(db, file_path)
+                if job is not None and job.status in ("queued", "processing"):
+                    media_record.status = "processing"
+                elif job is not None and job.status == "failed":
+                    media_record.status = "failed"
         db.commit()
         db.refresh(media_record)
 
         return {
             "media_id": media_record.id,
+            "status": media_record.status,  # 動画は変換が終わるまで processing
+            "job_id": job.id if job else None,
             "filename": stored_filename,
             "url": file_url,
             "thumbnail_url": thumbnail_url,
@@ -2177,25 +2154,82 @@ def get_media_info(media_id: int, db: Session = Depends(get_db)):
     if not media:
         raise HTTPException(status_code=404, detail="メディアが見つかりません")
     
-    # アクセス数を増加
-    media.access_count += 1
-    db.commit()
+    # アクセス数はバッファに貯めてまとめて加算（リクエストごとに COMMIT しない）
+    media_access_counter.add(media.id)
     
     return {
         "id": media.id,
         "original_filename": media.original_filename,
         "url": media.file_url,
         "thumbnail_url": media.thumbnail_url,
+        "srcset": media_srcset(media),
         "file_type": media.file_type,
         "file_size": media.file_size,
         "alt_text": media.alt_text,
         "caption": media.caption,
         "is_public": media.is_public,
-        "access_count": media.access_count,
+        "access_count": (media.access_count or 0) + media_access_counter.pending(media.id),
+        "status": media.status,
         "created_at": media.created_at
     }
 
 
+async def width_image_response(filename: str, width: int, request: Request):
+    """元画像を幅 width にした画像を返す（初回は作成して rendition_cache に保存）"""
+    if width not in RENDITION_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"幅は {RENDITION_WIDTHS} のいずれかを指定してください")
+    source_path = os.path.join(UPLOAD_DIRECTORY, os.path.basename(filename))
+    if source_path.split(".")[-1].lower() not in ["jpg", "jpeg", "png"] or not os.path.isfile(source_path):
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+
+    fmt = preferred_format(request.headers.get("accept"))
+    path = await rendition_cache.get(source_path, width, fmt)
+    return file_response(request, path, media_type=MEDIA_TYPES[fmt], vary="Accept")
+
+
+@app.api_route("/v2/media/{media_id}/w/{width}", methods=["GET", "HEAD"])
+async def get_media_width(media_id: int, width: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """画像メディアを幅 width にして返す（srcset 用、幅は RENDITION_WIDTHS のいずれか）"""
+    media = await db.scalar(
+        select(MediaFile).where(
+            MediaFile.id == media_id,
+            MediaFile.deleted_at.is_(None)
+        )
+    )
+    if not media:
+        raise HTTPException(status_code=404, detail="メディアが見つかりません")
+    return await width_image_response(media.stored_filename, width, request)
+
+
+@app.api_route("/images/{filename}/w/{width}", methods=["GET", "HEAD"])
+async def get_image_width(filename: str, width: int, request: Request):
+    """画像を幅 width にして返す（記事のサムネイルなどの srcset 用）"""
+    return await width_image_response(filename, width, request)
+
+
+@app.api_route("/images/{filename}", methods=["GET", "HEAD"])
+def get_image(filename: str, request: Request):
+    """
+    画像のレンディションを配信（Accept に応じて AVIF・WebP・JPEG のどれかを返す）
+    同じURLでも形式が変わるので Vary: Accept を付けてキャッシュを形式ごとに分けさせる
+    """
+    file_path = os.path.join(UPLOAD_DIRECTORY, os.path.basename(filename))
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+
+    path, media_type = negotiate_image(file_path, request.headers.get("accept"))
+    return file_response(request, path, media_type=media_type, vary="Accept")
+
+
+@app.get("/media/transcode-jobs/{job_id}")
+def get_transcode_job(job_id: int, db: Session = Depends(get_db)):
+    """動画変換ジョブの状況（queued / processing / done / failed）"""
+    job = db.query(TranscodeJob).filter(TranscodeJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job_status(job)
+
+
 @app.get("/v2/media/user/{user_id}")
 def get_user_media(user_id: int, limit: int = 50, db: Session = Depends(get_db)):
     """ユーザーのメディア一覧取得"""
@@ -2211,6 +2245,7 @@ def get_user_media(user_id: int, limit: int = 50, db: Session = Depends(get_db))
                 "original_filename": media.original_filename,
                 "url": media.file_url,
                 "thumbnail_url": media.thumbnail_url,
+                "srcset": media_srcset(media),
                 "file_type": media.file_type,
                 "alt_text": media.alt_text,
                 "caption": media.caption,
@@ -2267,6 +2302,9 @@ def delete_media(media_id: int, user_id: int, db: Session = Depends(get_db)):
     # 論理削除
     media.deleted_at = datetime.utcnow()
     db.commit()
+
+    # アップロード時に取得したファイルの参照を解放（同じ内容の他のメディアがなければファイルを削除）
+    release_files([media.stored_filename], UPLOAD_DIRECTORY)
     
     return {"message": "メディアを削除しました", "media_id": media_id}
 
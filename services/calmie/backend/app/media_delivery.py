@@ -0,0 +1,145 @@
+"""
+メディアファイルの配信（ETag・Range・X-Accel-Redirect・アクセス数のまとめ書き）
+
+画像の表示のたびに API ワーカーが DB を検索して access_count を +1 して COMMIT し、
+302 でリダイレクトしてから StaticFiles が Python でファイルを送っていた。
+ここではファイルを直接返すレスポンスを共通化する。
+
+- ETag: 内容のハッシュをファイル名にしたファイルは「ファイル名 + サイズ」（内容が変わらないため）、
+  それ以外は「更新日時 + サイズ」。If-None-Match が一致すれば 304 を返す
+- Cache-Control: 内容のハッシュをファイル名にした画像は immutable で長期間キャッシュさせる
+  （動画は変換後に同じファイル名で置き換わるので対象外）
+- Range: 動画のシーク用に FileResponse が 206 を返す（If-Range は上の ETag で判定される）
+- X-Accel-Redirect: MEDIA_ACCEL_REDIRECT=true のときはヘッダーだけ返して、
+  ファイルの送信は nginx に任せる（nginx-config.conf の /_accel/ を参照）
+
+メディアのアクセス数は CounterBuffer（view_counter と同じ仕組み）に貯めて、
+一定間隔でまとめて UPDATE する。
+"""
+import os
+import re
+import urllib.parse
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from sqlalchemy import bindparam, func
+
+from app.database import SessionLocal
+from app.models import MediaFile
+from app.transcode_queue import VIDEO_EXTENSIONS
+from app.view_counter import CounterBuffer
+
+MEDIA_CACHE_MAX_AGE = int(os.getenv("MEDIA_CACHE_MAX_AGE", "31536000"))  # 内容のハッシュ名のファイル（1年）
+MEDIA_DEFAULT_MAX_AGE = int(os.getenv("MEDIA_DEFAULT_MAX_AGE", "86400"))  # それ以外のファイル（1日）
+MEDIA_ACCEL_REDIRECT = os.getenv("MEDIA_ACCEL_REDIRECT", "false").lower() == "true"
+MEDIA_ACCEL_PREFIX = os.getenv("MEDIA_ACCEL_PREFIX", "/_accel")
+MEDIA_ROOT = os.path.abspath(os.getenv("MEDIA_ROOT", "."))  # X-Accel-Redirect のパスの基準（static の親ディレクトリ）
+MEDIA_ACCESS_FLUSH_INTERVAL = float(os.getenv("MEDIA_ACCESS_FLUSH_INTERVAL", "10"))  # 秒
+MEDIA_ACCESS_MAX_PENDING = int(os.getenv("MEDIA_ACCESS_MAX_PENDING", "1000"))
+
+CONTENT_HASH_NAME = re.compile(r"^[0-9a-f]{64}")
+
+
+def is_immutable(filename: str) -> bool:
+    """内容が変わらないファイル（内容のハッシュをファイル名にした動画以外のファイル）"""
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return bool(CONTENT_HASH_NAME.match(filename)) and extension not in VIDEO_EXTENSIONS
+
+
+def cache_control(filename: str) -> str:
+    if is_immutable(filename):
+        return f"public, max-age={MEDIA_CACHE_MAX_AGE}, immutable"
+    return f"public, max-age={MEDIA_DEFAULT_MAX_AGE}"
+
+
+def strong_etag(path: str, stat_result: os.stat_result) -> str:
+    filename = os.path.basename(path)
+    if is_immutable(filename):
+        # 幅ごとの画像は LRU のために更新日時を書き換えるので、更新日時は使わない
+        return f'"{filename}-{stat_result.st_size:x}"'
+    return f'"{int(stat_result.st_mtime):x}-{stat_result.st_size:x}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match に ETag が含まれているか（弱い比較）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def accel_redirect_path(path: str) -> Optional[str]:
+    """nginx の内部ロケーションのパス（MEDIA_ROOT の外のファイルは None）"""
+    relative = os.path.relpath(os.path.abspath(path), MEDIA_ROOT)
+    if relative.startswith(".."):
+        return None
+    return f"{MEDIA_ACCEL_PREFIX}/{urllib.parse.quote(relative.replace(os.sep, '/'))}"
+
+
+def file_response(
+    request: Request,
+    path: str,
+    media_type: Optional[str] = None,
+    vary: Optional[str] = None,
+) -> Response:
+    """ファイルを返す（304・Range・X-Accel-Redirect に対応）"""
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="ファイルが見つかりません")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="ファイルが見つかりません")
+
+    headers = {
+        "ETag": strong_etag(path, stat_result),
+        "Cache-Control": cache_control(os.path.basename(path)),
+    }
+    if vary:
+        headers["Vary"] = vary
+
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if MEDIA_ACCEL_REDIRECT:
+        accel_path = accel_redirect_path(path)
+        if accel_path:
+            # 本文は nginx が送る（Range もnginx が処理する）
+            headers["X-Accel-Redirect"] = accel_path
+            return Response(status_code=200, headers=headers, media_type=media_type)
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+
+def flush_media_access(increments: Dict[int, int]) -> None:
+    """media_files.access_count にアクセス数を一括加算"""
+    table = MediaFile.__table__
+    stmt = (
+        table.update()
+        .where(table.c.id == bindparam("b_media_id"))
+        .values(access_count=func.coalesce(table.c.access_count, 0) + bindparam("b_amount"))
+    )
+    params = [
+        {"b_media_id": media_id, "b_amount": amount}
+        for media_id, amount in sorted(increments.items())  # ロック順を固定してデッドロックを避ける
+    ]
+
+    db = SessionLocal()
+    try:
+        db.execute(stmt, params)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+media_access_counter = CounterBuffer(
+    name="media-access-counter",
+    flush_fn=flush_media_access,
+    interval_seconds=MEDIA_ACCESS_FLUSH_INTERVAL,
+    max_pending=MEDIA_ACCESS_MAX_PENDING,
+)
@@ -0,0 +1,246 @@
+"""
+画像のレンディション作成（アップロード画像の共通処理）
+
+EXIF 回転・透過部分の塗りつぶし・リサイズ・JPEG 圧縮は、これまで
+upload_media / upload_media_v2 / post_article / edit_article にパラメータ違いで
+コピーされており、それぞれ画像をデコードし直して1枚ずつ直列にエンコードしていた。
+
+ここでは出力サイズと品質をレンディション（RENDITIONS）として宣言しておき、
+元画像を1回だけデコードして、指定されたレンディションをまとめて作成する。
+大きな JPEG は draft() で DCT スケーリングしながらデコードし（必要な大きさの 1/2〜1/8 まで）、
+縮小には reducing_gap を指定して reduce() による高速な間引きを先に行う。
+
+処理は image_processing のプロセスプールで実行する（process_image を await する）。
+
+各レンディションは JPEG に加えて WebP・AVIF（Pillow が対応している場合）でも保存する。
+同じ画像でも WebP は JPEG の 7 割前後、AVIF は半分前後のサイズになるため、
+配信時は Accept ヘッダーを見て対応している形式のファイルを返す（negotiate_image）。
+別形式のファイルは JPEG と同じファイル名で拡張子だけ変えて保存する（例: xxx_thumbnail.webp）。
+"""
+import mimetypes
+import os
+import tempfile
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+from app.image_processing import image_processor
+
+# 縮小時にまず reduce() で整数分の1まで間引く目安（大きいほど高画質・低速）
+REDUCING_GAP = 3.0
+
+# 保存する画像ファイルのパーミッション
+FILE_MODE = 0o644
+
+# JPEG 以外に作成する形式と形式ごとの保存オプション（Accept で選ぶときの優先順）
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpg": "image/jpeg"}
+FORMAT_OPTIONS = {
+    "avif": {"format": "AVIF", "speed": 8},  # speed: 0（高圧縮・低速）〜 10（高速）
+    "webp": {"format": "WEBP", "method": 4},  # method: 0（高速）〜 6（高圧縮・低速）
+}
+# JPEG の quality からの差（AVIF は同じ数値だと JPEG より高画質・大きめになるため下げる）
+QUALITY_OFFSET = {"avif": -15, "webp": 0}
+
+
+def _supported(fmt: str) -> bool:
+    try:
+        return bool(features.check(fmt))
+    except Exception:
+        return False
+
+
+# 作成する形式（IMAGE_ALTERNATE_FORMATS で変更可、コーデックがない形式は除外）
+ALTERNATE_FORMATS: List[str] = [
+    fmt.strip()
+    for fmt in os.getenv("IMAGE_ALTERNATE_FORMATS", "avif,webp").split(",")
+    if fmt.strip() in FORMAT_OPTIONS and _supported(fmt.strip())
+]
+
+
+class Rendition(NamedTuple):
+    width: int
+    height: int
+    quality: int
+    progressive: bool = True
+    crop: bool = False  # True: width x height ちょうどに中央で切り抜く / False: 枠内に収める
+    alternates: bool = True  # WebP・AVIF も作成する
+
+
+RENDITIONS: Dict[str, Rendition] = {
+    # 記事本文・メディア管理の画像（長辺1280px）
+    "full": Rendition(1280, 1280, quality=60),
+    # 一覧・メディア一覧のサムネイル
+    "thumbnail": Rendition(400, 400, quality=50, progressive=False),
+    # 記事のカバー画像（記事一覧・記事ページ）
+    "cover": Rendition(800, 800, quality=60),
+    # SNS共有用（og:image は 1200x630 を宣言している、クローラーが確実に読める JPEG のみ）
+    "ogp": Rendition(1200, 630, quality=70, crop=True, alternates=False),
+}
+
+# srcset の幅ごとの画像（幅はリクエストごとに決まる、rendition_cache.RENDITION_WIDTHS）の画質
+WIDTH_RENDITION = Rendition(0, 0, quality=60)
+
+
+# ---- プロセスプール内で実行する処理 ----
+
+def _decode(source_path: str, max_side: int) -> Image.Image:
+    """元画像を1回だけデコードして、向きを補正した RGB 画像にする"""
+    with Image.open(source_path) as image:
+        if image.format == "JPEG":
+            # 必要な大きさ以上を保ったまま 1/2〜1/8 に縮小してデコード
+            image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        return _to_rgb(image)
+
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    """RGBモードに変換（透明部分は白で塗りつぶす）"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def _resize(image: Image.Image, rendition: Rendition) -> Image.Image:
+    if rendition.crop:
+        # 短い方を合わせて拡大・縮小し、はみ出した部分を中央で切り抜く
+        scale = max(rendition.width / image.width, rendition.height / image.height)
+        crop_width, crop_height = rendition.width / scale, rendition.height / scale
+        left = (image.width - crop_width) / 2
+        top = (image.height - crop_height) / 2
+        return image.resize(
+            (rendition.width, rendition.height),
+            Image.Resampling.LANCZOS,
+            box=(left, top, left + crop_width, top + crop_height),
+            reducing_gap=REDUCING_GAP,
+        )
+    resized = image.copy()
+    resized.thumbnail((rendition.width, rendition.height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+    return resized
+
+
+def _save(image: Image.Image, path: str, options: dict) -> None:
+    """
+    一時ファイルに書き出してから置き換える（書き込み途中のファイルを配信しない）
+    一時ファイルは書き込みごとに別の名前にする（同じ内容を同時に処理しても互いの一時ファイルを消さない）
+    """
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}-", suffix=".part", dir=directory or ".")
+    os.close(fd)
+    try:
+        image.save(temp_path, **options)
+        os.chmod(temp_path, FILE_MODE)  # mkstemp は 0600 で作成するため、nginx からも読めるようにする
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _format_options(fmt: str, rendition: Rendition) -> dict:
+    """形式ごとの保存オプション（fmt: jpg / webp / avif）"""
+    if fmt == "jpg":
+        return {
+            "format": "JPEG", "quality": rendition.quality,
+            "optimize": True, "progressive": rendition.progressive,
+        }
+    return {**FORMAT_OPTIONS[fmt], "quality": max(1, rendition.quality + QUALITY_OFFSET[fmt])}
+
+
+def _save_rendition(image: Image.Image, path: str, rendition: Rendition) -> None:
+    """JPEG と、対応していれば WebP・AVIF で保存"""
+    _save(image, path, _format_options("jpg", rendition))
+    if not rendition.alternates:
+        return
+    for fmt in ALTERNATE_FORMATS:
+        _save(image, alternate_path(path, fmt), _format_options(fmt, rendition))
+
+
+def render_renditions(source_path: str, outputs: Dict[str, str]) -> Dict[str, Tuple[int, int]]:
+    """
+    元画像から outputs（レンディション名 -> 保存先パス）の画像をまとめて作成
+    レンディションごとの (幅, 高さ) を返す
+    """
+    renditions = {name: RENDITIONS[name] for name in outputs}
+    max_side = max(max(r.width, r.height) for r in renditions.values())
+    image = _decode(source_path, max_side)
+
+    sizes = {}
+    for name, rendition in renditions.items():
+        resized = _resize(image, rendition)
+        _save_rendition(resized, outputs[name], rendition)
+        sizes[name] = resized.size
+    return sizes
+
+
+def render_width(source_path: str, dest_path: str, width: int, fmt: str) -> int:
+    """
+    元画像を幅 width に縮小して fmt（jpg / webp / avif）で保存し、ファイルサイズを返す
+    元画像より大きくはしない（srcset の幅ごとの画像、rendition_cache から呼ばれる）
+    """
+    image = _decode(source_path, width)
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+    _save(image, dest_path, _format_options(fmt, WIDTH_RENDITION))
+    return os.path.getsize(dest_path)
+
+
+# ---- API プロセス側 ----
+
+async def process_image(source_path: str, outputs: Dict[str, str]) -> Dict[str, Tuple[int, int]]:
+    """render_renditions をプロセスプールで実行（混雑時は 503）"""
+    return await image_processor.run(render_renditions, source_path, outputs)
+
+
+def ogp_filename(filename: str) -> str:
+    """カバー画像のファイル名に対応する OGP 画像のファイル名"""
+    return f"{os.path.splitext(filename)[0]}_ogp.jpg"
+
+
+def alternate_path(path: str, fmt: str) -> str:
+    """JPEG のレンディションに対応する別形式のファイル（拡張子だけ変える）"""
+    return f"{os.path.splitext(path)[0]}.{fmt}"
+
+
+def rendition_files(path: str) -> List[str]:
+    """レンディションの JPEG と別形式のファイル（削除用、設定で無効にした形式も含む）"""
+    return [path] + [alternate_path(path, fmt) for fmt in FORMAT_OPTIONS]
+
+
+def accepted_formats(accept: Optional[str]) -> List[str]:
+    """Accept ヘッダーで受け付けている画像形式（q=0 は除外）"""
+    accepted = []
+    for part in (accept or "").lower().split(","):
+        media_type, *params = [token.strip() for token in part.split(";")]
+        if any(param.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for param in params):
+            continue
+        for fmt, fmt_type in MEDIA_TYPES.items():
+            if media_type == fmt_type:
+                accepted.append(fmt)
+    return accepted
+
+
+def preferred_format(accept: Optional[str]) -> str:
+    """Accept ヘッダーから作成する形式を選ぶ（AVIF → WebP → JPEG）"""
+    accepted = accepted_formats(accept)
+    for fmt in ALTERNATE_FORMATS:
+        if fmt in accepted:
+            return fmt
+    return "jpg"
+
+
+def negotiate_image(path: str, accept: Optional[str]) -> Tuple[str, str]:
+    """
+    Accept ヘッダーに応じて配信するファイルと Content-Type を選ぶ
+    AVIF → WebP の順に、クライアントが対応していてファイルがあるものを返す（なければ元のファイル）
+    """
+    accepted = accepted_formats(accept)
+    for fmt in FORMAT_OPTIONS:
+        candidate = alternate_path(path, fmt)
+        if fmt in accepted and os.path.exists(candidate):
+            return candidate, MEDIA_TYPES[fmt]
+    return path, mimetypes.guess_type(path)[0] or "application/octet-stream"
@@ -0,0 +1,177 @@
+"""
+内容のハッシュ（SHA-256）によるメディアの保存と重複排除
+
+アップロードのたびに uuid4 のファイル名で保存していたため、記事の編集で同じ写真を
+何度もアップロードすると、その都度変換されて別ファイルとして溜まっていた。
+ここではファイル名をアップロード内容の SHA-256 から決め、同じ内容・同じ変換（variant）の
+ファイルがすでにあれば、デコードや変換をせずにそのファイルを返す。
+
+ファイルを参照している数は media_blobs.ref_count で管理し、記事の削除などで
+参照がなくなったときだけ実ファイルを削除する。
+参照数の更新はリクエストのセッションとは別の短いトランザクションで行う
+（async ハンドラ内で画像変換を待つ間に行ロックを持ち続けないため）。
+取得はリクエストのコミット前、解放はコミット後に行うので、失敗したときは
+ファイルが残る側（削除されない側）にずれる。
+
+参照を取得した処理は、ファイルを使わなくなったとき（記事の編集・削除、メディアの削除、
+ユーザーアイコンの変更）に必ず release_files で解放する。
+DB へのアクセスは同期のセッションで行うため、async ハンドラからはイベントループを止めないよう
+スレッドプールで実行する（store_upload は内部で、解放は arelease_files を使う）。
+/upload/media/ などでアップロードして記事の本文に埋め込まれたファイルは、
+どこから参照されているか追えないため、参照を持ち続ける（削除しない）。
+
+そのままの形式で保存するファイル（raw）は拡張子をファイル名に含めるが、重複の判定は内容と変換だけで行う。
+同じ内容を別の拡張子でアップロードした場合は、最初に保存したファイル名（media_blobs の値）を返す。
+"""
+import os
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal
+from app.media_pipeline import ogp_filename, process_image, rendition_files
+from app.models import MediaBlob
+from app.uploads import StoredUpload
+
+VARIANT_MEDIA = "media"  # 本体（full）+ サムネイル
+VARIANT_COVER = "cover"  # 記事のカバー画像 + OGP 画像
+VARIANT_RAW = "raw"  # アップロードされたまま（動画・その他のファイル）
+
+
+def blob_filenames(sha256: str, variant: str, extension: str) -> Tuple[str, Optional[str]]:
+    """(保存ファイル名, サムネイル・OGP のファイル名)"""
+    if variant == VARIANT_MEDIA:
+        return f"{sha256}_full.jpg", f"{sha256}_thumbnail.jpg"
+    if variant == VARIANT_COVER:
+        cover = f"{sha256}_cover.jpg"
+        return cover, ogp_filename(cover)
+    return f"{sha256}.{extension}", None
+
+
+def _files_exist(directory: str, *filenames: Optional[str]) -> bool:
+    return all(os.path.exists(os.path.join(directory, name)) for name in filenames if name)
+
+
+def _acquire(
+    sha256: str, variant: str, stored: str, thumbnail: Optional[str], file_size: int
+) -> Tuple[str, Optional[str]]:
+    """
+    参照数を1増やす（初めての内容ならレコードを作成）
+    レコードに保存されている (保存ファイル名, サムネイル・OGP のファイル名) を返す
+    """
+    now = datetime.utcnow()
+    stmt = pg_insert(MediaBlob).values(
+        sha256=sha256,
+        variant=variant,
+        stored_filename=stored,
+        thumbnail_filename=thumbnail,
+        file_size=file_size,
+        ref_count=1,
+        created_at=now,
+        updated_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_media_blobs_sha256_variant",
+        set_={"ref_count": MediaBlob.ref_count + 1, "updated_at": now},
+    ).returning(MediaBlob.stored_filename, MediaBlob.thumbnail_filename)
+    db = SessionLocal()
+    try:
+        row = db.execute(stmt).one()
+        db.commit()
+        return row.stored_filename, row.thumbnail_filename
+    finally:
+        db.close()
+
+
+async def store_upload(
+    upload: StoredUpload,
+    variant: str,
+    extension: str,
+    directory: str,
+) -> Tuple[str, Optional[str], bool]:
+    """
+    アップロードを内容のハッシュで保存して参照数を1増やす
+    (保存ファイル名, サムネイル・OGP のファイル名, 新しく保存したか) を返す
+    同じ内容のファイルがすでにあれば、変換せずに既存のファイル名を返す
+    """
+    stored, thumbnail = blob_filenames(upload.sha256, variant, extension)
+
+    # 先に参照を登録しておけば、確認後に他のリクエストの解放でファイルが消されることはない
+    # 同じ内容が別の拡張子で登録済みなら、そのファイル名になる
+    stored, thumbnail = await run_in_threadpool(_acquire, upload.sha256, variant, stored, thumbnail, upload.size)
+    if _files_exist(directory, stored, thumbnail):
+        print(f"♻️ 同じ内容のファイルを再利用: {stored}")
+        return stored, thumbnail, False
+
+    # ファイル名は内容から決まる。同じ内容を同時に処理した場合も、それぞれ別の一時ファイルに書き出してから
+    # os.replace で置き換える（media_pipeline._save・StoredUpload.commit）ので、最後に置き換えた同じ内容のファイルが残る
+    stored_path = os.path.join(directory, stored)
+    try:
+        if variant == VARIANT_MEDIA:
+            await process_image(upload.path, {"full": stored_path, "thumbnail": os.path.join(directory, thumbnail)})
+        elif variant == VARIANT_COVER:
+            await process_image(upload.path, {"cover": stored_path, "ogp": os.path.join(directory, thumbnail)})
+        else:
+            upload.commit(stored_path)
+    except BaseException:
+        # 変換に失敗した（混雑で 503 など）ときは、取得した参照を戻す
+        await arelease_files([stored], directory)
+        raise
+    return stored, thumbnail, True
+
+
+def release_files(filenames: Iterable[str], directory: str) -> List[str]:
+    """
+    ファイルへの参照を1つずつ解放し、参照がなくなったファイルを削除する
+    media_blobs で管理していないファイル名（移行前のファイル）のリストを返す
+    """
+    untracked = []
+    db = SessionLocal()
+    try:
+        for filename in filenames:
+            blob = (
+                db.query(MediaBlob)
+                .filter(MediaBlob.stored_filename == filename)
+                .with_for_update()
+                .first()
+            )
+            if blob is None:
+                untracked.append(filename)
+                continue
+
+            blob.ref_count -= 1
+            if blob.ref_count <= 0:
+                # 行ロックを持ったまま削除するので、同時に同じ内容を登録したリクエストは
+                # コミット後に新しいレコードを作ってファイルを作り直す
+                for name in (blob.stored_filename, blob.thumbnail_filename):
+                    if not name:
+                        continue
+                    # 画像のレンディションは WebP・AVIF も一緒に削除
+                    path = os.path.join(directory, name)
+                    for path in rendition_files(path) if blob.variant != VARIANT_RAW else [path]:
+                        if os.path.exists(path):
+                            os.remove(path)
+                db.delete(blob)
+                print(f"🗑️ 参照がなくなったファイルを削除: {blob.stored_filename}")
+            db.commit()
+    except Exception as e:
+        print(f"❌ メディアの参照解放エラー: {e}")
+        db.rollback()
+    finally:
+        db.close()
+    return untracked
+
+
+async def arelease_files(filenames: Iterable[str], directory: str) -> List[str]:
+    """release_files をスレッドプールで実行する（async ハンドラ用）"""
+    return await run_in_threadpool(release_files, list(filenames), directory)
+
+
+def static_filename(url: Optional[str]) -> Optional[str]:
+    """/static/・/images/ 配下のURLからファイル名を取り出す（それ以外は None）"""
+    for prefix in ("/static/", "/images/"):
+        if url and prefix in url:
+            return os.path.basename(url.split(prefix, 1)[1].split("?", 1)[0])
+    return None
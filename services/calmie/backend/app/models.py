@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP, Enum, ForeignKey, Text, ARRAY
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, TIMESTAMP, Enum, ForeignKey, Text, ARRAY, UniqueConstraint, Index, DDL, event, text
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from app.database import Base
 import enum
 
@@ -51,21 +52,30 @@ class UserFollower(Base):
 # 🔄 メディア管理テーブル（既存のstaticファイルと併用）
 class MediaFile(Base):
     __tablename__ = "media_files"
+    __table_args__ = (
+        # ユーザーごとのメディア一覧（削除済みを除いて新しい順）
+        Index(
+            "ix_media_files_uploaded_by_created_at", "uploaded_by", "created_at",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     original_filename = Column(String, nullable=False)  # 元のファイル名
-    stored_filename = Column(String, unique=True, nullable=False)  # サーバー保存時のファイル名（UUID）
+    stored_filename = Column(String, nullable=False, index=True)  # サーバー保存時のファイル名（内容のハッシュ。同じ内容なら共有）
     file_path = Column(String, nullable=False)  # ファイルパス
     file_url = Column(String, nullable=False)  # アクセス用URL
     thumbnail_url = Column(String, nullable=True)  # サムネイルURL（画像の場合）
     file_type = Column(String, nullable=False)  # MIME type
     file_size = Column(Integer, nullable=False)  # ファイルサイズ（bytes）
+    content_hash = Column(String(64), nullable=True, index=True)  # アップロードされた内容の SHA-256
     alt_text = Column(String, nullable=True)  # アクセシビリティ用alt text
     caption = Column(Text, nullable=True)  # 画像キャプション
     uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=False)  # アップロードユーザー
     is_public = Column(String, default="public")  # public, private, limited
     access_count = Column(Integer, default=0)  # アクセス数
     download_count = Column(Integer, default=0)  # ダウンロード数
+    status = Column(String, nullable=False, default="ready", server_default="ready")  # ready, processing（動画の変換中）, failed
     created_at = Column(TIMESTAMP, nullable=False)
     updated_at = Column(TIMESTAMP, nullable=False)
     deleted_at = Column(TIMESTAMP, nullable=True)
@@ -73,25 +83,50 @@ class MediaFile(Base):
 
 class Article(Base):
     __tablename__ = "articles"
+    __table_args__ = (
+        Index("ix_articles_search_vector", "search_vector", postgresql_using="gin"),
+        # 一覧のカーソルページング用（(public_at, id) の降順で読む）
+        Index("ix_articles_public_at_id", "public_at", "id"),
+        Index("ix_articles_create_user_id_public_at_id", "create_user_id", "public_at", "id"),
+        # カテゴリ絞り込み（category @> ARRAY[...]）用
+        Index("ix_articles_category", "category", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     category = Column(ARRAY(String), nullable=True)
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
+    summary = Column(Text, nullable=True)  # 一覧用の要約（投稿・編集時に本文から作成、app/summary.py）
     content_image = Column(ARRAY(String), nullable=True)
     thumbnail_image = Column(String, nullable=True)
     public_status = Column(Enum(PublicStatus), nullable=False, index=True)
     prefectures = Column(Integer, nullable=True)
     create_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     likes_count = Column(Integer, default=0)
+    comment_count = Column(Integer, default=0, server_default="0", nullable=False)  # コメント数（書き込み時に更新）
     public_at = Column(TIMESTAMP, nullable=True)
     created_at = Column(TIMESTAMP, nullable=False)
     updated_at = Column(TIMESTAMP, nullable=False)
     deleted_at = Column(TIMESTAMP, nullable=True)
+    # 全文検索用（文字バイグラムの tsvector、app/search.py で作成）。一覧取得では読み込まない
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
 
 
 class ArticleLike(Base):
     __tablename__ = "article_likes"
+    __table_args__ = (
+        # 1ユーザー1記事につき1いいね（冪等な INSERT ... ON CONFLICT 用）
+        UniqueConstraint("user_id", "article_id", name="uq_article_likes_user_article"),
+        # 記事ごと・期間ごとの集計（トレンド、バッチ）用。削除済みのいいねは集計しない
+        Index(
+            "ix_article_likes_article_id_created_at", "article_id", "created_at",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_article_likes_created_at", "created_at",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -103,6 +138,15 @@ class ArticleLike(Base):
 
 class ArticleComment(Base):
     __tablename__ = "article_comments"
+    __table_args__ = (
+        # 記事ページのコメント取得、トレンド集計用
+        Index("ix_article_comments_article_id_created_at", "article_id", "created_at"),
+        # バッチの期間集計用（削除済みのコメントは集計しない）
+        Index(
+            "ix_article_comments_created_at", "created_at",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     username = Column(String, nullable=False)
@@ -117,6 +161,10 @@ class ArticleComment(Base):
 
 class AggregatePoints(Base):
     __tablename__ = "aggregate_points"
+    __table_args__ = (
+        # 記事ごとに1レコード（バッチの INSERT ... ON CONFLICT 用）
+        UniqueConstraint("article_id", "target_type", name="uq_aggregate_points_article_target"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     target_type = Column(Enum(TargetType), default=TargetType.article, nullable=False)
@@ -139,6 +187,14 @@ class AggregatePoints(Base):
 
 class DailyRating(Base):
     __tablename__ = "daily_rating"
+    __table_args__ = (
+        # バッチの記事ごとの最新の行の読み込み用
+        Index("ix_daily_rating_article_id_created_at", "article_id", "created_at"),
+        # バッチの期間指定の削除（created_at の範囲指定）用
+        Index("ix_daily_rating_created_at", "created_at"),
+        # 日次ランキング（過去24時間に更新された行）用
+        Index("ix_daily_rating_updated_at", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     article_id = Column(Integer, ForeignKey("articles.id"), nullable=False)
@@ -161,9 +217,107 @@ class CommentsLike(Base):
 
 class HistoryRating(Base):
     __tablename__ = "history_rating"
+    __table_args__ = (
+        # 記事ごとに1レコード（アトミックなカウンタ更新の upsert 用）
+        UniqueConstraint("article_id", name="uq_history_rating_article_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     article_id = Column(Integer, ForeignKey("articles.id"), nullable=False)
     access_count = Column(Integer, default=0)
     like_count = Column(Integer, default=0)
     super_like_count = Column(Integer, default=0)
+
+
+# ランキングのスナップショット（バッチで作成し、APIはこれを返すだけ）
+class RankingSnapshot(Base):
+    __tablename__ = "ranking_snapshots"
+    __table_args__ = (
+        UniqueConstraint("period", "version", name="uq_ranking_snapshots_period_version"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    period = Column(String, nullable=False)  # daily, weekly, monthly
+    version = Column(Integer, nullable=False)  # 期間ごとに単調増加
+    payload = Column(Text, nullable=False)  # ランキング結果（JSON）
+    created_at = Column(TIMESTAMP, nullable=False)
+
+
+# バッチ処理の処理済み位置（差分集計用）
+class BatchWatermark(Base):
+    __tablename__ = "batch_watermarks"
+
+    name = Column(String, primary_key=True)  # article_likes, article_comments
+    last_id = Column(Integer, nullable=False, default=0)  # 集計済みの最大ID
+    last_run_at = Column(TIMESTAMP, nullable=False)  # 集計の基準時刻
+    updated_at = Column(TIMESTAMP, nullable=False)
+
+
+# 記事の閲覧ログ（追記専用、viewed_at の月単位でパーティション分割）
+# 閲覧数バッファのフラッシュ時に記事ごとの閲覧数を1行として追記する
+# マイグレーション（e4a7c19b3f60）より先に create_all で作成された場合も同じパーティションテーブルにする
+# （月ごとのパーティションはバッチ処理が作成する）
+class ArticleAccessEvent(Base):
+    __tablename__ = "article_access_events"
+    __table_args__ = (
+        Index("ix_article_access_events_viewed_at", "viewed_at"),
+        {"postgresql_partition_by": "RANGE (viewed_at)"},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)  # BIGSERIAL
+    viewed_at = Column(TIMESTAMP, primary_key=True)  # パーティションキー（主キーに含める必要がある）
+    article_id = Column(Integer, nullable=False)  # 書き込みを軽くするため外部キーは付けない
+    views = Column(Integer, nullable=False, default=1)
+
+
+# 範囲外の行を受け止めるデフォルトパーティション（マイグレーションと同じ）
+event.listen(
+    ArticleAccessEvent.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS article_access_events_default "
+        "PARTITION OF article_access_events DEFAULT"
+    ).execute_if(dialect="postgresql"),
+)
+
+
+# 動画のトランスコードジョブ（transcode_worker.py が FOR UPDATE SKIP LOCKED で取り出して処理）
+class TranscodeJob(Base):
+    __tablename__ = "transcode_jobs"
+    __table_args__ = (
+        # 未処理・処理中のジョブだけを対象にした取り出し用
+        Index(
+            "ix_transcode_jobs_pending", "status", "id",
+            postgresql_where=text("status IN ('queued', 'processing')"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    media_id = Column(Integer, ForeignKey("media_files.id"), nullable=True)  # /v2/upload-media の場合のみ
+    source_path = Column(String, nullable=False)  # 元ファイル（変換が終わるまではこのまま配信し、完了時に置き換える）
+    status = Column(String, nullable=False, default="queued")  # queued, processing, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    locked_at = Column(TIMESTAMP, nullable=True)  # ワーカーが取り出した時刻（一定時間を過ぎたら再取得可能）
+    created_at = Column(TIMESTAMP, nullable=False)
+    updated_at = Column(TIMESTAMP, nullable=False)
+    finished_at = Column(TIMESTAMP, nullable=True)
+
+
+# 内容のハッシュで保存したファイル（同じ内容のアップロードは変換せずに共有し、参照数で削除を管理）
+class MediaBlob(Base):
+    __tablename__ = "media_blobs"
+    __table_args__ = (
+        # 同じ内容でも変換の種類（variant）ごとに別のファイルになる
+        UniqueConstraint("sha256", "variant", name="uq_media_blobs_sha256_variant"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sha256 = Column(String(64), nullable=False)
+    variant = Column(String, nullable=False)  # media（本体+サムネイル）, cover（カバー+OGP）, raw（そのまま）
+    stored_filename = Column(String, nullable=False, index=True)
+    thumbnail_filename = Column(String, nullable=True)  # サムネイル・OGP 画像
+    file_size = Column(Integer, nullable=False)  # アップロードされたファイルのサイズ
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(TIMESTAMP, nullable=False)
+    updated_at = Column(TIMESTAMP, nullable=False)
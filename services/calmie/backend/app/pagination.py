@@ -0,0 +1,95 @@
+"""
+記事一覧のカーソル（keyset）ページング
+
+OFFSET によるページングはページが深くなるほど読み飛ばす行が増えるため、
+(public_at, id) の降順で並べ、前のページの最後の記事より後ろだけを読む。
+(public_at, id) の複合インデックスを使うので、どのページも先頭ページと同じコストで取得できる。
+
+カーソルは内容を意識させないよう base64 でエンコードした文字列としてやり取りする。
+関連度順の検索結果のように (public_at, id) で並べられない一覧では、上限付きの位置をカーソルに入れる。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+from app.models import Article
+
+PAGE_DEFAULT_LIMIT = 30
+PAGE_MAX_LIMIT = 100
+
+
+def encode_cursor(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    """カーソルを復元（不正な値は 400）"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, dict):
+            raise ValueError("cursor payload must be an object")
+        return payload
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def clamp_limit(limit: Optional[int], default: int = PAGE_DEFAULT_LIMIT) -> int:
+    return max(1, min(limit or default, PAGE_MAX_LIMIT))
+
+
+def _article_position(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    payload = decode_cursor(cursor)
+    if payload is None:
+        return None
+    try:
+        return datetime.fromisoformat(payload["p"]), int(payload["i"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(stmt, cursor: Optional[str], limit: int):
+    """
+    Query / Select に (public_at, id) 降順のページ条件を付ける
+    次のページの有無を判定するため limit + 1 件を取得する
+    """
+    stmt = stmt.filter(Article.public_at.isnot(None))
+    position = _article_position(cursor)
+    if position is not None:
+        stmt = stmt.filter(tuple_(Article.public_at, Article.id) < tuple_(*position))
+    return stmt.order_by(Article.public_at.desc(), Article.id.desc()).limit(limit + 1)
+
+
+def split_page(articles: Sequence[Article], limit: int) -> Tuple[List[Article], Optional[str]]:
+    """limit + 1 件の取得結果を、そのページの記事と next_cursor に分ける"""
+    page = list(articles[:limit])
+    if len(articles) <= limit or not page:
+        return page, None
+    last = page[-1]
+    return page, encode_cursor({"p": last.public_at.isoformat(), "i": last.id})
+
+
+def offset_from_cursor(cursor: Optional[str]) -> int:
+    """位置ベースのカーソルから読み飛ばす件数を取り出す"""
+    payload = decode_cursor(cursor)
+    if payload is None:
+        return 0
+    try:
+        return max(0, int(payload["o"]))
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def offset_cursor(offset: int, limit: int, returned: int, max_results: int) -> Optional[str]:
+    """位置ベースの next_cursor（上限に達したか、最後のページなら None）"""
+    next_offset = offset + limit
+    if returned < limit or next_offset >= max_results:
+        return None
+    return encode_cursor({"o": next_offset})
@@ -0,0 +1,193 @@
+"""
+日次・週次・月次ランキングの作成と配信
+
+ランキングの元データ（daily_rating / aggregate_points）はバッチ実行時にしか
+変わらないため、バッチでランキング結果を ranking_snapshots に保存しておき、
+APIはそのスナップショットをメモリ上にキャッシュして返す。
+新しいスナップショットが公開されたかどうかは version を定期的に確認して判定する。
+スナップショットの作成後に削除・非公開になった記事は、返すときに除く。
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.models import RankingSnapshot
+
+RANKING_PERIODS = ("daily", "weekly", "monthly")
+RANKING_LIMIT = 20
+RANKING_SNAPSHOT_KEEP = 3  # 期間ごとに保持する世代数
+RANKING_VERSION_CHECK_SECONDS = float(os.getenv("RANKING_VERSION_CHECK_SECONDS", "30"))
+
+
+def compute_ranking(db: Session, period: str, limit: int = RANKING_LIMIT) -> List[dict]:
+    """集計テーブルからランキングを計算（バッチ、またはスナップショット未作成時に使用）"""
+    now = datetime.utcnow()
+    if period == "daily":
+        # DailyRatingテーブルから過去24時間に更新されたデータを取得
+        # （差分集計は増減がある記事の行だけを更新する。24時間更新されていない行は値が0）
+        like_col = models.DailyRating.like_count
+        access_col = models.DailyRating.access_count
+        source = models.DailyRating
+        since_filter = models.DailyRating.updated_at >= now - timedelta(days=1)
+    elif period in ("weekly", "monthly"):
+        # AggregatePointsテーブルから週次・月次データを取得
+        days = 7 if period == "weekly" else 30
+        like_col = getattr(models.AggregatePoints, f"like_{period}")
+        access_col = getattr(models.AggregatePoints, f"access_{period}")
+        source = models.AggregatePoints
+        since_filter = models.AggregatePoints.updated_at >= now - timedelta(days=days)
+    else:
+        raise ValueError(f"unknown ranking period: {period}")
+
+    rows = db.query(
+        source.article_id,
+        like_col.label("like_count"),
+        access_col.label("access_count"),
+        models.Article.title,
+        models.Article.thumbnail_image,
+        models.Article.category,
+        models.Article.created_at,
+        models.User.username
+    ).join(
+        models.Article, source.article_id == models.Article.id
+    ).join(
+        models.User, models.Article.create_user_id == models.User.id
+    ).filter(
+        models.Article.deleted_at.is_(None),
+        models.Article.public_status == models.PublicStatus.public,
+        since_filter
+    ).order_by(
+        (like_col + access_col).desc()
+    ).limit(limit).all()
+
+    ranking_articles = []
+    for rank, item in enumerate(rows, 1):
+        like_count = item.like_count or 0
+        access_count = item.access_count or 0
+        ranking_articles.append({
+            "id": item.article_id,
+            "title": item.title,
+            "thumbnail_image": item.thumbnail_image,
+            "likes_count": like_count,
+            "access_count": access_count,
+            "category": item.category or [],
+            "username": item.username,
+            "created_at": item.created_at.isoformat() if item.created_at else None,
+            "rank": rank,
+            "score": like_count + access_count
+        })
+    return ranking_articles
+
+
+def publish_ranking_snapshots(db: Session) -> Dict[str, int]:
+    """全期間のランキングを計算してスナップショットとして保存し、新しい version を返す"""
+    versions = {}
+    now = datetime.utcnow()
+    for period in RANKING_PERIODS:
+        articles = compute_ranking(db, period)
+        latest = _latest_version(db, period) or 0
+        version = latest + 1
+        db.add(RankingSnapshot(
+            period=period,
+            version=version,
+            payload=json.dumps(articles, ensure_ascii=False),
+            created_at=now,
+        ))
+        # 古い世代を削除
+        db.query(RankingSnapshot).filter(
+            RankingSnapshot.period == period,
+            RankingSnapshot.version <= version - RANKING_SNAPSHOT_KEEP,
+        ).delete(synchronize_session=False)
+        versions[period] = version
+    db.commit()
+    return versions
+
+
+def _latest_version(db: Session, period: str) -> Optional[int]:
+    row = (
+        db.query(RankingSnapshot.version)
+        .filter(RankingSnapshot.period == period)
+        .order_by(RankingSnapshot.version.desc())
+        .first()
+    )
+    return row[0] if row else None
+
+
+class RankingCache:
+    """スナップショットのメモリキャッシュ（version が変わったときだけ読み直す）"""
+
+    def __init__(self, check_interval: float):
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        # period -> (version, articles, 最後に version を確認した時刻)
+        self._entries: Dict[str, Tuple[int, List[dict], float]] = {}
+
+    def get(self, db: Session, period: str) -> Optional[List[dict]]:
+        """キャッシュ済みのランキングを返す（スナップショットがなければ None）"""
+        now = time.monotonic()
+        entry = self._entries.get(period)
+        if entry and now - entry[2] < self._check_interval:
+            return entry[1]
+
+        version = _latest_version(db, period)
+        if version is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(period)
+            if entry and entry[0] == version:
+                self._entries[period] = (version, entry[1], now)
+                return entry[1]
+
+            snapshot = db.query(RankingSnapshot.payload).filter(
+                RankingSnapshot.period == period,
+                RankingSnapshot.version == version,
+            ).first()
+            if snapshot is None:
+                return None
+            articles = json.loads(snapshot[0])
+            self._entries[period] = (version, articles, now)
+            return articles
+
+    def version(self, period: str) -> Optional[int]:
+        entry = self._entries.get(period)
+        return entry[0] if entry else None
+
+
+ranking_cache = RankingCache(check_interval=RANKING_VERSION_CHECK_SECONDS)
+
+
+def visible_articles(db: Session, articles: List[dict]) -> List[dict]:
+    """
+    スナップショットの作成後に削除・非公開になった記事を除く
+    （ランキングの件数分の主キー検索1回。除いた場合は順位を詰める）
+    """
+    if not articles:
+        return articles
+    visible = {
+        row[0] for row in db.query(models.Article.id).filter(
+            models.Article.id.in_([article["id"] for article in articles]),
+            models.Article.deleted_at.is_(None),
+            models.Article.public_status == models.PublicStatus.public,
+        )
+    }
+    if len(visible) == len(articles):
+        return articles
+    return [
+        {**article, "rank": rank}
+        for rank, article in enumerate((article for article in articles if article["id"] in visible), 1)
+    ]
+
+
+def get_ranking(db: Session, period: str) -> List[dict]:
+    """キャッシュ済みスナップショットを返し、未作成ならその場で計算する"""
+    articles = ranking_cache.get(db, period)
+    if articles is None:
+        return compute_ranking(db, period)
+    return visible_articles(db, articles)
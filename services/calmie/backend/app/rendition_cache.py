@@ -0,0 +1,167 @@
+"""
+srcset 用の幅ごとの画像のディスクキャッシュ
+
+アップロード時に作成するのは本体（長辺1280px）とサムネイル・カバー画像だけなので、
+スマホのフィードでは 180px で表示する画像のために 1280px の画像をダウンロードしていた。
+ここでは RENDITION_WIDTHS の幅の画像を最初に要求されたときに作成してディスクに保存し、
+2回目以降はそのファイルをそのまま返す。
+
+キャッシュの合計サイズが RENDITION_CACHE_MAX_MB を超えたら、最後に使われたのが古いものから削除する（LRU）。
+使われた順番はファイルの更新日時にも記録するので、再起動後も起動時の読み込みで引き継がれる。
+ファイルは一時ファイルに書き出してから置き換える（media_pipeline._save）ので、作成途中のファイルは配信されない。
+同じ画像を同時に要求された場合は、最初のリクエストの作成を待って同じファイルを返す。
+
+API ワーカーが複数ある場合はワーカーごとに一覧を持つが、ファイルは共有される
+（他のワーカーが作成したファイルは見つけた時点で一覧に加え、削除されていれば作り直す）。
+"""
+import asyncio
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from app.image_processing import image_processor
+from app.media_pipeline import RENDITIONS, render_width
+
+RENDITION_WIDTHS = sorted({
+    int(width) for width in os.getenv("RENDITION_WIDTHS", "160,320,480,640,960,1280").split(",") if width.strip()
+})
+RENDITION_CACHE_DIRECTORY = os.getenv("RENDITION_CACHE_DIRECTORY", "./rendition_cache")
+RENDITION_CACHE_MAX_MB = int(os.getenv("RENDITION_CACHE_MAX_MB", "1024"))
+
+
+def ladder(filename: str) -> List[int]:
+    """
+    画像に使える幅の一覧
+    レンディション（xxx_full.jpg など）は作成時の幅までに絞る（それより大きくはならないため）
+    """
+    match = re.search(r"_([a-z]+)\.jpg$", filename)
+    rendition = RENDITIONS.get(match.group(1)) if match else None
+    if rendition is None or rendition.crop:
+        return RENDITION_WIDTHS
+    widths = [width for width in RENDITION_WIDTHS if width <= rendition.width]
+    return widths or RENDITION_WIDTHS[:1]
+
+
+class RenditionCache:
+    """幅ごとの画像を作成してディスクに保存する（合計サイズの上限を超えたら古いものから削除）"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self._max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # ファイル名 -> サイズ（使われたのが古い順）
+        self._total_bytes = 0
+        self._creating: Dict[str, asyncio.Lock] = {}
+
+        # メトリクス
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def start(self) -> None:
+        """キャッシュディレクトリのファイルを更新日時の順に読み込む"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".part"):
+                # 作成途中で落ちたときの一時ファイル
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            for _, name, size in sorted(files):
+                self._entries[name] = size
+                self._total_bytes += size
+            self._evict()
+        print(f"🖼️ 幅ごとの画像キャッシュ: {len(self._entries)}件（{self._total_bytes // (1024 * 1024)}MB）")
+
+    def _touch(self, name: str) -> bool:
+        """キャッシュにあれば最後に使われた順番を更新して True"""
+        path = os.path.join(self.directory, name)
+        try:
+            os.utime(path)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            # 他のワーカーが削除した
+            with self._lock:
+                if name in self._entries:
+                    self._total_bytes -= self._entries.pop(name)
+            return False
+
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            else:
+                # 他のワーカーが作成した
+                self._entries[name] = size
+                self._total_bytes += size
+                self._evict()
+        return True
+
+    def _add(self, name: str, size: int) -> None:
+        with self._lock:
+            self._total_bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._evict()
+
+    def _evict(self) -> None:
+        """合計サイズが上限以下になるまで古いものから削除（_lock を持った状態で呼ぶ）"""
+        while self._total_bytes > self._max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, source_path: str, width: int, fmt: str) -> str:
+        """元画像を幅 width・形式 fmt にした画像のパス（なければ作成する）"""
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        name = f"{stem}_w{width}.{fmt}"
+        path = os.path.join(self.directory, name)
+        if self._touch(name):
+            self._hits += 1
+            return path
+
+        # 同じ画像の作成は1回だけ（後から来たリクエストは作成が終わるのを待つ）
+        lock = self._creating.setdefault(name, asyncio.Lock())
+        async with lock:
+            try:
+                if self._touch(name):
+                    self._hits += 1
+                    return path
+
+                self._misses += 1
+                os.makedirs(self.directory, exist_ok=True)
+                size = await image_processor.run(render_width, source_path, path, width, fmt)
+                self._add(name, size)
+                return path
+            finally:
+                # 待っているリクエストは作成済みのファイルを _touch で見つける
+                if self._creating.get(name) is lock:
+                    del self._creating[name]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "widths": RENDITION_WIDTHS,
+            }
+
+
+rendition_cache = RenditionCache(RENDITION_CACHE_DIRECTORY, RENDITION_CACHE_MAX_MB * 1024 * 1024)
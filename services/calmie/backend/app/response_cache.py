@@ -0,0 +1,453 @@
+"""
+匿名ユーザー向けフィード（/・/articles・ランキング・トレンド）のレスポンスキャッシュ
+
+これらのエンドポイントはログインに関係なく全員に同じ内容を返すが、
+リクエストのたびに DB から記事一覧と集計値を読み直していた。
+ここではエンドポイントの結果を JSON にしたバイト列を「パス + クエリパラメータ」ごとにキャッシュする。
+
+- 有効期限（RESPONSE_CACHE_TTL_SECONDS）に加えて、記事の投稿・編集・削除、いいね、
+  コメントの投稿時に invalidate() を呼ぶ。キャッシュのキーには世代番号が入っていて、
+  invalidate() は世代番号を進めるだけ（古い世代のキャッシュは参照されなくなり、期限切れや LRU で消える）
+- 保存先はプロセス内の LRU（既定）か Redis（RESPONSE_CACHE_REDIS_URL を設定したとき）。
+  Redis ならワーカー間でキャッシュと世代番号を共有する
+- プロセス内の LRU はワーカー1つ（uvicorn の既定）専用。invalidate() は呼んだワーカーの世代番号しか
+  進めないため、複数ワーカーでは他のワーカーが古い一覧を返し続ける。
+  WEB_CONCURRENCY が2以上で Redis が設定されていない場合は、キャッシュを無効にする
+- async のエンドポイントからの Redis の読み書き（同期クライアント）は、イベントループを止めないように
+  スレッドプールで実行する（プロセス内の LRU はロックを取るだけなのでそのまま呼ぶ）
+- 期限切れの直後に同じページへのリクエストが集中しても、作り直すのは1回だけ（single-flight）。
+  プロセス内はキーごとのロックで、Redis の場合はワーカー間でも SET NX のロックで待ち合わせる
+- キャッシュの読み書きに失敗した場合（Redis が落ちているなど）は、キャッシュせずにそのまま作成して返す
+
+キャッシュには本文と一緒に、本文のハッシュから作った ETag を保存しておく。
+SPA の再読み込み（If-None-Match つき）には、キャッシュにある ETag と比べるだけで
+本文を作らず（DB も JSON 変換も使わず）に 304 を返す。
+期限切れで作り直しても内容が同じなら ETag は変わらないので、そのまま 304 になる。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+
+from app.media_delivery import etag_matches
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))  # プロセス内 LRU の件数の上限
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "")
+RESPONSE_CACHE_LOCK_SECONDS = int(os.getenv("RESPONSE_CACHE_LOCK_SECONDS", "5"))  # 他のワーカーの作成を待つ上限
+RESPONSE_CACHE_POLL_SECONDS = 0.05
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))  # uvicorn / gunicorn のワーカー数
+
+FEED = "feed"  # 記事一覧系のキャッシュ（記事・いいね・コメントの変更で無効化）
+
+# JSON は毎回サーバーに確認させる（変わっていなければ 304）
+JSON_CACHE_CONTROL = "no-cache"
+
+
+def encode_json(content) -> bytes:
+    """JSONResponse と同じ形式でエンコード"""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def body_etag(body: bytes) -> str:
+    """本文のハッシュから ETag を作る"""
+    return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def make_etag(*parts) -> str:
+    """値の組（バージョンの情報）から ETag を作る"""
+    return body_etag("|".join(str(part) for part in parts).encode("utf-8"))
+
+
+def validator_headers(etag: str) -> dict:
+    """JSON のレスポンスに付ける ETag・Cache-Control（圧縮などで変わっても同じ内容として扱う弱い ETag）"""
+    return {"ETag": f"W/{etag}", "Cache-Control": JSON_CACHE_CONTROL}
+
+
+def http_date(value: datetime) -> str:
+    """Last-Modified の形式（DB の日時は UTC で保存している）"""
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def not_modified(request: Request, etag: str, headers: Optional[dict] = None) -> Optional[Response]:
+    """If-None-Match が ETag と一致すれば 304 のレスポンス、一致しなければ None"""
+    if not etag_matches(request.headers.get("if-none-match"), etag):
+        return None
+    return Response(status_code=304, headers={**validator_headers(etag), **(headers or {})})
+
+
+def _pack(etag: str, body: bytes) -> bytes:
+    """キャッシュに保存する値（1行目が ETag、その後が本文。本文の JSON は改行を含まない）"""
+    return etag.encode("ascii") + b"\n" + body
+
+
+def _unpack(value: Optional[bytes]) -> Optional[Tuple[str, bytes]]:
+    """(ETag, 本文)（ETag のない古い形式の値は None）"""
+    if value is None or b"\n" not in value:
+        return None
+    etag, body = value.split(b"\n", 1)
+    return etag.decode("ascii"), body
+
+
+class MemoryBackend:
+    """プロセス内の LRU（有効期限つき、ワーカー1つ専用）"""
+
+    name = "memory"
+    shared = False
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key: str, value: bytes, ttl: int) -> bool:
+        """キーがなければ保存して True（ロック用）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return False
+            self._entries[key] = (time.monotonic() + ttl, value)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def size(self) -> Optional[int]:
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisBackend:
+    """Redis（ワーカー間で共有、client は redis.Redis と同じインターフェースのもの）"""
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, client):
+        self._client = client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self._client.set(key, value, ex=ttl)
+
+    def add(self, key: str, value: bytes, ttl: int) -> bool:
+        return bool(self._client.set(key, value, ex=ttl, nx=True))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+    def get_counter(self, key: str) -> int:
+        value = self._client.get(key)
+        return int(value) if value is not None else 0
+
+    def incr(self, key: str) -> int:
+        return int(self._client.incr(key))
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def create_backend():
+    """RESPONSE_CACHE_REDIS_URL があれば Redis、なければプロセス内 LRU"""
+    if RESPONSE_CACHE_REDIS_URL:
+        try:
+            import redis
+
+            client = redis.Redis.from_url(RESPONSE_CACHE_REDIS_URL, socket_timeout=0.5)
+            print("🗄️ レスポンスキャッシュ: Redis を使用")
+            return RedisBackend(client)
+        except ImportError:
+            print("⚠️ redis パッケージがないため、レスポンスキャッシュはプロセス内で保持します")
+    return MemoryBackend(RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def cache_enabled(backend) -> bool:
+    """複数ワーカーではワーカー間で無効化を共有できる Redis が必要"""
+    if not RESPONSE_CACHE_ENABLED:
+        return False
+    if WEB_CONCURRENCY > 1 and not backend.shared:
+        print(
+            f"⚠️ WEB_CONCURRENCY={WEB_CONCURRENCY} ですが RESPONSE_CACHE_REDIS_URL が未設定のため、"
+            "レスポンスキャッシュを無効にします（プロセス内のキャッシュはワーカー間で無効化されません）"
+        )
+        return False
+    return True
+
+
+class ResponseCache:
+    """エンドポイントの結果（JSON）をキャッシュし、作り直しを1回にまとめる"""
+
+    def __init__(self, backend, ttl: int, lock_seconds: int, enabled: bool = True):
+        self._backend = backend
+        self._ttl = ttl
+        self._lock_seconds = lock_seconds
+        self._enabled = enabled
+
+        self._guard = threading.Lock()
+        self._thread_locks: Dict[str, threading.Lock] = {}
+        self._async_locks: Dict[str, asyncio.Lock] = {}
+
+        # メトリクス
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0  # 他のリクエストが作成した結果を待って返した件数
+        self._invalidations = 0
+        self._errors = 0
+        self._not_modified = 0  # If-None-Match が一致して 304 を返した件数
+
+    # ---- バックエンドの読み書き（失敗してもリクエストは止めない） ----
+
+    def _safe(self, fn, *args, default=None):
+        try:
+            return fn(*args)
+        except Exception as e:
+            self._errors += 1
+            print(f"⚠️ レスポンスキャッシュエラー: {e}")
+            return default
+
+    async def _asafe(self, fn, *args, default=None):
+        """_safe の async 版（Redis の同期クライアントはスレッドプールで呼ぶ）"""
+        if self._backend.shared:
+            return await run_in_threadpool(self._safe, fn, *args, default=default)
+        return self._safe(fn, *args, default=default)
+
+    @staticmethod
+    def _make_key(request: Request, namespace: str, generation: int) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"rc:{namespace}:{generation}:{request.url.path}?{query}"
+
+    def _key(self, request: Request, namespace: str) -> str:
+        return self._make_key(request, namespace, self.generation(namespace))
+
+    async def _akey(self, request: Request, namespace: str) -> str:
+        return self._make_key(request, namespace, await self.ageneration(namespace))
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, bytes]]:
+        return _unpack(self._safe(self._backend.get, key))
+
+    async def _alookup(self, key: str) -> Optional[Tuple[str, bytes]]:
+        return _unpack(await self._asafe(self._backend.get, key))
+
+    def _store(self, key: str, entry: Tuple[str, bytes]) -> None:
+        self._safe(self._backend.set, key, _pack(*entry), self._ttl)
+
+    async def _astore(self, key: str, entry: Tuple[str, bytes]) -> None:
+        await self._asafe(self._backend.set, key, _pack(*entry), self._ttl)
+
+    def _response(self, request: Request, entry: Tuple[str, bytes], status: str) -> Response:
+        """ETag が If-None-Match と一致すれば本文なしの 304"""
+        etag, body = entry
+        response = not_modified(request, etag, headers={"X-Cache": status})
+        if response is not None:
+            self._not_modified += 1
+            return response
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={**validator_headers(etag), "X-Cache": status},
+        )
+
+    @staticmethod
+    def _entry(content) -> Tuple[str, bytes]:
+        body = encode_json(content)
+        return body_etag(body), body
+
+    # ---- 同期エンドポイント用 ----
+
+    def get_or_build(self, request: Request, build: Callable[[], object], namespace: str = FEED) -> Response:
+        """キャッシュがあれば返し、なければ build() の結果をキャッシュして返す"""
+        if not self._enabled:
+            return self._response(request, self._entry(build()), "BYPASS")
+
+        key = self._key(request, namespace)
+        entry = self._lookup(key)
+        if entry is not None:
+            self._hits += 1
+            return self._response(request, entry, "HIT")
+
+        with self._guard:
+            lock = self._thread_locks.setdefault(key, threading.Lock())
+        with lock:
+            try:
+                entry = self._lookup(key)
+                if entry is not None:
+                    self._coalesced += 1
+                    return self._response(request, entry, "HIT")
+                return self._response(request, self._fill(key, build), "MISS")
+            finally:
+                with self._guard:
+                    if self._thread_locks.get(key) is lock:
+                        del self._thread_locks[key]
+
+    def _fill(self, key: str, build: Callable[[], object]) -> Tuple[str, bytes]:
+        lock_key = f"{key}:lock"
+        # ロックの取得に失敗（Redis のエラー）した場合は待たずに作成する
+        locked = self._backend.shared and self._safe(
+            self._backend.add, lock_key, b"1", self._lock_seconds, default=True
+        )
+        if self._backend.shared and not locked:
+            # 他のワーカーが作成中なら、できあがるまで待つ
+            deadline = time.monotonic() + self._lock_seconds
+            while time.monotonic() < deadline:
+                time.sleep(RESPONSE_CACHE_POLL_SECONDS)
+                entry = self._lookup(key)
+                if entry is not None:
+                    self._coalesced += 1
+                    return entry
+
+        self._misses += 1
+        try:
+            entry = self._entry(build())
+            self._store(key, entry)
+            return entry
+        finally:
+            if locked:
+                self._safe(self._backend.delete, lock_key)
+
+    # ---- 非同期エンドポイント用 ----
+
+    async def aget_or_build(
+        self, request: Request, build: Callable[[], Awaitable[object]], namespace: str = FEED
+    ) -> Response:
+        """get_or_build の async 版（build はコルーチン関数）"""
+        if not self._enabled:
+            return self._response(request, self._entry(await build()), "BYPASS")
+
+        key = await self._akey(request, namespace)
+        entry = await self._alookup(key)
+        if entry is not None:
+            self._hits += 1
+            return self._response(request, entry, "HIT")
+
+        lock = self._async_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            try:
+                entry = await self._alookup(key)
+                if entry is not None:
+                    self._coalesced += 1
+                    return self._response(request, entry, "HIT")
+                return self._response(request, await self._afill(key, build), "MISS")
+            finally:
+                if self._async_locks.get(key) is lock:
+                    del self._async_locks[key]
+
+    async def _afill(self, key: str, build: Callable[[], Awaitable[object]]) -> Tuple[str, bytes]:
+        lock_key = f"{key}:lock"
+        # ロックの取得に失敗（Redis のエラー）した場合は待たずに作成する
+        locked = self._backend.shared and await self._asafe(
+            self._backend.add, lock_key, b"1", self._lock_seconds, default=True
+        )
+        if self._backend.shared and not locked:
+            deadline = time.monotonic() + self._lock_seconds
+            while time.monotonic() < deadline:
+                await asyncio.sleep(RESPONSE_CACHE_POLL_SECONDS)
+                entry = await self._alookup(key)
+                if entry is not None:
+                    self._coalesced += 1
+                    return entry
+
+        self._misses += 1
+        try:
+            entry = self._entry(await build())
+            await self._astore(key, entry)
+            return entry
+        finally:
+            if locked:
+                await self._asafe(self._backend.delete, lock_key)
+
+    # ---- 無効化 ----
+
+    def generation(self, namespace: str = FEED) -> int:
+        """世代番号（無効化のたびに増える）"""
+        return self._safe(self._backend.get_counter, f"rc:gen:{namespace}", default=0)
+
+    async def ageneration(self, namespace: str = FEED) -> int:
+        return await self._asafe(self._backend.get_counter, f"rc:gen:{namespace}", default=0)
+
+    def invalidate(self, namespace: str = FEED) -> None:
+        """世代番号を進めて、これまでのキャッシュを参照されなくする（DB の commit 後に呼ぶ）"""
+        if not self._enabled:
+            return
+        self._invalidations += 1
+        self._safe(self._backend.incr, f"rc:gen:{namespace}")
+
+    async def ainvalidate(self, namespace: str = FEED) -> None:
+        """invalidate の async 版（async のエンドポイントから呼ぶ）"""
+        if not self._enabled:
+            return
+        self._invalidations += 1
+        await self._asafe(self._backend.incr, f"rc:gen:{namespace}")
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._coalesced + self._misses
+        return {
+            "enabled": self._enabled,
+            "backend": self._backend.name,
+            "entries": self._safe(self._backend.size),
+            "ttl_seconds": self._ttl,
+            "hits": self._hits,
+            "coalesced": self._coalesced,
+            "misses": self._misses,
+            "hit_ratio": round((self._hits + self._coalesced) / lookups, 3) if lookups else None,
+            "not_modified": self._not_modified,
+            "invalidations": self._invalidations,
+            "errors": self._errors,
+            "generation": self.generation(),
+        }
+
+
+_backend = create_backend()
+response_cache = ResponseCache(
+    _backend,
+    ttl=RESPONSE_CACHE_TTL_SECONDS,
+    lock_seconds=RESPONSE_CACHE_LOCK_SECONDS,
+    enabled=cache_enabled(_backend),
+)
@@ -0,0 +1,123 @@
+"""
+記事の全文検索（PostgreSQL tsvector + 文字バイグラム）
+
+日本語は単語の区切りがないため、PostgreSQL 標準のテキスト検索設定では
+うまく分かち書きできない。ここでは本文を文字バイグラム（2文字ずつ）に分解し、
+位置情報付きの tsvector として articles.search_vector に保存する（GINインデックス）。
+
+検索語も同じ規則でバイグラムに分解し、隣接演算子（<->）でつないだ tsquery にするので、
+「東京都」は「東京」「京都」が連続して現れる記事だけに一致する。
+1文字の検索語は、その文字で始まるバイグラムと語末の1文字（単独で保存）に前方一致させる。
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import cast, func, literal
+from sqlalchemy.dialects.postgresql import TSQUERY, TSVECTOR
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100  # 1リクエストで返す最大件数
+SEARCH_MAX_RESULTS = 1000  # offset + limit の上限（深いページングを禁止）
+
+# tsvector の制約（位置は 16383 まで、1語あたり位置は 256 個まで）
+_MAX_POSITION = 16383
+_MAX_POSITIONS_PER_LEXEME = 256
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """全角・半角や大文字・小文字の違いをそろえる"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def split_runs(text: str) -> List[str]:
+    """記号・空白で区切られた文字の連続"""
+    return _WORD_RE.findall(normalize(text))
+
+
+def _run_tokens(run: str) -> List[str]:
+    """1つの連続文字列をバイグラムに分解（語末の1文字も単独で含める）"""
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def tokenize(text: str) -> List[str]:
+    """検索用のトークン列（バイグラム + 語末の1文字）"""
+    tokens: List[str] = []
+    for run in split_runs(text):
+        tokens.extend(_run_tokens(run))
+    return tokens
+
+
+def _quote(lexeme: str) -> str:
+    return "'" + lexeme.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def search_document(title: Optional[str], content: Optional[str], categories: Optional[Iterable[str]]) -> str:
+    """
+    tsvector の入力形式（'東京':1A,2A '京都':2A ...）の文字列を作成
+    重み: タイトル A / カテゴリ B / 本文 D
+    """
+    positions: Dict[str, List[str]] = {}
+    position = 1
+
+    def add(text: str, weight: str) -> None:
+        nonlocal position
+        for run in split_runs(text):
+            bigrams = run[:-1]  # 各文字がバイグラムの先頭になる位置
+            for i in range(len(bigrams)):
+                _add_position(positions, run[i:i + 2], position, weight)
+                position += 1
+            # 語末の1文字は最後のバイグラムと同じ位置に置く
+            _add_position(positions, run[-1], max(position - 1, 1) if bigrams else position, weight)
+            if not bigrams:
+                position += 1
+            position += 1  # 連続文字列の境目は隣接させない
+
+    add(title or "", "A")
+    add(" ".join(categories or []), "B")
+    add(content or "", "")
+
+    return " ".join(
+        f"{_quote(lexeme)}:{','.join(items)}" for lexeme, items in positions.items()
+    )
+
+
+def _add_position(positions: Dict[str, List[str]], lexeme: str, position: int, weight: str) -> None:
+    items = positions.setdefault(lexeme, [])
+    if len(items) < _MAX_POSITIONS_PER_LEXEME:
+        items.append(f"{min(position, _MAX_POSITION)}{weight}")
+
+
+def search_vector(title: Optional[str], content: Optional[str], categories: Optional[Iterable[str]]):
+    """articles.search_vector に代入する SQL 式"""
+    return cast(literal(search_document(title, content, categories)), TSVECTOR)
+
+
+def build_tsquery(query: str) -> Optional[str]:
+    """
+    検索語を tsquery の入力形式に変換（検索できる文字がなければ None）
+    空白区切りの各語は AND、語の中のバイグラムは隣接（<->）でつなぐ
+    """
+    terms = []
+    for run in dict.fromkeys(split_runs(query)):
+        if len(run) == 1:
+            terms.append(f"{_quote(run)}:*")
+        else:
+            bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+            terms.append("(" + " <-> ".join(_quote(b) for b in bigrams) + ")")
+    return " & ".join(terms) if terms else None
+
+
+def search_filter(column, tsquery: str) -> Tuple:
+    """(一致条件, 関連度) の SQL 式"""
+    q = cast(literal(tsquery), TSQUERY)
+    return column.bool_op("@@")(q), func.ts_rank_cd(column, q)
+
+
+def clamp_page(limit: Optional[int], offset: Optional[int]) -> Tuple[int, int]:
+    """ページング指定を上限内に収める"""
+    limit = max(1, min(limit or SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT))
+    offset = max(0, min(offset or 0, SEARCH_MAX_RESULTS - limit))
+    return limit, offset
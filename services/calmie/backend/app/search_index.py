@@ -0,0 +1,354 @@
+"""
+プロセス内の転置インデックスによる記事検索（任意機能）
+
+SEARCH_INDEX_ENABLED=true のとき、公開中の記事のタイトル・カテゴリ・本文を
+app.search と同じ文字バイグラムに分解してメモリ上の転置インデックスに載せ、
+/search を BM25 スコア順で返す。無効なとき、または構築前は PostgreSQL の
+全文検索（articles.search_vector）をそのまま使う。
+
+- ポスティングリストは記事ID昇順の array('I') と、同じ並びの出現回数 array('I')
+- 投稿・編集・削除をコミットした時点でそのワーカーのインデックスを更新し、
+  他のワーカーでの変更は articles.updated_at を定期的に確認して取り込む
+- インデックスはディスクにスナップショットとして保存し、起動時に読み込んでから差分だけ取り込む
+"""
+import math
+import os
+import pickle
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.database import SessionLocal
+from app.models import Article, PublicStatus
+from app.search import split_runs, tokenize
+
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "false").lower() == "true"
+SEARCH_INDEX_SNAPSHOT = os.getenv("SEARCH_INDEX_SNAPSHOT", "search_index.snapshot")
+SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "30"))
+# 他のワーカーのコミットが updated_at の順に届かない場合に備えて、少し前から読み直す
+SEARCH_INDEX_SYNC_OVERLAP = timedelta(seconds=60)
+
+# BM25 のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# フィールドごとの重み（出現回数に掛ける）
+TITLE_WEIGHT = 3
+CATEGORY_WEIGHT = 2
+CONTENT_WEIGHT = 1
+
+_SNAPSHOT_VERSION = 1
+_BUILD_BATCH_SIZE = 1000
+
+
+def _term_frequencies(title: Optional[str], content: Optional[str], categories: Optional[Iterable[str]]) -> Dict[str, int]:
+    """フィールドの重みを掛けたトークンごとの出現回数"""
+    frequencies: Dict[str, int] = {}
+    for text, weight in (
+        (title or "", TITLE_WEIGHT),
+        (" ".join(categories or []), CATEGORY_WEIGHT),
+        (content or "", CONTENT_WEIGHT),
+    ):
+        for token in tokenize(text):
+            frequencies[token] = frequencies.get(token, 0) + weight
+    return frequencies
+
+
+class InvertedIndex:
+    """記事IDの転置インデックス（BM25）"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # token -> (記事ID昇順の array, 同じ並びの出現回数 array)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        # 記事ID -> (文書長, トークン一覧)。更新・削除時に古いポスティングを消すために使う
+        self._documents: Dict[int, Tuple[int, Tuple[str, ...]]] = {}
+        # 先頭文字 -> トークン（1文字の検索語を前方一致させるため）
+        self._prefixes: Dict[str, Set[str]] = {}
+        self._total_length = 0
+        self.synced_at: Optional[datetime] = None  # 取り込み済みの articles.updated_at の最大値
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, article_id: int, title: Optional[str], content: Optional[str], categories: Optional[Iterable[str]]) -> None:
+        """記事を追加（既にあれば置き換え）"""
+        frequencies = _term_frequencies(title, content, categories)
+        with self._lock:
+            self._remove(article_id)
+            for token, frequency in frequencies.items():
+                ids, freqs = self._postings.get(token) or self._new_posting(token)
+                i = bisect_left(ids, article_id)
+                ids.insert(i, article_id)
+                freqs.insert(i, frequency)
+            length = sum(frequencies.values())
+            self._documents[article_id] = (length, tuple(frequencies))
+            self._total_length += length
+
+    def remove(self, article_id: int) -> None:
+        """記事を削除"""
+        with self._lock:
+            self._remove(article_id)
+
+    def _new_posting(self, token: str) -> Tuple[array, array]:
+        posting = (array("I"), array("I"))
+        self._postings[token] = posting
+        self._prefixes.setdefault(token[0], set()).add(token)
+        return posting
+
+    def _remove(self, article_id: int) -> None:
+        document = self._documents.pop(article_id, None)
+        if document is None:
+            return
+        length, tokens = document
+        self._total_length -= length
+        for token in tokens:
+            ids, freqs = self._postings[token]
+            i = bisect_left(ids, article_id)
+            if i < len(ids) and ids[i] == article_id:
+                del ids[i]
+                del freqs[i]
+            if not ids:
+                del self._postings[token]
+                self._prefixes[token[0]].discard(token)
+
+    def _query_groups(self, query: str) -> List[List[str]]:
+        """
+        検索語をトークンのグループに分解
+        グループ同士は AND、グループ内は OR（1文字の語は前方一致で複数のトークンになる）
+        """
+        groups = []
+        for run in dict.fromkeys(split_runs(query)):
+            if len(run) == 1:
+                groups.append(sorted(self._prefixes.get(run, ())))
+            else:
+                groups.extend([run[i:i + 2]] for i in range(len(run) - 1))
+        return groups
+
+    def search(self, query: str, limit: int, offset: int = 0) -> List[Tuple[int, float]]:
+        """BM25 スコアの高い順に (記事ID, スコア) を返す"""
+        with self._lock:
+            groups = self._query_groups(query)
+            if not groups or not self._documents:
+                return []
+
+            count = len(self._documents)
+            average_length = self._total_length / count
+            scores: Optional[Dict[int, float]] = None
+
+            # 件数の少ないグループから絞り込む
+            for group in sorted(groups, key=lambda tokens: sum(len(self._postings[t][0]) for t in tokens if t in self._postings)):
+                group_scores: Dict[int, float] = {}
+                for token in group:
+                    posting = self._postings.get(token)
+                    if not posting:
+                        continue
+                    ids, freqs = posting
+                    idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+                    if scores is None:
+                        candidates = zip(ids, freqs)
+                    else:
+                        candidates = self._lookup(ids, freqs, scores)
+                    for article_id, frequency in candidates:
+                        length = self._documents[article_id][0]
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                        score = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                        group_scores[article_id] = group_scores.get(article_id, 0.0) + score
+
+                if scores is None:
+                    scores = group_scores
+                else:
+                    scores = {
+                        article_id: scores[article_id] + score
+                        for article_id, score in group_scores.items()
+                    }
+                if not scores:
+                    return []
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+            return ranked[offset:offset + limit]
+
+    @staticmethod
+    def _lookup(ids: array, freqs: array, candidates: Dict[int, float]):
+        """候補の記事IDのうちポスティングに含まれるものを二分探索で探す"""
+        for article_id in candidates:
+            i = bisect_left(ids, article_id)
+            if i < len(ids) and ids[i] == article_id:
+                yield article_id, freqs[i]
+
+    def save(self, path: str) -> None:
+        """スナップショットをディスクに保存（一時ファイルに書いてから置き換える）"""
+        with self._lock:
+            state = {
+                "version": _SNAPSHOT_VERSION,
+                "postings": self._postings,
+                "documents": self._documents,
+                "total_length": self._total_length,
+                "synced_at": self.synced_at,
+            }
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["InvertedIndex"]:
+        """スナップショットを読み込む（ないか形式が古い場合は None）"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != _SNAPSHOT_VERSION:
+            return None
+        index = cls()
+        index._postings = state["postings"]
+        index._documents = state["documents"]
+        index._total_length = state["total_length"]
+        index.synced_at = state["synced_at"]
+        for token in index._postings:
+            index._prefixes.setdefault(token[0], set()).add(token)
+        return index
+
+
+def _is_searchable(article: Article) -> bool:
+    return article.deleted_at is None and article.public_status == PublicStatus.public
+
+
+class SearchIndexService:
+    """インデックスの構築・スナップショット・他ワーカーの変更の取り込みを管理する"""
+
+    def __init__(self, enabled: bool, snapshot_path: str, refresh_interval: float):
+        self.enabled = enabled
+        self._snapshot_path = snapshot_path
+        self._refresh_interval = refresh_interval
+        self._index: Optional[InvertedIndex] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self._index is not None
+
+    def start(self) -> None:
+        """スナップショット（なければDB）からインデックスを作成し、差分取り込みスレッドを開始"""
+        if not self.enabled:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="search-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """差分取り込みを止めてスナップショットを保存"""
+        if not self.enabled:
+            return
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=self._refresh_interval + 5)
+            self._thread = None
+        if self._index is not None:
+            try:
+                self._index.save(self._snapshot_path)
+            except Exception as e:
+                print(f"❌ 検索インデックス保存エラー: {e}")
+
+    def _run(self) -> None:
+        try:
+            self._load_or_build()
+        except Exception as e:
+            self._last_error = str(e)
+            print(f"❌ 検索インデックス構築エラー: {e}")
+            return
+        while not self._stopping.wait(self._refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self._last_error = str(e)
+                print(f"❌ 検索インデックス更新エラー: {e}")
+
+    def _load_or_build(self) -> None:
+        started = time.monotonic()
+        index = None
+        try:
+            index = InvertedIndex.load(self._snapshot_path)
+        except Exception as e:
+            print(f"⚠️ 検索インデックスのスナップショットを読み込めません: {e}")
+
+        if index is None:
+            index = InvertedIndex()
+            self._apply_changes(index, since=None)
+            index.save(self._snapshot_path)
+            print(f"✅ 検索インデックス構築完了: {len(index)}件 ({time.monotonic() - started:.1f}秒)")
+        else:
+            # スナップショット以降の変更を取り込む
+            self._apply_changes(index, since=index.synced_at)
+            print(f"✅ 検索インデックス読み込み完了: {len(index)}件 ({time.monotonic() - started:.1f}秒)")
+        self._index = index
+
+    def _apply_changes(self, index: InvertedIndex, since: Optional[datetime]) -> None:
+        """updated_at が since より新しい記事をインデックスに反映"""
+        db = SessionLocal()
+        try:
+            last_id = 0
+            while True:
+                query = db.query(
+                    Article.id, Article.title, Article.content, Article.category,
+                    Article.public_status, Article.deleted_at, Article.updated_at,
+                ).filter(Article.id > last_id)
+                if since is not None:
+                    query = query.filter(Article.updated_at > since - SEARCH_INDEX_SYNC_OVERLAP)
+                rows = query.order_by(Article.id).limit(_BUILD_BATCH_SIZE).all()
+                if not rows:
+                    break
+                for row in rows:
+                    if _is_searchable(row):
+                        index.add(row.id, row.title, row.content, row.category)
+                    else:
+                        index.remove(row.id)
+                    if row.updated_at and (index.synced_at is None or row.updated_at > index.synced_at):
+                        index.synced_at = row.updated_at
+                last_id = rows[-1].id
+        finally:
+            db.close()
+
+    def refresh(self) -> None:
+        """他のワーカーで投稿・編集された記事を取り込む"""
+        if self._index is not None:
+            self._apply_changes(self._index, since=self._index.synced_at)
+
+    def index_article(self, article: Article) -> None:
+        """記事の投稿・編集のコミット後に呼ぶ"""
+        if not self.ready:
+            return
+        if _is_searchable(article):
+            self._index.add(article.id, article.title, article.content, article.category)
+        else:
+            self._index.remove(article.id)
+
+    def remove_article(self, article_id: int) -> None:
+        """記事の削除のコミット後に呼ぶ"""
+        if self.ready:
+            self._index.remove(article_id)
+
+    def search(self, query: str, limit: int, offset: int = 0) -> List[int]:
+        """関連度順の記事ID"""
+        return [article_id for article_id, _ in self._index.search(query, limit, offset)]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "documents": len(self._index) if self._index is not None else 0,
+            "synced_at": self._index.synced_at if self._index is not None else None,
+            "last_error": self._last_error,
+        }
+
+
+search_index = SearchIndexService(
+    enabled=SEARCH_INDEX_ENABLED,
+    snapshot_path=SEARCH_INDEX_SNAPSHOT,
+    refresh_interval=SEARCH_INDEX_REFRESH_SECONDS,
+)
@@ -0,0 +1,56 @@
+"""
+記事一覧用の要約（articles.summary）と一覧の項目の絞り込み（fields=）
+
+一覧系のエンドポイント（/・/articles・ランキング・トレンド・/search）は、
+画面には抜粋しか表示しないのに記事ごとに本文（Markdown 全体）を返していた。
+ここでは OGP の説明文（get_article_html）と同じ規則で Markdown 記号を除いた先頭部分を
+記事の投稿・編集時に articles.summary に保存しておき、一覧では本文を読み込まずに要約だけを返す。
+
+一覧のクエリには LIST_OPTIONS を付けて本文を読み込まない（誤って参照すると例外になる）。
+fields=id,title,summary のように指定すると、各記事の項目をその項目だけに絞る。
+"""
+import re
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import defer
+
+from app.models import Article
+
+SUMMARY_LENGTH = 150
+
+# 一覧では本文を読み込まない（要約は articles.summary）
+LIST_OPTIONS = (defer(Article.content, raiseload=True),)
+
+
+def strip_markdown(content: Optional[str]) -> str:
+    """Markdown 記号とメディアの埋め込みを除いて1行にする"""
+    text = content or ""
+    text = re.sub(r'!\[Media\]\([^)]*\)', '', text)  # ![Media](URL)を除去
+    text = re.sub(r'[#*`_\[\]()!]', '', text)  # Markdown記号を除去
+    text = re.sub(r'\n+', ' ', text)  # 改行をスペースに変換
+    return re.sub(r'\s+', ' ', text).strip()  # 複数スペースを1つに
+
+
+def make_summary(content: Optional[str]) -> str:
+    """本文の要約（記号を除いた先頭 SUMMARY_LENGTH 文字）"""
+    text = strip_markdown(content)
+    return text[:SUMMARY_LENGTH] + '...' if len(text) > SUMMARY_LENGTH else text
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """fields=（カンマ区切り）を項目名のリストにする（未指定は None、知らない項目は 400）"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"指定できない項目です: {', '.join(unknown)}")
+    return names
+
+
+def pick_fields(items: List[Dict], fields: Optional[List[str]]) -> List[Dict]:
+    """各記事の項目を fields だけに絞る（None なら全項目）"""
+    if fields is None:
+        return items
+    return [{name: item[name] for name in fields} for item in items]
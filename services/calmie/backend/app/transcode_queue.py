@@ -0,0 +1,147 @@
+"""
+動画トランスコードのジョブキュー（transcode_jobs テーブル）
+
+ffmpeg による変換は 100MB の動画で数分かかることもあり、リクエスト内で実行すると
+ワーカーを占有したうえに nginx の proxy_read_timeout（60秒）を超えてしまう。
+アップロード時は元ファイルを保存してジョブを登録するだけにして、すぐにレスポンスを返す。
+変換は transcode_worker.py が別プロセスで行い、完了したら元ファイルを変換後のファイルで置き換える。
+
+ジョブの取り出しは SELECT ... FOR UPDATE SKIP LOCKED で行うので、
+ワーカーを複数起動しても同じジョブを二重に処理しない。
+ワーカーが処理中に落ちた場合は locked_at から一定時間経過したジョブを再度取り出す。
+
+動画は内容のハッシュで保存される（media_store）ため、同じ動画を参照する MediaFile が
+複数あることがある。ジョブの完了・失敗時は同じファイルを参照している処理中のメディアもまとめて更新する。
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from app.models import MediaFile, TranscodeJob
+from app.uploads import ALLOWED_EXTENSIONS, IMAGE_EXTENSIONS
+
+# 受け付ける拡張子のうち画像以外（受け付けない拡張子を入れても変換されることはない）
+VIDEO_EXTENSIONS = [extension for extension in ALLOWED_EXTENSIONS if extension not in IMAGE_EXTENSIONS]
+
+TRANSCODE_MAX_ATTEMPTS = int(os.getenv("TRANSCODE_MAX_ATTEMPTS", "3"))
+TRANSCODE_LOCK_TIMEOUT_SECONDS = int(os.getenv("TRANSCODE_LOCK_TIMEOUT_SECONDS", "3600"))  # これを過ぎた処理中ジョブは再取得
+
+
+def enqueue_transcode(db: Session, source_path: str, media: Optional[MediaFile] = None) -> TranscodeJob:
+    """トランスコードジョブを登録（commit は呼び出し側で行う）"""
+    now = datetime.utcnow()
+    job = TranscodeJob(
+        media_id=media.id if media is not None else None,
+        source_path=os.path.abspath(source_path),
+        status="queued",
+        attempts=0,
+        created_at=now,
+        updated_at=now,
+    )
+    if media is not None:
+        media.status = "processing"
+        media.updated_at = now
+    db.add(job)
+    return job
+
+
+def latest_transcode(db: Session, source_path: str) -> Optional[TranscodeJob]:
+    """
+    同じファイルの最新のジョブ（なければ None）
+    同じ内容の動画が再アップロードされたときに、そのファイルの変換状況（失敗を含む）を返すために使う
+    """
+    return (
+        db.query(TranscodeJob)
+        .filter(TranscodeJob.source_path == os.path.abspath(source_path))
+        .order_by(TranscodeJob.id.desc())
+        .first()
+    )
+
+
+def _job_media(db: Session, job: TranscodeJob) -> list:
+    """ジョブの対象メディアと、同じファイルを参照している処理中のメディア"""
+    return (
+        db.query(MediaFile)
+        .filter(or_(
+            MediaFile.id == job.media_id,
+            and_(
+                MediaFile.stored_filename == os.path.basename(job.source_path),
+                MediaFile.status == "processing",
+            ),
+        ))
+        .all()
+    )
+
+
+def claim_job(db: Session) -> Optional[TranscodeJob]:
+    """未処理のジョブを1件取り出して processing にする（他のワーカーが処理中のものは飛ばす）"""
+    now = datetime.utcnow()
+    job = db.execute(
+        select(TranscodeJob)
+        .where(or_(
+            TranscodeJob.status == "queued",
+            and_(
+                TranscodeJob.status == "processing",
+                TranscodeJob.locked_at < now - timedelta(seconds=TRANSCODE_LOCK_TIMEOUT_SECONDS),
+            ),
+        ))
+        .order_by(TranscodeJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar_one_or_none()
+    if job is None:
+        db.rollback()
+        return None
+
+    job.status = "processing"
+    job.attempts += 1
+    job.locked_at = now
+    job.updated_at = now
+    db.commit()
+    return job
+
+
+def complete_job(db: Session, job: TranscodeJob, file_size: int) -> None:
+    """変換成功（メディアのサイズと状態も更新）"""
+    now = datetime.utcnow()
+    job.status = "done"
+    job.last_error = None
+    job.finished_at = now
+    job.updated_at = now
+    for media in _job_media(db, job):
+        media.status = "ready"
+        media.file_size = file_size
+        media.updated_at = now
+    db.commit()
+
+
+def fail_job(db: Session, job: TranscodeJob, error: str) -> None:
+    """変換失敗（上限回数までは再試行、それ以降は元ファイルのまま failed にする）"""
+    now = datetime.utcnow()
+    job.last_error = error[-2000:]
+    job.updated_at = now
+    if job.attempts < TRANSCODE_MAX_ATTEMPTS:
+        job.status = "queued"
+        job.locked_at = None
+    else:
+        job.status = "failed"
+        job.finished_at = now
+        for media in _job_media(db, job):
+            media.status = "failed"
+            media.updated_at = now
+    db.commit()
+
+
+def job_status(job: TranscodeJob) -> dict:
+    return {
+        "job_id": job.id,
+        "media_id": job.media_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.last_error if job.status == "failed" else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
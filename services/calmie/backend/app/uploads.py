@@ -0,0 +1,93 @@
+"""
+アップロードファイルの受け取り（ストリーミング保存）
+
+await file.read() でファイル全体を読み込むと、100MB の動画ならその分だけメモリを使い、
+BytesIO にコピーするとさらに倍になる。同時アップロードが数件重なるだけで
+コンテナのメモリ使用量が数百MB跳ね上がっていた。
+
+ここではアップロードを 1MB ずつ読みながら保存先と同じディレクトリの一時ファイルに書き込み、
+同時に SHA-256 を計算してサイズ上限を確認する。保存が完了したら os.replace で
+本来のファイル名に置き換えるので、書き込み途中のファイルが配信されることはない。
+画像の変換もこの一時ファイルを直接開いて行う（バイト列としてメモリに載せない）。
+"""
+import hashlib
+import os
+import tempfile
+from typing import Optional
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+UPLOAD_FILE_MODE = 0o644  # 保存したファイルのパーミッション
+
+# アップロードを受け付ける拡張子（画像以外は動画として変換ジョブを登録する、app/transcode_queue.py）
+IMAGE_EXTENSIONS = ["jpg", "jpeg", "png"]
+ALLOWED_EXTENSIONS = IMAGE_EXTENSIONS + ["mp4", "mov", "avi", "webm"]  # .mov を許可
+
+
+class StoredUpload:
+    """一時ファイルに保存済みのアップロード（with を抜けるまでに commit しなければ削除）"""
+
+    def __init__(self, temp_path: str, size: int, sha256: str):
+        self.temp_path: Optional[str] = temp_path
+        self.size = size
+        self.sha256 = sha256
+
+    @property
+    def path(self) -> str:
+        """一時ファイルのパス（画像変換などの入力に使う）"""
+        if self.temp_path is None:
+            raise RuntimeError("upload has already been committed or discarded")
+        return self.temp_path
+
+    def commit(self, dest_path: str) -> str:
+        """一時ファイルを保存先のファイル名に置き換える（同じディレクトリ内なのでアトミック）"""
+        os.chmod(self.path, UPLOAD_FILE_MODE)  # mkstemp は 0600 で作成するため、nginx からも読めるようにする
+        os.replace(self.path, dest_path)
+        self.temp_path = None
+        return dest_path
+
+    def discard(self) -> None:
+        if self.temp_path is not None:
+            try:
+                os.remove(self.temp_path)
+            except FileNotFoundError:
+                pass
+            self.temp_path = None
+
+    def __enter__(self) -> "StoredUpload":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.discard()
+
+
+async def receive_upload(file: UploadFile, directory: str, max_bytes: int) -> StoredUpload:
+    """
+    アップロードを一時ファイルに書き込みながら SHA-256 とサイズを計算
+    max_bytes を超えた時点で書き込みを中止して 413
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=directory)
+    os.close(fd)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        await file.seek(0)
+        async with aiofiles.open(temp_path, "wb") as out_file:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"ファイルサイズが大きすぎます。（最大{max_bytes // (1024 * 1024)}MB）",
+                    )
+                digest.update(chunk)
+                await out_file.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    return StoredUpload(temp_path, size, digest.hexdigest())
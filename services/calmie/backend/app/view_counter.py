@@ -0,0 +1,249 @@
+"""
+閲覧数の書き込みバッファ（write-behind）
+
+GET /articles/{id} のたびに history_rating を UPDATE・COMMIT すると、
+人気記事の閲覧が同じ行ロックで直列化されてしまう。
+ここでは記事ごとの加算値をメモリ上に貯めておき、一定間隔または
+一定件数ごとに `access_count = access_count + n` の一括UPDATEで反映する。
+同じトランザクションで article_access_events に記事ごとの閲覧数を追記し、
+バッチ処理はこのログから日次・週次・月次のアクセス数を集計する。
+
+閲覧から反映までの間に記事が削除されることがあるため、書き込むのはまだ存在する記事の分だけにする。
+それでも整合性エラー（IntegrityError）になった場合は、キーを1件ずつ書き直して
+失敗したキーだけを捨てる（何度書いても失敗するキーでバッファ全体が止まらないようにする）。
+DB に接続できないなどそれ以外のエラーでは、加算値をバッファへ戻して次回に書き直す。
+戻すのは max_pending 件までで、超えた分と、max_attempts 回続けて失敗した加算値は捨てる
+（DB が止まっている間にメモリ上の加算値が増え続けないようにする）。
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import Integer, bindparam, exists, func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+
+from app.database import SessionLocal
+from app.models import Article, ArticleAccessEvent, HistoryRating
+
+VIEW_COUNTER_FLUSH_INTERVAL = float(os.getenv("VIEW_COUNTER_FLUSH_INTERVAL", "5"))  # 秒
+VIEW_COUNTER_MAX_PENDING = int(os.getenv("VIEW_COUNTER_MAX_PENDING", "1000"))  # この閲覧数を超えたら即時フラッシュ
+COUNTER_MAX_FLUSH_ATTEMPTS = int(os.getenv("COUNTER_MAX_FLUSH_ATTEMPTS", "5"))  # 続けて失敗したら加算値を捨てる回数
+
+
+class CounterBuffer:
+    """キーごとの加算値を貯めて、バックグラウンドスレッドでまとめて書き込む"""
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[Dict[int, int]], None],
+        interval_seconds: float,
+        max_pending: int,
+        max_attempts: int = COUNTER_MAX_FLUSH_ATTEMPTS,
+    ):
+        self.name = name
+        self._flush_fn = flush_fn
+        self._interval = interval_seconds
+        self._max_pending = max_pending
+        self._max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[int, int] = {}
+        self._pending_total = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # メトリクス
+        self._flushed_total = 0
+        self._flush_count = 0
+        self._failure_count = 0
+        self._consecutive_failures = 0  # 続けて失敗したフラッシュの回数（成功すると0に戻す）
+        self._dropped_total = 0  # 書き込めずに捨てた加算値
+        self._last_flush_at: Optional[datetime] = None
+        self._last_flush_ms = 0.0
+        self._last_error: Optional[str] = None
+
+    def add(self, key: int, amount: int = 1) -> None:
+        """加算値を記録（DBには書き込まない）"""
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + amount
+            self._pending_total += amount
+            should_flush = self._pending_total >= self._max_pending
+        if should_flush:
+            self._wakeup.set()
+
+    def pending(self, key: int) -> int:
+        """まだDBに反映されていない加算値"""
+        with self._lock:
+            return self._pending.get(key, 0)
+
+    def flush(self) -> int:
+        """貯まっている加算値をDBに反映し、反映した件数を返す"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                batch_total = self._pending_total
+                self._pending = {}
+                self._pending_total = 0
+
+            started = time.monotonic()
+            try:
+                self._flush_fn(batch)
+            except IntegrityError as e:
+                # 削除された行など、書き直しても失敗するキーが含まれている
+                self._failure_count += 1
+                self._last_error = str(e)
+                print(f"⚠️ {self.name} 整合性エラー、1件ずつ書き直します: {e}")
+                batch_total = self._flush_each(batch)
+            except Exception as e:
+                self._failure_count += 1
+                self._consecutive_failures += 1
+                self._last_error = str(e)
+                print(f"❌ {self.name} フラッシュエラー（{self._consecutive_failures}回目）: {e}")
+                if self._consecutive_failures >= self._max_attempts:
+                    # 書き直しても失敗し続けているので、貯めた加算値を捨てる
+                    self._drop(batch_total, f"{self._consecutive_failures}回続けて失敗")
+                    self._consecutive_failures = 0
+                else:
+                    # 失敗した分はバッファへ戻して次回に書き直す
+                    self._requeue(batch)
+                return 0
+
+            self._consecutive_failures = 0
+            self._flushed_total += batch_total
+            self._flush_count += 1
+            self._last_flush_at = datetime.utcnow()
+            self._last_flush_ms = (time.monotonic() - started) * 1000
+            return batch_total
+
+    def _requeue(self, batch: Dict[int, int]) -> None:
+        """書き込めなかった加算値をバッファへ戻す（max_pending を超える分は捨てる）"""
+        dropped = 0
+        with self._lock:
+            # 加算値の大きいキーから戻す
+            for key, amount in sorted(batch.items(), key=lambda item: item[1], reverse=True):
+                kept = min(amount, max(self._max_pending - self._pending_total, 0))
+                if kept:
+                    self._pending[key] = self._pending.get(key, 0) + kept
+                    self._pending_total += kept
+                dropped += amount - kept
+        if dropped:
+            self._drop(dropped, f"バッファの上限（{self._max_pending}件）を超過")
+
+    def _drop(self, amount: int, reason: str) -> None:
+        self._dropped_total += amount
+        print(f"🗑️ {self.name} 書き込めない加算値を破棄: {amount}件（{reason}）")
+
+    def _flush_each(self, batch: Dict[int, int]) -> int:
+        """キーごとに書き込み、整合性エラーのキーは捨てる（それ以外のエラーはバッファへ戻す）"""
+        written = 0
+        for key, amount in batch.items():
+            try:
+                self._flush_fn({key: amount})
+                written += amount
+            except IntegrityError as e:
+                self._dropped_total += amount
+                print(f"🗑️ {self.name} 書き込めないキーを破棄: {key}（{amount}件）: {e}")
+            except Exception as e:
+                self._requeue({key: amount})
+                self._last_error = str(e)
+        return written
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self) -> None:
+        """バックグラウンドのフラッシュスレッドを開始"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """スレッドを停止し、残っている加算値をすべて書き込む"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=self._interval + 5)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        """バッファの状態（未反映の件数など）"""
+        with self._lock:
+            pending_keys = len(self._pending)
+            pending_total = self._pending_total
+        return {
+            "name": self.name,
+            "pending_keys": pending_keys,
+            "pending_total": pending_total,
+            "flushed_total": self._flushed_total,
+            "flush_count": self._flush_count,
+            "failure_count": self._failure_count,
+            "consecutive_failures": self._consecutive_failures,
+            "max_attempts": self._max_attempts,
+            "dropped_total": self._dropped_total,
+            "last_flush_at": self._last_flush_at,
+            "last_flush_ms": round(self._last_flush_ms, 2),
+            "last_error": self._last_error,
+            "flush_interval_seconds": self._interval,
+            "max_pending": self._max_pending,
+            "running": bool(self._thread and self._thread.is_alive()),
+        }
+
+
+def flush_view_counts(increments: Dict[int, int]) -> None:
+    """history_rating.access_count に閲覧数を一括加算し、閲覧ログに追記（削除済みの記事は除く）"""
+    table = HistoryRating.__table__
+    article_id = bindparam("b_article_id", type_=Integer)
+    amount = bindparam("b_amount", type_=Integer)
+    # history_rating がまだない記事（HTMLページのみ閲覧された記事など）は作成する
+    # INSERT ... SELECT にして、閲覧後に削除された記事は書き込まない（外部キーのエラーを避ける）
+    stmt = pg_insert(table).from_select(
+        ["article_id", "access_count", "like_count", "super_like_count"],
+        select(Article.id, amount, literal(0), literal(0)).where(Article.id == article_id),
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_history_rating_article_id",
+        set_={"access_count": func.coalesce(table.c.access_count, 0) + stmt.excluded.access_count},
+    )
+    # 閲覧ログには外部キーがないので、削除済みの記事の分は条件で除く
+    event_stmt = ArticleAccessEvent.__table__.insert().from_select(
+        ["article_id", "views", "viewed_at"],
+        select(article_id, amount, bindparam("b_viewed_at")).where(exists().where(Article.id == article_id)),
+    )
+    viewed_at = datetime.utcnow()
+    params = [
+        {"b_article_id": key, "b_amount": value, "b_viewed_at": viewed_at}
+        for key, value in sorted(increments.items())  # ロック順を固定してデッドロックを避ける
+    ]
+
+    db = SessionLocal()
+    try:
+        db.execute(stmt, params)
+        db.execute(event_stmt, params)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+view_counter = CounterBuffer(
+    name="view-counter",
+    flush_fn=flush_view_counts,
+    interval_seconds=VIEW_COUNTER_FLUSH_INTERVAL,
+    max_pending=VIEW_COUNTER_MAX_PENDING,
+)
@@ -5,24 +5,41 @@
 このスクリプトは以下の処理を行います：
 1. 日次・週次・月次の統計データを更新
 2. トレンドデータの計算
-3. ランキングデータの生成
+3. ランキングデータの生成（ranking_snapshots に保存）
+4. 記事のコメント数（articles.comment_count）のずれを修正
+
+通常は前回実行からの差分のみを集計します（batch_watermarks に処理済み位置を記録）。
+イベントの ID は INSERT 時に採番され、COMMIT 時に見えるようになるため、
+集計の基準時刻は現在時刻から EVENT_SETTLE_SECONDS 前とし、それより前に発生したイベントまでを処理済みにします
+（基準時刻の時点でまだ COMMIT されていないイベントを読み飛ばさないため）。
 
 実行方法:
 python batch_update_stats.py
 
+# コメント数の整合性チェックのみ実行
+python batch_update_stats.py --reconcile-comments
+
+# 差分集計を使わず全期間から再集計
+python batch_update_stats.py --full
+
 cronでの定期実行推奨:
 # 毎時間実行
 0 * * * * /usr/bin/python3 /path/to/batch_update_stats.py
 
-# 毎日午前2時に実行
-0 2 * * * /usr/bin/python3 /path/to/batch_update_stats.py
+# 毎日午前2時に全件再集計（差分集計のずれを補正）
+0 2 * * * /usr/bin/python3 /path/to/batch_update_stats.py --full
 """
 
 import sys
 import os
+import argparse
 from datetime import datetime, timedelta
+from typing import Dict, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import (
+    func, and_, or_, text, true, select, insert, update, delete, exists, literal, union_all, TIMESTAMP
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 # パスを追加してappモジュールをインポート
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -31,236 +48,286 @@ from app.database import SessionLocal, engine
 from app import models
 from app.models import (
     Article, User, ArticleLike, ArticleComment, 
-    AggregatePoints, DailyRating, HistoryRating,
+    AggregatePoints, DailyRating, HistoryRating, BatchWatermark, ArticleAccessEvent,
     PublicStatus, TargetType
 )
+from app.ranking import publish_ranking_snapshots
 
-def get_db():
-    """データベースセッションを取得"""
-    db = SessionLocal()
-    try:
-        return db
-    except Exception as e:
-        print(f"データベース接続エラー: {e}")
-        return None
+# 差分集計で扱うスライディングウィンドウ
+STATS_WINDOWS = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(days=7),
+    "monthly": timedelta(days=30),
+}
+
+# 処理済み位置を記録するイベントテーブル
+EVENT_TABLES = {
+    "article_likes": ArticleLike,
+    "article_comments": ArticleComment,
+    "article_access_events": ArticleAccessEvent,
+}
+
+# 閲覧ログのパーティション（月単位）の保持期間
+ACCESS_EVENT_RETENTION_MONTHS = int(os.getenv("ACCESS_EVENT_RETENTION_MONTHS", "3"))
+ACCESS_EVENT_PARTITIONS_AHEAD = 2  # 何か月先までパーティションを作成しておくか
+
+# 集計の基準時刻を現在時刻からどれだけ遅らせるか（秒）
+# イベントを書き込むトランザクションの所要時間より十分長くする
+EVENT_SETTLE_SECONDS = int(os.getenv("EVENT_SETTLE_SECONDS", "300"))
+
+def public_article_ids():
+    """集計対象（公開中・未削除）の記事ID"""
+    return select(Article.id).where(
+        Article.deleted_at.is_(None),
+        Article.public_status == PublicStatus.public
+    )
+
+def up_to(model, max_id: Optional[int]):
+    """バッチ開始時点までに作成されたイベントに限定する条件"""
+    return model.id <= max_id if max_id is not None else true()
 
-def update_daily_stats(db: Session):
+def event_time(model):
+    """イベントの発生時刻の列"""
+    return model.viewed_at if model is ArticleAccessEvent else model.created_at
+
+def event_amount(model, condition):
+    """条件に合うイベントの件数（閲覧ログは views の合計）"""
+    if model is ArticleAccessEvent:
+        return func.coalesce(func.sum(model.views).filter(condition), 0)
+    return func.count().filter(condition)
+
+def live_events(model):
+    """削除されていないイベントの条件"""
+    return model.deleted_at.is_(None) if hasattr(model, "deleted_at") else true()
+
+def period_counts_subquery(model, start: datetime, end: Optional[datetime], max_id: Optional[int] = None):
+    """[start, end) に発生したイベント数を記事ごとに集計（end が None なら start 以降すべて）"""
+    occurred = event_time(model)
+    return select(
+        model.article_id.label("article_id"),
+        event_amount(model, true()).label("cnt"),
+    ).where(
+        occurred >= start,
+        occurred < end if end is not None else true(),
+        live_events(model),
+        up_to(model, max_id)
+    ).group_by(model.article_id).subquery(f"{model.__tablename__}_period")
+
+def window_counts_subquery(model, now: datetime, max_id: Optional[int] = None, with_total: bool = True):
+    """
+    記事ごとのイベント数を期間別に1回の GROUP BY で集計
+    （COUNT(*) FILTER (WHERE ...) で日次・週次・月次・総合を同時に数える）
+    with_total=False の場合は最長のウィンドウ内だけを読む（閲覧ログのパーティションを絞り込む）
+    """
+    occurred = event_time(model)
+    columns = [
+        model.article_id.label("article_id"),
+        *[
+            event_amount(model, occurred >= now - window).label(period)
+            for period, window in STATS_WINDOWS.items()
+        ],
+    ]
+    conditions = [live_events(model), up_to(model, max_id)]
+    if with_total:
+        columns.append(event_amount(model, true()).label("total"))
+    else:
+        conditions.append(occurred >= now - max(STATS_WINDOWS.values()))
+
+    return select(*columns).where(*conditions).group_by(model.article_id).subquery(f"{model.__tablename__}_counts")
+
+def event_delta_subquery(model, last_id: int, max_id: int, prev_run: datetime, now: datetime):
+    """
+    前回実行からの増減を記事ごとに集計（差分集計用）
+
+    ウィンドウごとの増減 = 新しいイベント（last_id < id <= max_id）のうちウィンドウ内のもの
+                         - 集計済みイベントのうち前回から今回の間にウィンドウから外れたもの
+    読み込むのは新しいイベントと [prev_run - W, now - W) の範囲だけなので、
+    実行時間は履歴全体ではなく前回からの活動量に比例する。
+    """
+    occurred = event_time(model)
+    new = and_(model.id > last_id, model.id <= max_id)
+    columns = [model.article_id.label("article_id")]
+    ranges = [new]
+    for period, window in STATS_WINDOWS.items():
+        aged = and_(
+            model.id <= last_id,
+            occurred >= prev_run - window,
+            occurred < now - window
+        )
+        ranges.append(aged)
+        columns.append((
+            event_amount(model, and_(new, occurred >= now - window))
+            - event_amount(model, aged)
+        ).label(period))
+    columns.append(event_amount(model, new).label("total"))
+
+    return select(*columns).where(
+        live_events(model),
+        or_(*ranges)
+    ).group_by(model.article_id).subquery(f"{model.__tablename__}_delta")
+
+def update_daily_stats(db: Session, now: datetime, max_ids: Optional[Dict[str, int]] = None) -> bool:
     """日次統計データを更新"""
     print("📊 日次統計データを更新中...")
     
     try:
+        max_ids = max_ids or {}
         # 昨日の日付
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        today = datetime.utcnow()
-        
-        # 全記事を取得
-        articles = db.query(Article).filter(
-            Article.deleted_at.is_(None),
-            Article.public_status == PublicStatus.public
-        ).all()
-        
-        for article in articles:
-            # 昨日のいいね数を計算
-            daily_likes = db.query(func.count(ArticleLike.id)).filter(
-                and_(
-                    ArticleLike.article_id == article.id,
-                    ArticleLike.created_at >= yesterday,
-                    ArticleLike.created_at < today,
-                    ArticleLike.deleted_at.is_(None)
-                )
-            ).scalar() or 0
-            
-            # 昨日のコメント数を計算
-            daily_comments = db.query(func.count(ArticleComment.id)).filter(
-                and_(
-                    ArticleComment.article_id == article.id,
-                    ArticleComment.created_at >= yesterday,
-                    ArticleComment.created_at < today,
-                    ArticleComment.deleted_at.is_(None)
-                )
-            ).scalar() or 0
-            
-            # 昨日のアクセス数（仮想的に計算）
-            # 実際のアクセス数はアクセスログから取得する必要があります
-            daily_access = daily_likes * 10 + daily_comments * 5  # 仮の計算
-            
-            # DailyRatingテーブルを更新
-            daily_rating = db.query(DailyRating).filter(
-                and_(
-                    DailyRating.article_id == article.id,
-                    DailyRating.created_at >= yesterday,
-                    DailyRating.created_at < today
-                )
-            ).first()
-            
-            if not daily_rating:
-                daily_rating = DailyRating(
-                    article_id=article.id,
-                    access_count=daily_access,
-                    like_count=daily_likes,
-                    super_like_count=0,  # 仮設定
-                    created_at=yesterday,
-                    updated_at=datetime.utcnow()
+        yesterday = now - timedelta(days=1)
+        today = now
+        
+        # 処理済み位置を記録する場合は、基準時刻以降に発生したイベントも処理済み位置までは数える
+        # （次回の差分集計では加算されないため、ここで数えないと失われる）
+        end = None if max_ids else today
+        
+        # 昨日のいいね数・閲覧数を記事ごとに集計
+        daily_likes = period_counts_subquery(ArticleLike, yesterday, end, max_ids.get("article_likes"))
+        daily_access = period_counts_subquery(ArticleAccessEvent, yesterday, end, max_ids.get("article_access_events"))
+        
+        likes = func.coalesce(daily_likes.c.cnt, 0)
+        access = func.coalesce(daily_access.c.cnt, 0)
+        
+        # 同じ期間の既存レコードを削除し、全記事分をまとめて作り直す
+        db.execute(
+            delete(DailyRating).where(
+                DailyRating.created_at >= yesterday,
+                DailyRating.created_at < today,
+                DailyRating.article_id.in_(public_article_ids())
+            )
+        )
+        db.execute(
+            insert(DailyRating).from_select(
+                ["article_id", "access_count", "like_count", "super_like_count", "created_at", "updated_at"],
+                select(
+                    Article.id,
+                    access,
+                    likes,
+                    literal(0),  # 仮設定
+                    literal(yesterday, TIMESTAMP),
+                    literal(today, TIMESTAMP),
+                ).select_from(Article).outerjoin(
+                    daily_likes, daily_likes.c.article_id == Article.id
+                ).outerjoin(
+                    daily_access, daily_access.c.article_id == Article.id
+                ).where(
+                    Article.id.in_(public_article_ids())
                 )
-                db.add(daily_rating)
-            else:
-                daily_rating.access_count = daily_access
-                daily_rating.like_count = daily_likes
-                daily_rating.updated_at = datetime.utcnow()
+            )
+        )
         
         db.commit()
         print("✅ 日次統計データの更新完了")
+        return True
         
     except Exception as e:
         print(f"❌ 日次統計データ更新エラー: {e}")
         db.rollback()
+        return False
+
+LIKE_COLUMNS = ("like_daily", "like_weekly", "like_monthly", "like_total")
+ACCESS_WINDOW_COLUMNS = ("access_daily", "access_weekly", "access_monthly")
+
+def aggregate_points_upsert(rows, now: datetime):
+    """
+    記事ごとの集計値（like_* / access_* 列を持つ subquery）から aggregate_points への INSERT 文を作成
+    access_total は history_rating.access_count（閲覧数バッファが加算する累計値）を使う
+    """
+    return pg_insert(AggregatePoints).from_select(
+        [
+            "target_type", "article_id",
+            *ACCESS_WINDOW_COLUMNS, "access_total", *LIKE_COLUMNS,
+            "super_like_daily", "super_like_weekly", "super_like_monthly", "super_like_total",
+            "created_at", "updated_at",
+        ],
+        select(
+            literal(TargetType.article, AggregatePoints.__table__.c.target_type.type),
+            rows.c.article_id,
+            *[rows.c[column] for column in ACCESS_WINDOW_COLUMNS],
+            func.coalesce(HistoryRating.access_count, 0),
+            *[rows.c[column] for column in LIKE_COLUMNS],
+            literal(0),
+            literal(0),
+            literal(0),
+            literal(0),
+            literal(now, TIMESTAMP),
+            literal(now, TIMESTAMP),
+        ).select_from(rows).outerjoin(
+            HistoryRating, HistoryRating.article_id == rows.c.article_id
+        ).where(
+            rows.c.article_id.in_(public_article_ids())
+        )
+    )
 
-def update_aggregate_points(db: Session):
+def update_aggregate_points(db: Session, now: datetime, max_ids: Optional[Dict[str, int]] = None) -> bool:
     """集計ポイントデータを更新"""
     print("📈 集計ポイントデータを更新中...")
     
     try:
-        # 全記事を取得
-        articles = db.query(Article).filter(
-            Article.deleted_at.is_(None),
-            Article.public_status == PublicStatus.public
-        ).all()
-        
-        for article in articles:
-            # 期間別の集計
-            now = datetime.utcnow()
-            day_ago = now - timedelta(days=1)
-            week_ago = now - timedelta(days=7)
-            month_ago = now - timedelta(days=30)
-            
-            # 日次データ
-            daily_likes = db.query(func.count(ArticleLike.id)).filter(
-                and_(
-                    ArticleLike.article_id == article.id,
-                    ArticleLike.created_at >= day_ago,
-                    ArticleLike.deleted_at.is_(None)
-                )
-            ).scalar() or 0
-            
-            daily_access = daily_likes * 10  # 仮の計算
-            
-            # 週次データ
-            weekly_likes = db.query(func.count(ArticleLike.id)).filter(
-                and_(
-                    ArticleLike.article_id == article.id,
-                    ArticleLike.created_at >= week_ago,
-                    ArticleLike.deleted_at.is_(None)
-                )
-            ).scalar() or 0
-            
-            weekly_access = weekly_likes * 10  # 仮の計算
-            
-            # 月次データ
-            monthly_likes = db.query(func.count(ArticleLike.id)).filter(
-                and_(
-                    ArticleLike.article_id == article.id,
-                    ArticleLike.created_at >= month_ago,
-                    ArticleLike.deleted_at.is_(None)
-                )
-            ).scalar() or 0
-            
-            monthly_access = monthly_likes * 10  # 仮の計算
-            
-            # 総合データ
-            total_likes = db.query(func.count(ArticleLike.id)).filter(
-                and_(
-                    ArticleLike.article_id == article.id,
-                    ArticleLike.deleted_at.is_(None)
-                )
-            ).scalar() or 0
-            
-            total_access = total_likes * 15  # 仮の計算
-            
-            # AggregatePointsテーブルを更新
-            aggregate = db.query(AggregatePoints).filter(
-                and_(
-                    AggregatePoints.article_id == article.id,
-                    AggregatePoints.target_type == TargetType.article
-                )
-            ).first()
-            
-            if not aggregate:
-                aggregate = AggregatePoints(
-                    target_type=TargetType.article,
-                    article_id=article.id,
-                    access_daily=daily_access,
-                    access_weekly=weekly_access,
-                    access_monthly=monthly_access,
-                    access_total=total_access,
-                    like_daily=daily_likes,
-                    like_weekly=weekly_likes,
-                    like_monthly=monthly_likes,
-                    like_total=total_likes,
-                    super_like_daily=0,
-                    super_like_weekly=0,
-                    super_like_monthly=0,
-                    super_like_total=0,
-                    created_at=datetime.utcnow(),
-                    updated_at=datetime.utcnow()
-                )
-                db.add(aggregate)
-            else:
-                aggregate.access_daily = daily_access
-                aggregate.access_weekly = weekly_access
-                aggregate.access_monthly = monthly_access
-                aggregate.access_total = total_access
-                aggregate.like_daily = daily_likes
-                aggregate.like_weekly = weekly_likes
-                aggregate.like_monthly = monthly_likes
-                aggregate.like_total = total_likes
-                aggregate.updated_at = datetime.utcnow()
+        max_ids = max_ids or {}
+        likes = window_counts_subquery(ArticleLike, now, max_ids.get("article_likes"))
+        access = window_counts_subquery(
+            ArticleAccessEvent, now, max_ids.get("article_access_events"), with_total=False
+        )
+        rows = select(
+            Article.id.label("article_id"),
+            *[func.coalesce(likes.c[period], 0).label(f"like_{period}") for period in (*STATS_WINDOWS, "total")],
+            *[func.coalesce(access.c[period], 0).label(f"access_{period}") for period in STATS_WINDOWS],
+        ).select_from(Article).outerjoin(
+            likes, likes.c.article_id == Article.id
+        ).outerjoin(
+            access, access.c.article_id == Article.id
+        ).subquery("rows")
+        
+        # 全記事分を1回の INSERT ... SELECT ... ON CONFLICT で更新
+        stmt = aggregate_points_upsert(rows, now)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_aggregate_points_article_target",
+            set_={
+                column: stmt.excluded[column]
+                for column in (*ACCESS_WINDOW_COLUMNS, "access_total", *LIKE_COLUMNS, "updated_at")
+            },
+        )
+        db.execute(stmt)
         
         db.commit()
         print("✅ 集計ポイントデータの更新完了")
+        return True
         
     except Exception as e:
         print(f"❌ 集計ポイントデータ更新エラー: {e}")
         db.rollback()
+        return False
 
 def update_history_rating(db: Session):
-    """履歴評価データを更新"""
+    """
+    履歴評価データを更新
+    access_count は閲覧数バッファが実際の閲覧数を加算しているため、ここでは上書きしない
+    """
     print("🔄 履歴評価データを更新中...")
     
     try:
-        # 全記事を取得
-        articles = db.query(Article).filter(
-            Article.deleted_at.is_(None),
-            Article.public_status == PublicStatus.public
-        ).all()
-        
-        for article in articles:
-            # 総合いいね数
-            total_likes = db.query(func.count(ArticleLike.id)).filter(
-                and_(
-                    ArticleLike.article_id == article.id,
-                    ArticleLike.deleted_at.is_(None)
-                )
-            ).scalar() or 0
-            
-            # 総合アクセス数（仮の計算）
-            total_access = total_likes * 15 + 100  # 基本アクセス数を追加
-            
-            # HistoryRatingテーブルを更新
-            history = db.query(HistoryRating).filter(
-                HistoryRating.article_id == article.id
-            ).first()
-            
-            if not history:
-                history = HistoryRating(
-                    article_id=article.id,
-                    access_count=total_access,
-                    like_count=total_likes,
-                    super_like_count=0
-                )
-                db.add(history)
-            else:
-                history.access_count = total_access
-                history.like_count = total_likes
+        likes = window_counts_subquery(ArticleLike, datetime.utcnow())
+        total_likes = func.coalesce(likes.c.total, 0)
+        
+        # 全記事分を1回の INSERT ... SELECT ... ON CONFLICT で更新
+        stmt = pg_insert(HistoryRating).from_select(
+            ["article_id", "access_count", "like_count", "super_like_count"],
+            select(
+                Article.id,
+                literal(0),
+                total_likes,
+                literal(0),
+            ).select_from(Article).outerjoin(
+                likes, likes.c.article_id == Article.id
+            ).where(
+                Article.id.in_(public_article_ids())
+            )
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_history_rating_article_id",
+            set_={"like_count": stmt.excluded.like_count},
+        )
+        db.execute(stmt)
         
         db.commit()
         print("✅ 履歴評価データの更新完了")
@@ -269,6 +336,253 @@ def update_history_rating(db: Session):
         print(f"❌ 履歴評価データ更新エラー: {e}")
         db.rollback()
 
+def max_event_id(db: Session, model, before: datetime) -> int:
+    """
+    基準時刻より前に発生したイベントの最大ID（今回処理済みにする上限）
+    ID は INSERT 時に採番されるため、単純な max(id) では、それより小さい ID で
+    まだ COMMIT されていないイベントを次回以降も読み飛ばしてしまう
+    """
+    return db.query(func.coalesce(func.max(model.id), 0)).filter(event_time(model) < before).scalar()
+
+def load_watermarks(db: Session) -> Dict[str, BatchWatermark]:
+    """前回バッチの処理済み位置を取得"""
+    return {mark.name: mark for mark in db.query(BatchWatermark).all()}
+
+def clear_watermarks(db: Session):
+    """
+    処理済み位置を削除
+    全件再集計の途中で失敗した場合に、次回が差分集計にならないようにする
+    """
+    db.query(BatchWatermark).delete()
+    db.commit()
+
+def save_watermarks(db: Session, now: datetime, max_ids: Dict[str, int]):
+    """今回の処理済み位置を記録（commit は呼び出し側で行う）"""
+    stmt = pg_insert(BatchWatermark).values([
+        {"name": name, "last_id": last_id, "last_run_at": now, "updated_at": now}
+        for name, last_id in max_ids.items()
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[BatchWatermark.name],
+        set_={
+            "last_id": stmt.excluded.last_id,
+            "last_run_at": stmt.excluded.last_run_at,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    ))
+
+def update_stats_incremental(db: Session, now: datetime, marks: Dict[str, BatchWatermark], max_ids: Dict[str, int]) -> bool:
+    """
+    前回実行からの差分だけで daily_rating / aggregate_points を更新
+
+    差分の適用と処理済み位置の更新は1トランザクションで行う。
+    失敗した場合は処理済み位置が進まないため、次回同じ差分を再計算する。
+    """
+    print("⚡ 差分集計で統計データを更新中...")
+    
+    try:
+        prev_run = marks["article_likes"].last_run_at
+        like_delta = event_delta_subquery(
+            ArticleLike, marks["article_likes"].last_id, max_ids["article_likes"], prev_run, now
+        )
+        access_delta = event_delta_subquery(
+            ArticleAccessEvent, marks["article_access_events"].last_id, max_ids["article_access_events"], prev_run, now
+        )
+        
+        # いいね・閲覧の増減を記事ごとにまとめる
+        events = union_all(
+            select(
+                like_delta.c.article_id,
+                *[like_delta.c[period].label(f"like_{period}") for period in (*STATS_WINDOWS, "total")],
+                *[literal(0).label(f"access_{period}") for period in STATS_WINDOWS],
+            ),
+            select(
+                access_delta.c.article_id,
+                *[literal(0).label(f"like_{period}") for period in (*STATS_WINDOWS, "total")],
+                *[access_delta.c[period].label(f"access_{period}") for period in STATS_WINDOWS],
+            ),
+        ).subquery("events")
+        delta = select(
+            events.c.article_id,
+            *[func.sum(events.c[column]).label(column) for column in (*LIKE_COLUMNS, *ACCESS_WINDOW_COLUMNS)],
+        ).group_by(events.c.article_id).subquery("delta")
+        
+        # 日次統計: 増減がある記事の最新のレコードだけを更新する（記事数ではなく活動量に比例）
+        # 増減がない記事のレコードは、ウィンドウ内のイベントが変わっていないので値もそのまま
+        delta_ids = select(delta.c.article_id)
+        latest = select(DailyRating.id).where(
+            DailyRating.article_id.in_(delta_ids)
+        ).distinct(DailyRating.article_id).order_by(
+            DailyRating.article_id, DailyRating.created_at.desc(), DailyRating.id.desc()
+        )
+        likes = func.coalesce(delta.c.like_daily, 0)
+        access = func.coalesce(delta.c.access_daily, 0)
+        db.execute(
+            update(DailyRating).where(
+                DailyRating.id.in_(latest),
+                DailyRating.article_id == delta.c.article_id
+            ).values(
+                access_count=func.greatest(func.coalesce(DailyRating.access_count, 0) + access, 0),
+                like_count=func.greatest(func.coalesce(DailyRating.like_count, 0) + likes, 0),
+                created_at=now - STATS_WINDOWS["daily"],
+                updated_at=now,
+            )
+        )
+        # まだレコードがない記事は増減値で作成
+        db.execute(
+            insert(DailyRating).from_select(
+                ["article_id", "access_count", "like_count", "super_like_count", "created_at", "updated_at"],
+                select(
+                    delta.c.article_id,
+                    func.greatest(access, 0),
+                    func.greatest(likes, 0),
+                    literal(0),
+                    literal(now - STATS_WINDOWS["daily"], TIMESTAMP),
+                    literal(now, TIMESTAMP),
+                ).where(
+                    delta.c.article_id.in_(public_article_ids()),
+                    ~exists().where(DailyRating.article_id == delta.c.article_id)
+                )
+            )
+        )
+        
+        # 集計ポイント: 増減がある記事だけ加算（既存レコードがなければ増減値で作成）
+        stmt = aggregate_points_upsert(delta, now)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_aggregate_points_article_target",
+            set_={
+                **{
+                    column: func.greatest(
+                        func.coalesce(getattr(AggregatePoints, column), 0) + stmt.excluded[column], 0
+                    )
+                    for column in (*LIKE_COLUMNS, *ACCESS_WINDOW_COLUMNS)
+                },
+                "access_total": stmt.excluded.access_total,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        db.execute(stmt)
+        
+        # commit すると marks が今回の処理済み位置で読み直されるため、件数は先に計算する
+        new_events = ", ".join(
+            f"{name}: {max_ids[name] - marks[name].last_id}件" for name in EVENT_TABLES
+        )
+        save_watermarks(db, now, max_ids)
+        db.commit()
+        print(f"✅ 差分集計完了（{new_events}）")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 差分集計エラー: {e}")
+        db.rollback()
+        return False
+
+def add_months(value: datetime, months: int) -> datetime:
+    """月初の日時に months か月を加算"""
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1, day=1)
+
+def ensure_access_event_partitions(db: Session, now: datetime):
+    """閲覧ログの当月から数か月先までのパーティションを作成"""
+    print("🗂️ 閲覧ログのパーティションを確認中...")
+    
+    try:
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(ACCESS_EVENT_PARTITIONS_AHEAD + 1):
+            start = add_months(month_start, offset)
+            end = add_months(month_start, offset + 1)
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS article_access_events_{start:%Y%m} "
+                f"PARTITION OF article_access_events "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            ))
+        
+        db.commit()
+        print("✅ 閲覧ログのパーティション確認完了")
+        
+    except Exception as e:
+        print(f"❌ パーティション作成エラー: {e}")
+        db.rollback()
+
+def drop_old_access_event_partitions(db: Session, now: datetime):
+    """保持期間を過ぎた閲覧ログのパーティションを削除（累計は history_rating に残る）"""
+    try:
+        cutoff = add_months(now.replace(day=1, hour=0, minute=0, second=0, microsecond=0), -ACCESS_EVENT_RETENTION_MONTHS)
+        partitions = db.execute(text("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = 'article_access_events'
+        """)).scalars().all()
+        
+        dropped = 0
+        for name in partitions:
+            suffix = name.rsplit("_", 1)[-1]
+            if not (suffix.isdigit() and len(suffix) == 6):
+                continue  # デフォルトパーティション
+            if datetime.strptime(suffix, "%Y%m") < cutoff:
+                db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                dropped += 1
+        
+        db.commit()
+        print(f"✅ {dropped}件の古い閲覧ログパーティションを削除しました")
+        
+    except Exception as e:
+        print(f"❌ 閲覧ログパーティション削除エラー: {e}")
+        db.rollback()
+
+def update_ranking_snapshots(db: Session):
+    """ランキングのスナップショットを作成（APIはこれをキャッシュして返す）"""
+    print("🏆 ランキングスナップショットを作成中...")
+    
+    try:
+        versions = publish_ranking_snapshots(db)
+        print(f"✅ ランキングスナップショットを公開しました: {versions}")
+        
+    except Exception as e:
+        print(f"❌ ランキングスナップショット作成エラー: {e}")
+        db.rollback()
+
+def reconcile_comment_counts(db: Session, since_comment_id: Optional[int] = None):
+    """
+    articles.comment_count を実際のコメント数に合わせて修正
+    since_comment_id を指定した場合は、それより新しいコメントがある記事だけを対象にする
+    """
+    print("💬 コメント数の整合性をチェック中...")
+    
+    try:
+        target_filter = ""
+        params = {}
+        if since_comment_id is not None:
+            target_filter = """
+                WHERE a2.id IN (
+                    SELECT article_id FROM article_comments WHERE id > :since_comment_id
+                )"""
+            params["since_comment_id"] = since_comment_id
+        
+        # ずれている記事のみを1回のUPDATEで修正
+        result = db.execute(text(f"""
+            UPDATE articles AS a
+            SET comment_count = c.cnt
+            FROM (
+                SELECT a2.id AS article_id, COUNT(ac.id) AS cnt
+                FROM articles AS a2
+                LEFT JOIN article_comments AS ac
+                    ON ac.article_id = a2.id AND ac.deleted_at IS NULL{target_filter}
+                GROUP BY a2.id
+            ) AS c
+            WHERE a.id = c.article_id
+              AND a.comment_count IS DISTINCT FROM c.cnt
+        """), params)
+        
+        db.commit()
+        print(f"✅ {result.rowcount}件の記事のコメント数を修正しました")
+        
+    except Exception as e:
+        print(f"❌ コメント数修正エラー: {e}")
+        db.rollback()
+
 def cleanup_old_data(db: Session):
     """古いデータのクリーンアップ"""
     print("🧹 古いデータをクリーンアップ中...")
@@ -288,23 +602,68 @@ def cleanup_old_data(db: Session):
         print(f"❌ データクリーンアップエラー: {e}")
         db.rollback()
 
+def parse_args():
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="統計データ更新バッチ処理")
+    parser.add_argument(
+        "--reconcile-comments",
+        action="store_true",
+        help="コメント数の整合性チェックのみ実行する",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="差分集計を使わず、全期間のデータから再集計する",
+    )
+    return parser.parse_args()
+
 def main():
     """メイン処理"""
+    args = parse_args()
     print("🚀 統計データ更新バッチ処理を開始します...")
     print(f"実行時刻: {datetime.utcnow().isoformat()}")
     
-    # データベース接続
-    db = get_db()
-    if not db:
-        print("❌ データベース接続に失敗しました")
-        return
+    # データベース接続（app.database の共通設定を使用）
+    db = SessionLocal()
     
     try:
-        # 各処理を実行
-        update_daily_stats(db)
-        update_aggregate_points(db)
-        update_history_rating(db)
+        if args.reconcile_comments:
+            reconcile_comment_counts(db)
+            return
+
+        # 集計の基準時刻（まだ COMMIT されていない可能性のある直近のイベントは次回に集計）
+        now = datetime.utcnow() - timedelta(seconds=EVENT_SETTLE_SECONDS)
+        ensure_access_event_partitions(db, datetime.utcnow())
+        marks = load_watermarks(db)
+        max_ids = {
+            # 処理済み位置は戻さない
+            name: max(max_event_id(db, model, now), marks[name].last_id if name in marks else 0)
+            for name, model in EVENT_TABLES.items()
+        }
+        
+        if not args.full and set(EVENT_TABLES) <= marks.keys():
+            # 差分集計（前回実行からの増減のみ反映）
+            # history_rating のいいね数はAPIがリアルタイムに更新しているため再集計しない
+            # 差分集計の commit 後は marks が今回の処理済み位置になるため、前回の位置を先に取っておく
+            last_comment_id = marks["article_comments"].last_id
+            update_stats_incremental(db, now, marks, max_ids)
+            reconcile_comment_counts(db, since_comment_id=last_comment_id)
+        else:
+            # 全件再集計（--full 指定時、または初回実行時）
+            if not args.full:
+                print("ℹ️ 処理済み位置が未登録のため全件再集計します")
+            clear_watermarks(db)
+            daily_ok = update_daily_stats(db, now, max_ids)
+            aggregate_ok = update_aggregate_points(db, now, max_ids)
+            update_history_rating(db)
+            reconcile_comment_counts(db)
+            if daily_ok and aggregate_ok:
+                save_watermarks(db, now, max_ids)
+                db.commit()
+        
         cleanup_old_data(db)
+        drop_old_access_event_partitions(db, now)
+        update_ranking_snapshots(db)
         
         print("🎉 統計データ更新バッチ処理が完了しました！")
         
@@ -0,0 +1,133 @@
+"""
+テストの共通設定
+
+DB を使うテストは TEST_DATABASE_URL を設定したときだけ実行する（未設定ならスキップ）。
+  例: TEST_DATABASE_URL=postgresql+psycopg2://postgres@127.0.0.1:5432/calmie_test python -m pytest -q
+テーブルはテストの開始時に作り直し、各テストの前に空にするので、本番や開発の DB を指定しないこと。
+
+アプリは ./static などカレントディレクトリからの相対パスにファイルを保存するため、
+アプリを動かすテストは一時ディレクトリに移動して実行する。
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+
+# app.database は import 時に DATABASE_URL を読むので、app を import する前に設定する
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+# 一覧のクエリ数などを毎回測れるよう、レスポンスキャッシュは使わない
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+# 画像処理のワーカープロセス（spawn）からも app を import できるようにする
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    """テスト用 DB のエンジン（テーブルを作り直す）"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL が未設定のため DB を使うテストをスキップします")
+
+    from app.database import engine
+    from app.models import Base
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(db_engine):
+    """空のテーブルに接続したセッション"""
+    from app.database import SessionLocal
+    from app.models import Base
+
+    tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+    with db_engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """アップロードされたファイルなどを一時ディレクトリに保存させる"""
+    (tmp_path / "static").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def client(db, workdir):
+    """起動・終了イベントを含めてアプリを動かすクライアント"""
+    from fastapi.testclient import TestClient
+
+    from app.database import async_engine
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+        # 非同期エンジンの接続はこのクライアントのイベントループに紐づくので、ここで閉じる
+        if async_engine is not None:
+            test_client.portal.call(async_engine.dispose)
+
+
+@pytest.fixture
+def make_user(db):
+    """ユーザーを作成する関数"""
+    from app.models import User
+
+    def make(username=None):
+        now = datetime.utcnow()
+        index = db.query(User).count() + 1
+        user = User(
+            username=username or f"user{index}",
+            email=f"user{index}@example.com",
+            firebase_user_id=f"firebase-user{index}",
+            created_at=now,
+            updated_at=now,
+        )
+        db.add(user)
+        db.commit()
+        return user
+
+    return make
+
+
+@pytest.fixture
+def make_article(db):
+    """公開中の記事（と history_rating）を作成する関数"""
+    from app.models import Article, HistoryRating, PublicStatus
+    from app.search import search_vector
+    from app.summary import make_summary
+
+    def make(user, title="記事", content="本文", category=("1",), likes=0, public_at=None):
+        now = datetime.utcnow()
+        article = Article(
+            title=title,
+            content=content,
+            summary=make_summary(content),
+            category=list(category),
+            public_status=PublicStatus.public,
+            create_user_id=user.id,
+            created_at=now,
+            updated_at=now,
+            public_at=public_at or now - timedelta(minutes=db.query(Article).count()),
+            search_vector=search_vector(title, content, list(category)),
+        )
+        db.add(article)
+        db.flush()
+        db.add(HistoryRating(article_id=article.id, like_count=likes, access_count=0, super_like_count=0))
+        db.commit()
+        return article
+
+    return make
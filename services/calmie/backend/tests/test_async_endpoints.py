@@ -0,0 +1,138 @@
+"""
+非同期セッションのエンドポイント（1つのイベントループで同時に処理できること）
+同期セッション版（スレッドプールで実行）とのスループット（リクエスト/秒）の比較
+"""
+import asyncio
+import time
+
+import httpx
+from sqlalchemy import event
+
+CONCURRENCY = 40
+THROUGHPUT_REQUESTS = 400
+
+
+def test_concurrent_requests_share_the_event_loop(db, workdir, make_user, make_article):
+    from app.database import async_engine, pool_metrics
+    from app.main import app
+
+    user = make_user()
+    for i in range(10):
+        make_article(user, title=f"記事{i}")
+
+    checked_out = {"now": 0, "max": 0}
+
+    def on_checkout(*args):
+        checked_out["now"] += 1
+        checked_out["max"] = max(checked_out["max"], checked_out["now"])
+
+    def on_checkin(*args):
+        checked_out["now"] -= 1
+
+    event.listen(async_engine.sync_engine, "checkout", on_checkout)
+    event.listen(async_engine.sync_engine, "checkin", on_checkin)
+    checkouts = pool_metrics["async"].checkouts
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(*[
+                    client.get("/articles", params={"limit": 5}) for _ in range(CONCURRENCY)
+                ])
+        finally:
+            # 接続はこのイベントループに紐づくので、ループを閉じる前に破棄する
+            await async_engine.dispose()
+
+    try:
+        responses = asyncio.run(run())
+    finally:
+        event.remove(async_engine.sync_engine, "checkout", on_checkout)
+        event.remove(async_engine.sync_engine, "checkin", on_checkin)
+
+    assert [response.status_code for response in responses] == [200] * CONCURRENCY
+    assert all(len(response.json()["articles"]) == 5 for response in responses)
+    # 同期セッションではなく非同期エンジンのプールを使い、複数のリクエストが同時に DB を待っていた
+    assert pool_metrics["async"].checkouts - checkouts >= CONCURRENCY
+    assert checked_out["max"] > 1
+
+
+def sync_articles_app():
+    """/articles の同期セッション版（非同期化する前と同じく def のハンドラで Session を使う）"""
+    from fastapi import Depends, FastAPI
+    from sqlalchemy.orm import Session
+
+    from app.database import get_db
+    from app.feed import load_feed_context
+    from app.models import Article
+    from app.pagination import keyset_page, split_page
+    from app.summary import LIST_OPTIONS
+
+    sync_app = FastAPI()
+
+    @sync_app.get("/articles")
+    def get_articles(limit: int = 5, db: Session = Depends(get_db)):
+        articles, next_cursor = split_page(
+            keyset_page(db.query(Article).options(*LIST_OPTIONS), None, limit).all(), limit
+        )
+        feed = load_feed_context(db, articles, with_users=True)
+        return {
+            "articles": [
+                {
+                    "id": article.id,
+                    "title": article.title,
+                    "summary": article.summary,
+                    "public_at": article.public_at,
+                    "like_count": feed.like_count(article.id),
+                    "access_count": feed.access_count(article.id),
+                    "comment_count": feed.comment_count(article.id),
+                    "category": article.category,
+                    "username": feed.username(article.create_user_id, "Unknown"),
+                    "user_id": article.create_user_id,
+                }
+                for article in articles
+            ],
+            "next_cursor": next_cursor,
+        }
+
+    return sync_app
+
+
+def requests_per_second(target_app) -> float:
+    """CONCURRENCY 件ずつ同時に送り、THROUGHPUT_REQUESTS 件を処理するまでのリクエスト/秒"""
+    from app.database import async_engine
+
+    async def run():
+        transport = httpx.ASGITransport(app=target_app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                async def worker():
+                    for _ in range(THROUGHPUT_REQUESTS // CONCURRENCY):
+                        response = await client.get("/articles", params={"limit": 5})
+                        assert response.status_code == 200
+
+                await worker()  # 接続の確立を計測から除く
+                started = time.perf_counter()
+                await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+                return THROUGHPUT_REQUESTS / (time.perf_counter() - started)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_async_throughput_compared_with_sync(db, workdir, make_user, make_article):
+    from app.main import app
+
+    user = make_user()
+    for i in range(10):
+        make_article(user, title=f"記事{i}")
+
+    sync_rps = requests_per_second(sync_articles_app())
+    async_rps = requests_per_second(app)
+    print(f"\n⏱️ /articles {CONCURRENCY}並列: 同期セッション {sync_rps:.0f} req/s / 非同期セッション {async_rps:.0f} req/s")
+
+    # DB との往復が速いローカル環境では asyncpg・greenlet の分だけ非同期の方がやや遅い（同期の 8 割程度）
+    # 非同期化の効果は DB の待ち時間が長いときに、スレッドプール（既定 40 スレッド）の数を超えて同時に待てること
+    # ここでは、イベントループを止める処理が入ってスループットが大きく落ちていないことを確認する
+    assert async_rps > sync_rps * 0.5
@@ -0,0 +1,299 @@
+"""
+batch_update_stats.py の集計（GROUP BY でまとめた集計が記事ごとに数えた結果と一致すること）
+差分集計（処理済み位置からの増減）を繰り返した結果が全件再集計と一致すること
+記事ごとのループ（書き換え前）と GROUP BY の集計の実行時間の比較
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, text
+
+SETTLE = timedelta(seconds=300)  # EVENT_SETTLE_SECONDS の既定値
+
+NOW = datetime(2026, 10, 18, 12, 0)
+WINDOWS = {"daily": 1, "weekly": 7, "monthly": 30}
+
+
+@pytest.fixture
+def dataset(db, make_user, make_article):
+    """いいね・閲覧ログを過去40日に散らした記事（非公開・削除済みの記事、取り消したいいねを含む）"""
+    from app.models import ArticleAccessEvent, ArticleLike, PublicStatus
+
+    rng = random.Random(8)
+    users = [make_user() for _ in range(20)]
+    articles = [make_article(users[0], title=f"記事{i}") for i in range(8)]
+    articles[6].public_status = PublicStatus.private
+    articles[7].deleted_at = NOW - timedelta(days=2)
+
+    for article in articles:
+        for user in rng.sample(users, rng.randint(0, len(users))):
+            db.add(ArticleLike(
+                article_id=article.id,
+                user_id=user.id,
+                created_at=NOW - timedelta(hours=rng.uniform(0, 40 * 24)),
+                deleted_at=NOW if rng.random() < 0.1 else None,
+            ))
+        for _ in range(rng.randint(0, 30)):
+            db.add(ArticleAccessEvent(
+                article_id=article.id,
+                viewed_at=NOW - timedelta(hours=rng.uniform(0, 40 * 24)),
+                views=rng.randint(1, 5),
+            ))
+    db.commit()
+    return articles
+
+
+def expected_counts(db, article_id, now=NOW, marks=None):
+    """
+    記事ごとに期間ごとの件数を数える（書き換え前の記事ごとのループと同じ定義）
+    marks を指定した場合は処理済み位置（batch_watermarks）までのイベントだけを数える
+    """
+    from app.models import ArticleAccessEvent, ArticleLike
+
+    likes_query = db.query(ArticleLike).filter(
+        ArticleLike.article_id == article_id, ArticleLike.deleted_at.is_(None)
+    )
+    views_query = db.query(ArticleAccessEvent).filter(ArticleAccessEvent.article_id == article_id)
+    if marks is not None:
+        likes_query = likes_query.filter(ArticleLike.id <= marks["article_likes"])
+        views_query = views_query.filter(ArticleAccessEvent.id <= marks["article_access_events"])
+    likes = [like.created_at for like in likes_query]
+    views = [(event.viewed_at, event.views) for event in views_query]
+    counts = {"like_total": len(likes)}
+    for period, days in WINDOWS.items():
+        since = now - timedelta(days=days)
+        counts[f"like_{period}"] = sum(created_at >= since for created_at in likes)
+        counts[f"access_{period}"] = sum(amount for viewed_at, amount in views if viewed_at >= since)
+    return counts
+
+
+def test_set_based_aggregation_matches_per_article_counts(db, dataset):
+    import batch_update_stats as batch
+    from app.models import AggregatePoints, DailyRating, HistoryRating
+
+    assert batch.update_daily_stats(db, NOW)
+    assert batch.update_aggregate_points(db, NOW)
+    batch.update_history_rating(db)
+    db.expire_all()
+
+    for article in dataset[:6]:
+        expected = expected_counts(db, article.id)
+        points = db.query(AggregatePoints).filter(AggregatePoints.article_id == article.id).one()
+        assert {column: getattr(points, column) for column in expected} == expected
+
+        daily = db.query(DailyRating).filter(DailyRating.article_id == article.id).one()
+        # 日次統計は [now - 1日, now) の範囲
+        assert (daily.like_count, daily.access_count) == (expected["like_daily"], expected["access_daily"])
+
+        history = db.query(HistoryRating).filter(HistoryRating.article_id == article.id).one()
+        assert history.like_count == expected["like_total"]
+
+    # 非公開・削除済みの記事は集計しない
+    hidden = [article.id for article in dataset[6:]]
+    assert db.query(AggregatePoints).filter(AggregatePoints.article_id.in_(hidden)).count() == 0
+    assert db.query(DailyRating).filter(DailyRating.article_id.in_(hidden)).count() == 0
+
+
+class Clock(datetime):
+    """バッチの datetime.utcnow() を差し替える時計"""
+    current = NOW
+
+    @classmethod
+    def utcnow(cls):
+        return cls.current
+
+
+@pytest.fixture
+def run_batch(db, monkeypatch):
+    """指定した時刻にバッチ（main）を実行し、処理済み位置を返す"""
+    import batch_update_stats as batch
+    from app.models import BatchWatermark
+
+    monkeypatch.setattr(batch, "datetime", Clock)
+    monkeypatch.setattr(batch, "EVENT_SETTLE_SECONDS", int(SETTLE.total_seconds()))
+
+    def run(at, *args):
+        Clock.current = at
+        monkeypatch.setattr(sys, "argv", ["batch_update_stats.py", *args])
+        db.commit()  # テスト側のトランザクションでバッチを待たせない
+        batch.main()
+        db.expire_all()
+        return {mark.name: mark for mark in db.query(BatchWatermark)}
+
+    # 閲覧ログのパーティションを先に作る（デフォルトパーティションに入ったログがあると作成できない）
+    batch.ensure_access_event_partitions(db, NOW)
+    return run
+
+
+def stats_snapshot(db, now, article_ids):
+    """ランキングが読む統計（集計ポイントと、最新の日次統計）"""
+    from app.models import AggregatePoints, DailyRating
+
+    columns = [*[f"like_{period}" for period in (*WINDOWS, "total")], *[f"access_{period}" for period in WINDOWS]]
+    points = {
+        row.article_id: {column: getattr(row, column) for column in columns}
+        for row in db.query(AggregatePoints).filter(AggregatePoints.article_id.in_(article_ids))
+    }
+    daily = {
+        row.article_id: (row.like_count, row.access_count)
+        for row in db.query(DailyRating).filter(
+            DailyRating.article_id.in_(article_ids),
+            DailyRating.updated_at >= now - timedelta(days=1),
+        )
+    }
+    return points, daily
+
+
+def test_incremental_runs_match_full_recompute(db, run_batch, dataset, make_user):
+    from app.models import Article, ArticleAccessEvent, ArticleComment, ArticleLike
+
+    rng = random.Random(9)
+    articles = dataset[:6]
+    article_ids = [article.id for article in articles]
+    users = [make_user() for _ in range(30)]
+    liked = set()
+
+    def add_events(start, end, count):
+        """[start, end) にいいね・閲覧ログを追加"""
+        for _ in range(count):
+            article_id, user = rng.choice(article_ids), rng.choice(users)
+            created_at = start + (end - start) * rng.random()
+            if (article_id, user.id) not in liked:
+                liked.add((article_id, user.id))
+                db.add(ArticleLike(article_id=article_id, user_id=user.id, created_at=created_at))
+            db.add(ArticleAccessEvent(article_id=article_id, viewed_at=created_at, views=rng.randint(1, 5)))
+        db.commit()
+
+    def add_comment(article_id, created_at):
+        # API を通さずに追加するので articles.comment_count はずれる
+        db.add(ArticleComment(
+            username="tester", article_id=article_id, comment="コメント", user_id=users[0].id,
+            created_at=created_at, updated_at=created_at,
+        ))
+        db.commit()
+
+    # 初回は処理済み位置がないので全件再集計
+    marks = run_batch(NOW + SETTLE)
+    assert marks["article_likes"].last_run_at == NOW
+
+    # 1回目の差分集計: 基準時刻（実行時刻 - SETTLE）より後のいいねはまだ処理しない
+    first = NOW + timedelta(hours=3)
+    add_events(NOW, first - SETTLE, 40)
+    add_comment(article_ids[0], first - SETTLE - timedelta(minutes=1))
+    settled_like = db.query(ArticleLike.id).order_by(ArticleLike.id.desc()).limit(1).scalar()
+    recent_user = make_user()
+    recent = ArticleLike(article_id=article_ids[1], user_id=recent_user.id, created_at=first - timedelta(minutes=1))
+    db.add(recent)
+    db.commit()
+    recent_id = recent.id
+
+    previous = {name: mark.last_id for name, mark in marks.items()}
+    marks = run_batch(first)
+    last_ids = {name: mark.last_id for name, mark in marks.items()}
+    assert marks["article_likes"].last_run_at == first - SETTLE
+    assert last_ids["article_likes"] == settled_like
+    assert last_ids["article_likes"] > previous["article_likes"]
+    assert last_ids["article_access_events"] > previous["article_access_events"]
+    assert last_ids["article_comments"] > previous["article_comments"]
+    assert last_ids["article_likes"] < recent_id
+    # 新しいコメントがある記事のコメント数は差分集計でも直る
+    assert db.query(Article.comment_count).filter(Article.id == article_ids[0]).scalar() == 1
+
+    points, daily = stats_snapshot(db, first - SETTLE, article_ids)
+    for article_id in article_ids:
+        expected = expected_counts(db, article_id, first - SETTLE, last_ids)
+        assert points[article_id] == {column: expected[column] for column in points[article_id]}
+        assert daily[article_id] == (expected["like_daily"], expected["access_daily"])
+
+    # 2回目の差分集計: 前回は待っていたいいねも数え、1日前より古くなったイベントは日次から外れる
+    second = NOW + timedelta(hours=7)
+    add_events(first - SETTLE, second - SETTLE, 40)
+    add_comment(article_ids[2], second - SETTLE - timedelta(minutes=1))
+    marks = run_batch(second)
+    assert marks["article_likes"].last_id >= recent_id
+    assert db.query(Article.comment_count).filter(Article.id == article_ids[2]).scalar() == 1
+    incremental = stats_snapshot(db, second - SETTLE, article_ids)
+
+    # 同じ時刻に全件再集計した結果と一致する
+    run_batch(second, "--full")
+    assert stats_snapshot(db, second - SETTLE, article_ids) == incremental
+
+
+BENCHMARK_ARTICLES = 300
+
+
+@pytest.fixture
+def benchmark_dataset(db, make_user):
+    """ベンチマーク用に乱数の種を固定して作る記事・いいね・閲覧ログ"""
+    user_ids = [make_user().id for _ in range(50)]
+    db.execute(text("SELECT setseed(0.8)"))
+    db.execute(text("""
+        INSERT INTO articles (title, content, category, public_status, create_user_id,
+                              comment_count, created_at, updated_at, public_at)
+        SELECT '記事' || i, '本文', ARRAY['1'], 'public', (:user_ids)[1],
+               0, :now, :now, :now - i * interval '1 minute'
+        FROM generate_series(1, :articles) AS i
+    """), {"user_ids": user_ids, "now": NOW, "articles": BENCHMARK_ARTICLES})
+    db.execute(text("""
+        INSERT INTO article_likes (article_id, user_id, created_at)
+        SELECT a.id, u.id, :now - random() * interval '40 days'
+        FROM articles AS a CROSS JOIN users AS u
+        WHERE random() < 0.3
+    """), {"now": NOW})
+    db.execute(text("""
+        INSERT INTO article_access_events (article_id, viewed_at, views)
+        SELECT a.id, :now - random() * interval '40 days', 1 + floor(random() * 5)::int
+        FROM articles AS a CROSS JOIN generate_series(1, 20)
+    """), {"now": NOW})
+    db.execute(text("ANALYZE"))
+    db.commit()
+
+
+def per_article_counts(db):
+    """書き換え前のバッチと同じく、記事ごと・期間ごとに1クエリずつ数える"""
+    import batch_update_stats as batch
+    from app.models import ArticleAccessEvent, ArticleLike
+
+    counts = {}
+    for article_id in db.scalars(batch.public_article_ids()):
+        row = {}
+        for period, days in [*WINDOWS.items(), ("total", None)]:
+            since = NOW - timedelta(days=days) if days else datetime.min
+            row[f"like_{period}"] = db.query(func.count(ArticleLike.id)).filter(
+                ArticleLike.article_id == article_id,
+                ArticleLike.created_at >= since,
+                ArticleLike.deleted_at.is_(None),
+            ).scalar()
+            if days:
+                row[f"access_{period}"] = db.query(func.coalesce(func.sum(ArticleAccessEvent.views), 0)).filter(
+                    ArticleAccessEvent.article_id == article_id,
+                    ArticleAccessEvent.viewed_at >= since,
+                ).scalar()
+        counts[article_id] = row
+    return counts
+
+
+def test_grouped_aggregation_benchmark(db, benchmark_dataset):
+    import batch_update_stats as batch
+    from app.models import AggregatePoints
+
+    started = time.perf_counter()
+    expected = per_article_counts(db)
+    per_article = time.perf_counter() - started
+
+    started = time.perf_counter()
+    assert batch.update_aggregate_points(db, NOW)
+    grouped = time.perf_counter() - started
+    print(f"\n⏱️ {BENCHMARK_ARTICLES}記事: 記事ごとのループ {per_article:.3f}秒 / GROUP BY {grouped:.3f}秒")
+
+    db.expire_all()
+    actual = {
+        points.article_id: {column: getattr(points, column) for column in expected[points.article_id]}
+        for points in db.query(AggregatePoints)
+    }
+    assert actual == expected
+    # 記事数 × 期間の数だけ往復するループより、まとめた1回の集計の方が速い
+    assert grouped < per_article
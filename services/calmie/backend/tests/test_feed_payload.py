@@ -0,0 +1,60 @@
+"""一覧の応答に本文を含めないこと（要約と fields= による項目の絞り込み、app/summary.py）"""
+import re
+
+import pytest
+from sqlalchemy import event
+
+CONTENT = "## 見出し\n\n" + "今日は公園を散歩しました。**紅葉**がきれいでした。\n" * 400
+CONTENT_COLUMN = re.compile(r"articles\.content\b(?!_)")
+
+LIST_ENDPOINTS = ["/", "/articles", "/articles/ranking", "/articles/trend"]
+
+
+@pytest.fixture
+def long_articles(make_user, make_article):
+    user = make_user()
+    return [make_article(user, title=f"紅葉の散歩 {i}", content=CONTENT) for i in range(20)]
+
+
+def items(body):
+    return body["articles"] if isinstance(body, dict) else body
+
+
+@pytest.mark.parametrize("path", LIST_ENDPOINTS + ["/search?query=紅葉"])
+def test_list_returns_summary_without_content(client, long_articles, path):
+    from app.database import async_engine, engine
+    from app.summary import SUMMARY_LENGTH
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = [engine, async_engine.sync_engine]
+    for target in engines:
+        event.listen(target, "before_cursor_execute", record)
+    try:
+        response = client.get(path)
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    articles = items(response.json())
+    assert len(articles) == len(long_articles)
+    for article in articles:
+        assert "content" not in article
+        assert article["summary"].startswith("見出し 今日は公園を散歩しました。紅葉がきれいでした。")
+        assert len(article["summary"]) <= SUMMARY_LENGTH + len("...")
+    # 本文の列は読み込まない
+    assert not [statement for statement in statements if CONTENT_COLUMN.search(statement)]
+    # 1ページの応答は本文1件分よりも小さい
+    assert len(response.content) < len(CONTENT.encode("utf-8"))
+
+
+def test_fields_limits_item_keys(client, long_articles):
+    response = client.get("/articles", params={"fields": "id,title"})
+    assert response.status_code == 200
+    assert {tuple(article) for article in response.json()["articles"]} == {("id", "title")}
+
+    assert client.get("/articles", params={"fields": "id,content"}).status_code == 400
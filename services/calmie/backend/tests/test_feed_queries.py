@@ -0,0 +1,74 @@
+"""一覧系エンドポイントのクエリ数が記事数に比例しないこと（N+1 の解消、app/feed.py）"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+LIST_ENDPOINTS = [
+    "/articles",
+    "/articles/ranking",
+    "/articles/trend",
+    "/mypage/{user_id}/articles",
+]
+
+
+@contextmanager
+def count_queries():
+    """同期・非同期エンジンで実行された SQL 文を数える"""
+    from app.database import async_engine, engine
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = [engine] + ([async_engine.sync_engine] if async_engine is not None else [])
+    for target in engines:
+        event.listen(target, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for target in engines:
+            event.remove(target, "before_cursor_execute", record)
+
+
+def query_count(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    body = response.json()
+    articles = body["articles"] if isinstance(body, dict) else body
+    with count_queries() as statements:
+        assert client.get(path).status_code == 200
+    return len(articles), len(statements)
+
+
+@pytest.mark.parametrize("path", LIST_ENDPOINTS)
+def test_list_query_count_does_not_grow_with_page_size(client, make_user, make_article, path):
+    user = make_user()
+    for i in range(3):
+        make_article(user, title=f"記事{i}", likes=i)
+    url = path.format(user_id=user.id)
+    small = query_count(client, url)
+
+    for i in range(3, 25):
+        make_article(user, title=f"記事{i}", likes=i)
+    large = query_count(client, url)
+
+    assert (small[0], large[0]) == (3, 25)
+    assert large[1] == small[1]
+    assert large[1] <= 6
+
+
+def test_feed_context_counts(db, make_user, make_article):
+    from app.feed import load_feed_context
+
+    alice, bob = make_user("alice"), make_user("bob")
+    articles = [make_article(alice, likes=5), make_article(bob, likes=2)]
+    articles[0].comment_count = 3
+    db.commit()
+
+    feed = load_feed_context(db, articles, with_users=True)
+
+    assert [feed.like_count(article.id) for article in articles] == [5, 2]
+    assert [feed.comment_count(article.id) for article in articles] == [3, 0]
+    assert [feed.username(article.create_user_id) for article in articles] == ["alice", "bob"]
@@ -0,0 +1,61 @@
+"""画像のアップロード中も一覧の応答が止まらないこと（画像処理はプロセスプールで実行、app/image_processing.py）"""
+import io
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+IMAGE_SIZE = (2400, 1800)
+
+
+def noise_jpeg(seed: int) -> bytes:
+    """圧縮しにくい（処理に時間のかかる）画像"""
+    rng = random.Random(seed)
+    image = Image.frombytes("RGB", IMAGE_SIZE, rng.randbytes(IMAGE_SIZE[0] * IMAGE_SIZE[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def test_list_latency_during_uploads(client, make_user, make_article):
+    from app.image_processing import image_processor
+
+    user = make_user()
+    for i in range(10):
+        make_article(user, title=f"記事{i}")
+    user_id = user.id
+    # 受け付けの上限（これを超えると待たされ、待ちきれなければ 503）までアップロードを同時に送る
+    uploads_count = image_processor.stats()["max_pending"]
+    images = [noise_jpeg(seed) for seed in range(uploads_count)]
+    processed = image_processor.stats()["processed"]
+
+    def upload(image):
+        return client.post(
+            "/v2/upload-media",
+            data={"user_id": user_id},
+            files={"file": ("photo.jpg", image, "image/jpeg")},
+        )
+
+    latencies = []
+    with ThreadPoolExecutor(max_workers=uploads_count) as pool:
+        uploads = [pool.submit(upload, image) for image in images]
+        while not all(future.done() for future in uploads):
+            started = time.perf_counter()
+            assert client.get("/articles", params={"limit": 10}).status_code == 200
+            latencies.append(time.perf_counter() - started)
+        responses = [future.result() for future in uploads]
+
+    assert [response.status_code for response in responses] == [200] * uploads_count
+    stats = image_processor.stats()
+    assert stats["processed"] - processed >= uploads_count
+    assert stats["failures"] == 0
+
+    # 画像処理がイベントループ上で動いていれば、一覧は画像1枚の処理時間ぶん待たされる
+    assert len(latencies) >= 5
+    assert percentile(latencies, 0.99) < 0.5
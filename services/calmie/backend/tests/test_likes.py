@@ -0,0 +1,45 @@
+"""いいねの同時実行（同じ記事への集中で加算が失われないこと、同じユーザーは1回だけ数えること）"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+USERS = 30
+REPEATS = 2  # 同じユーザーが連打した場合も1回だけ数える
+
+
+def test_concurrent_likes_are_not_lost(client, db, make_user, make_article):
+    from app.models import ArticleLike, HistoryRating
+
+    author = make_user()
+    article = make_article(author)
+    user_ids = [make_user().id for _ in range(USERS)]
+    requests = user_ids * REPEATS
+    barrier = threading.Barrier(len(requests))
+
+    def like(user_id):
+        barrier.wait()
+        return client.post(f"/articles/{article.id}/like", params={"user_id": user_id})
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+        responses = list(pool.map(like, requests))
+
+    assert [response.status_code for response in responses] == [200] * len(requests)
+    assert sum(response.json()["message"] == "いいねしました" for response in responses) == USERS
+
+    db.expire_all()
+    assert db.query(HistoryRating.like_count).filter(HistoryRating.article_id == article.id).scalar() == USERS
+    assert db.query(ArticleLike).filter(ArticleLike.article_id == article.id).count() == USERS
+
+
+def test_delete_liked_article(client, db, make_user, make_article):
+    from app.models import Article
+
+    author, reader = make_user(), make_user()
+    article_id = make_article(author).id
+    assert client.post(f"/articles/{article_id}/like", params={"user_id": reader.id}).status_code == 200
+    assert client.post(
+        f"/articles/{article_id}/comments", json={"user_id": reader.id, "comment": "いいですね"}
+    ).status_code == 200
+
+    assert client.delete(f"/articles/{article_id}").status_code == 200
+    db.expunge_all()
+    assert db.get(Article, article_id) is None
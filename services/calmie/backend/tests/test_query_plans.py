@@ -0,0 +1,114 @@
+"""
+よく使うクエリがインデックスを使うこと（EXPLAIN で確認）
+
+テスト用のテーブルは小さく、そのままでは Seq Scan の方が安いと判断されるため、
+enable_seqscan = off で実行計画を作る。使えるインデックスがなければ Seq Scan のままになる。
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import String, cast, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+
+SINCE = datetime(2026, 10, 18)
+
+# (テーブル, 使うべきインデックス)
+HOT_QUERIES = [
+    ("history_rating", "uq_history_rating_article_id"),
+    ("article_comments", "ix_article_comments_article_id_created_at"),
+    ("article_likes", "ix_article_likes_article_id_created_at"),
+    ("article_likes", "ix_article_likes_created_at"),
+    ("daily_rating", "ix_daily_rating_updated_at"),
+    ("articles", "ix_articles_public_at_id"),
+    ("articles", "ix_articles_create_user_id_public_at_id"),
+    ("articles", "ix_articles_category"),
+    ("articles", "ix_articles_search_vector"),
+    ("media_files", "ix_media_files_uploaded_by_created_at"),
+]
+
+
+def hot_query(index):
+    """インデックスごとの代表的なクエリ"""
+    from app.models import (
+        Article, ArticleComment, ArticleLike, DailyRating, HistoryRating, MediaFile, PublicStatus
+    )
+    from app.pagination import keyset_page
+    from app.search import build_tsquery, search_filter
+
+    matches, rank = search_filter(Article.search_vector, build_tsquery("東京都"))
+    queries = {
+        # 一覧のいいね数・閲覧数（app/feed.py）
+        "uq_history_rating_article_id": select(HistoryRating).where(
+            HistoryRating.article_id.in_([1, 2, 3])
+        ),
+        # 記事ページのコメント
+        "ix_article_comments_article_id_created_at": select(ArticleComment).where(
+            ArticleComment.article_id == 1
+        ),
+        # トレンド・バッチの期間集計
+        "ix_article_likes_article_id_created_at": select(ArticleLike.id).where(
+            ArticleLike.article_id == 1,
+            ArticleLike.created_at >= SINCE,
+            ArticleLike.deleted_at.is_(None),
+        ),
+        "ix_article_likes_created_at": select(ArticleLike.article_id).where(
+            ArticleLike.created_at >= SINCE,
+            ArticleLike.deleted_at.is_(None),
+        ),
+        # 日次ランキング
+        "ix_daily_rating_updated_at": select(DailyRating).where(
+            DailyRating.updated_at >= SINCE - timedelta(days=1)
+        ),
+        # 最新の記事一覧・ユーザーの記事一覧（カーソルページング）
+        "ix_articles_public_at_id": keyset_page(select(Article.id), None, 30),
+        "ix_articles_create_user_id_public_at_id": keyset_page(
+            select(Article.id).where(Article.create_user_id == 1), None, 30
+        ),
+        # カテゴリ絞り込み
+        "ix_articles_category": select(Article.id).where(
+            Article.category.op("@>")(cast(["1"], ARRAY(String)))
+        ),
+        # 全文検索
+        "ix_articles_search_vector": select(Article.id).where(
+            Article.deleted_at.is_(None),
+            Article.public_status == PublicStatus.public,
+            matches,
+        ).order_by(rank.desc()).limit(20),
+        # ユーザーのメディア一覧
+        "ix_media_files_uploaded_by_created_at": select(MediaFile.id).where(
+            MediaFile.uploaded_by == 1,
+            MediaFile.deleted_at.is_(None),
+        ).order_by(MediaFile.created_at.desc()).limit(50),
+    }
+    return queries[index]
+
+
+@pytest.fixture
+def articles(db, make_user):
+    """公開中の記事（投稿者・カテゴリが分散し、公開状態での絞り込みが効かない実際に近い統計情報にする）"""
+    user_ids = [make_user().id for _ in range(20)]
+    db.execute(text("""
+        INSERT INTO articles (title, content, category, public_status, create_user_id,
+                              comment_count, created_at, updated_at, public_at, search_vector)
+        SELECT '記事' || i, '本文', ARRAY[(i % 20)::text], 'public', (:user_ids)[i % 20 + 1],
+               0, now(), now(), now() - i * interval '1 minute', to_tsvector('simple', 'a' || i)
+        FROM generate_series(1, 2000) AS i
+    """), {"user_ids": user_ids})
+    db.execute(text("ANALYZE articles"))
+    db.commit()
+
+
+def explain(db, stmt) -> str:
+    conn = db.connection()
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    return "\n".join(conn.exec_driver_sql(f"EXPLAIN {compiled}").scalars())
+
+
+@pytest.mark.parametrize("table, index", HOT_QUERIES)
+def test_hot_query_uses_index(db, articles, table, index):
+    plan = explain(db, hot_query(index))
+    db.rollback()
+
+    assert f"Seq Scan on {table}" not in plan, plan
+    assert index in plan, plan
@@ -0,0 +1,34 @@
+"""ランキングのスナップショット（app/ranking.py）から削除・非公開になった記事を返さないこと"""
+from datetime import datetime
+
+
+def test_snapshot_skips_deleted_and_private_articles(client, db, make_user, make_article, monkeypatch):
+    from app import ranking
+    from app.models import Article, DailyRating, PublicStatus
+
+    # 他のテストで読み込んだスナップショットを使わない
+    monkeypatch.setattr(ranking, "ranking_cache", ranking.RankingCache(check_interval=60))
+    user = make_user()
+    article_ids = [make_article(user, title=f"記事{i}").id for i in range(4)]
+    now = datetime.utcnow()
+    for score, article_id in enumerate(reversed(article_ids)):
+        db.add(DailyRating(
+            article_id=article_id, like_count=score, access_count=0, super_like_count=0,
+            created_at=now, updated_at=now,
+        ))
+    db.commit()
+    ranking.publish_ranking_snapshots(db)
+
+    def daily():
+        response = client.get("/articles/ranking/daily")
+        assert response.status_code == 200
+        return [(article["id"], article["rank"]) for article in response.json()["articles"]]
+
+    assert daily() == [(article_id, rank) for rank, article_id in enumerate(article_ids, 1)]
+
+    # 次のバッチ（スナップショットの作成）を待たずにランキングから外れる
+    assert client.delete(f"/articles/{article_ids[0]}").status_code == 200
+    db.query(Article).filter(Article.id == article_ids[2]).update({"public_status": PublicStatus.private})
+    db.commit()
+
+    assert daily() == [(article_ids[1], 1), (article_ids[3], 2)]
@@ -0,0 +1,74 @@
+"""全文検索（/search・/articles/search、app/search.py）の一致・関連度順・件数の上限・応答時間・応答の項目"""
+import time
+
+import pytest
+
+FILLER = 200  # 検索語を含まない記事の数
+
+
+def search(client, query, **params):
+    response = client.get("/search", params={"query": query, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_search_ranks_title_matches_first(client, make_user, make_article):
+    user = make_user()
+    in_content = make_article(user, title="週末の散歩", content="東京都の公園をめぐりました").id
+    in_title = make_article(user, title="東京都の夜景", content="きれいな夜景でした").id
+    make_article(user, title="東京から京都へ", content="新幹線の旅")  # 「東京都」は連続していない
+    make_article(user, title="猫の写真", content="かわいい猫")
+
+    articles = search(client, "東京都")["articles"]
+
+    assert [article["id"] for article in articles] == [in_title, in_content]
+    assert "content" not in articles[0]
+
+
+def test_search_pagination_is_capped(client, make_user, make_article):
+    from app.search import SEARCH_MAX_LIMIT
+
+    user = make_user()
+    for i in range(SEARCH_MAX_LIMIT + 5):
+        make_article(user, title=f"猫の写真 {i}", content="かわいい猫")
+
+    first = search(client, "猫", limit=SEARCH_MAX_LIMIT * 10)
+    assert len(first["articles"]) == SEARCH_MAX_LIMIT
+    assert first["next_cursor"]
+
+    second = search(client, "猫", cursor=first["next_cursor"])
+    ids = {article["id"] for article in first["articles"]}
+    assert second["articles"] and not ids & {article["id"] for article in second["articles"]}
+
+
+def test_search_latency(client, make_user, make_article):
+    user = make_user()
+    for i in range(FILLER):
+        make_article(user, title=f"日記 {i}", content="今日は家でゆっくり過ごしました。" * 20)
+    target = make_article(user, title="紅葉の名所", content="京都の紅葉を見に行きました").id
+
+    search(client, "紅葉")  # 初回の接続・プランのキャッシュを除く
+    started = time.perf_counter()
+    articles = search(client, "紅葉")["articles"]
+    elapsed = time.perf_counter() - started
+
+    assert [article["id"] for article in articles] == [target]
+    assert elapsed < 0.5
+
+
+@pytest.mark.parametrize("params", [{"query": "紅葉"}, {"category": "1"}, {}])
+def test_articles_search_returns_list_items(client, make_user, make_article, params):
+    from app.main import SEARCH_FIELDS
+
+    user = make_user()
+    target = make_article(user, title="紅葉の名所", content="京都の紅葉を見に行きました。" * 200).id
+
+    response = client.get("/articles/search", params=params)
+
+    assert response.status_code == 200
+    articles = response.json()["articles"]
+    assert [article["id"] for article in articles] == [target]
+    # /search と同じ一覧の項目（本文は含めない）
+    assert set(articles[0]) == set(SEARCH_FIELDS)
+    assert articles[0]["username"] == user.username
+    assert len(response.content) < len("京都の紅葉を見に行きました。".encode("utf-8")) * 200
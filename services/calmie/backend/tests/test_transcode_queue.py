@@ -0,0 +1,47 @@
+"""動画の変換ジョブ（app/transcode_queue.py）の対象と、同じ動画を再アップロードしたときの状態"""
+import os
+
+import pytest
+
+
+def test_video_extensions_follow_allowed_extensions():
+    from app.media_delivery import is_immutable
+    from app.transcode_queue import VIDEO_EXTENSIONS
+    from app.uploads import ALLOWED_EXTENSIONS, IMAGE_EXTENSIONS
+
+    assert set(VIDEO_EXTENSIONS) == set(ALLOWED_EXTENSIONS) - set(IMAGE_EXTENSIONS)
+    assert "webm" in VIDEO_EXTENSIONS
+    # 変換で置き換わる動画は、内容のハッシュ名でも変更不可（immutable）として配信しない
+    assert not is_immutable("0" * 64 + ".webm")
+
+
+@pytest.mark.parametrize("extension", ["mp4", "webm"])
+def test_reupload_reports_failed_transcode(client, db, make_user, extension):
+    from app.models import MediaFile, TranscodeJob
+    from app.transcode_queue import TRANSCODE_MAX_ATTEMPTS, claim_job, fail_job
+
+    video = os.urandom(4096)
+    user_id = make_user().id
+
+    def upload(path, **data):
+        response = client.post(path, data=data, files={"file": (f"clip.{extension}", video, f"video/{extension}")})
+        assert response.status_code == 200
+        return response.json()
+
+    first = upload("/upload/media/")
+    assert first["status"] == "queued"
+
+    # 変換が上限回数まで失敗した
+    for _ in range(TRANSCODE_MAX_ATTEMPTS):
+        job = claim_job(db)
+        fail_job(db, job, "invalid data")
+    assert db.get(TranscodeJob, first["job_id"]).status == "failed"
+
+    # 同じ内容の再アップロードは「完了」ではなく、そのファイルの変換の状態を返す
+    again = upload("/upload/media/")
+    assert (again["job_id"], again["status"]) == (first["job_id"], "failed")
+
+    media = upload("/v2/upload-media", user_id=user_id)
+    assert (media["job_id"], media["status"]) == (first["job_id"], "failed")
+    db.expire_all()
+    assert db.get(MediaFile, media["media_id"]).status == "failed"
@@ -0,0 +1,71 @@
+"""アップロードのストリーミング保存（app/uploads.py、ファイル全体をメモリに載せないこと）"""
+import hashlib
+import os
+import tracemalloc
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.uploads import UPLOAD_CHUNK_SIZE, receive_upload
+
+UPLOAD_SIZE = 32 * 1024 * 1024
+MAX_BYTES = 64 * 1024 * 1024
+
+
+@pytest.fixture
+def upload_app(tmp_path):
+    """receive_upload だけを呼ぶアプリ（保存中のメモリの最大値を返す）"""
+    directory = tmp_path / "uploads"
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...), max_bytes: int = MAX_BYTES):
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            with await receive_upload(file, str(directory), max_bytes) as stored:
+                _, peak = tracemalloc.get_traced_memory()
+                return {"size": stored.size, "sha256": stored.sha256, "peak": peak}
+        finally:
+            tracemalloc.stop()
+
+    return TestClient(app), directory
+
+
+@pytest.fixture
+def large_file(tmp_path):
+    path = tmp_path / "video.mp4"
+    with open(path, "wb") as out:
+        for _ in range(UPLOAD_SIZE // UPLOAD_CHUNK_SIZE):
+            out.write(os.urandom(UPLOAD_CHUNK_SIZE))
+    return path
+
+
+def post(client, path, **params):
+    with open(path, "rb") as file:
+        return client.post("/upload", params=params, files={"file": ("video.mp4", file, "video/mp4")})
+
+
+def test_large_upload_is_streamed(upload_app, large_file):
+    client, directory = upload_app
+
+    response = post(client, large_file)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["size"] == UPLOAD_SIZE
+    assert body["sha256"] == hashlib.sha256(large_file.read_bytes()).hexdigest()
+    # 32MB のファイルでも、保存中に使うメモリは読み込み単位（1MB）の数倍程度
+    assert body["peak"] < 4 * UPLOAD_CHUNK_SIZE
+    # with を抜けたら一時ファイルは削除される
+    assert os.listdir(directory) == []
+
+
+def test_oversized_upload_removes_temp_file(upload_app, large_file):
+    client, directory = upload_app
+
+    response = post(client, large_file, max_bytes=UPLOAD_SIZE // 2)
+
+    assert response.status_code == 413
+    assert os.listdir(directory) == []
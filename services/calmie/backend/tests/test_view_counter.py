@@ -0,0 +1,76 @@
+"""閲覧数の書き込みバッファ（app/view_counter.py）の書き込みに失敗したときの扱い"""
+import pytest
+from sqlalchemy.exc import OperationalError
+
+MAX_PENDING = 100
+MAX_ATTEMPTS = 3
+
+
+@pytest.fixture
+def failing_buffer():
+    """書き込みが失敗し続ける（DB に接続できない）バッファ"""
+    from app.view_counter import CounterBuffer
+
+    state = {"down": True, "written": {}}
+
+    def flush_fn(increments):
+        if state["down"]:
+            raise OperationalError("UPDATE history_rating", {}, Exception("connection refused"))
+        for key, amount in increments.items():
+            state["written"][key] = state["written"].get(key, 0) + amount
+
+    buffer = CounterBuffer(
+        name="test-counter", flush_fn=flush_fn, interval_seconds=60,
+        max_pending=MAX_PENDING, max_attempts=MAX_ATTEMPTS,
+    )
+    return buffer, state
+
+
+def test_failed_flush_is_requeued_up_to_max_pending(failing_buffer):
+    buffer, state = failing_buffer
+    for _ in range(80):
+        buffer.add(1)
+    buffer.add(2, 5)
+
+    assert buffer.flush() == 0
+    # 失敗した分はバッファへ戻る
+    assert (buffer.pending(1), buffer.pending(2)) == (80, 5)
+
+    # 失敗している間に増えた分も合わせて、戻すのは max_pending 件まで
+    for _ in range(60):
+        buffer.add(3)
+    assert buffer.flush() == 0
+    stats = buffer.stats()
+    assert stats["pending_total"] == MAX_PENDING
+    assert stats["dropped_total"] == 80 + 5 + 60 - MAX_PENDING
+    # 加算値の大きいキーから戻す
+    assert (buffer.pending(1), buffer.pending(3), buffer.pending(2)) == (80, 20, 0)
+
+    # 復旧すれば残りの加算値が書き込まれる
+    state["down"] = False
+    assert buffer.flush() == MAX_PENDING
+    assert state["written"] == {1: 80, 3: 20}
+    assert buffer.stats()["consecutive_failures"] == 0
+
+
+def test_flush_drops_after_max_attempts(failing_buffer):
+    buffer, state = failing_buffer
+    buffer.add(1, 10)
+
+    for attempt in range(1, MAX_ATTEMPTS):
+        assert buffer.flush() == 0
+        assert buffer.pending(1) == 10
+        assert buffer.stats()["consecutive_failures"] == attempt
+
+    # max_attempts 回続けて失敗したら捨てる（メモリに貯め続けない）
+    assert buffer.flush() == 0
+    stats = buffer.stats()
+    assert (stats["pending_total"], stats["dropped_total"]) == (0, 10)
+    assert stats["failure_count"] == MAX_ATTEMPTS
+    assert stats["consecutive_failures"] == 0
+
+    # 捨てた後に貯まった分は、また max_attempts 回まで書き直す
+    buffer.add(2, 3)
+    state["down"] = False
+    assert buffer.flush() == 3
+    assert state["written"] == {2: 3}
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+動画トランスコードワーカー
+
+transcode_jobs に登録されたジョブを取り出し、ffmpeg で H.264/AAC（WebM は VP9/Opus、720p）に変換します。
+変換後のファイルは一時ファイルに書き出してから元ファイルと置き換えるため、
+変換中も元の動画はそのまま配信されます。
+
+同時に実行する ffmpeg の数は --concurrency（既定は TRANSCODE_CONCURRENCY または 1）で制限します。
+
+実行方法:
+python transcode_worker.py
+
+# 同時に2本まで変換
+python transcode_worker.py --concurrency 2
+
+# 未処理のジョブがなくなったら終了（cron での実行用）
+python transcode_worker.py --once
+"""
+
+import sys
+import os
+import argparse
+import signal
+import subprocess
+import threading
+from datetime import datetime
+
+# パスを追加してappモジュールをインポート
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.transcode_queue import claim_job, complete_job, fail_job
+
+TRANSCODE_CONCURRENCY = int(os.getenv("TRANSCODE_CONCURRENCY", "1"))
+TRANSCODE_POLL_SECONDS = float(os.getenv("TRANSCODE_POLL_SECONDS", "5"))  # ジョブがないときの待ち時間
+TRANSCODE_TIMEOUT_SECONDS = int(os.getenv("TRANSCODE_TIMEOUT_SECONDS", "1800"))  # 1本あたりの変換時間の上限
+
+stop_event = threading.Event()
+
+
+def transcode_command(source_path: str, output_path: str) -> list:
+    """ffmpeg のコマンドライン（従来の /upload/media/ と同じ変換設定）"""
+    if output_path.lower().endswith(".webm"):
+        # WebM には H.264/AAC を入れられないため VP9/Opus で変換する
+        codecs = [
+            "-vcodec", "libvpx-vp9",
+            "-crf", "32", "-b:v", "0",  # 画質固定（H.264 の crf 28 と同程度）
+            "-deadline", "good", "-cpu-used", "4",  # エンコード速度
+            "-acodec", "libopus",
+            "-b:a", "128k",
+        ]
+    else:
+        codecs = [
+            "-vcodec", "libx264",  # H.264コーデック
+            "-crf", "28",          # 圧縮率（18-28推奨、大きいほど圧縮）
+            "-preset", "fast",     # エンコード速度
+            "-acodec", "aac",      # 音声コーデック
+            "-b:a", "128k",        # 音声ビットレート
+            "-movflags", "faststart",  # Web最適化
+        ]
+    return [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-i", source_path,
+        *codecs,
+        "-vf", "scale=1280:720",  # 720p解像度に制限
+        output_path,
+    ]
+
+
+def transcode(source_path: str) -> int:
+    """元ファイルを変換後のファイルで置き換え、変換後のサイズを返す"""
+    base, extension = os.path.splitext(source_path)
+    # 拡張子で出力形式が決まるため、一時ファイルにも同じ拡張子を付ける
+    output_path = f"{base}.transcoding{extension}"
+    try:
+        subprocess.run(
+            transcode_command(source_path, output_path),
+            check=True,
+            capture_output=True,
+            timeout=TRANSCODE_TIMEOUT_SECONDS,
+        )
+        os.replace(output_path, source_path)
+        return os.path.getsize(source_path)
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+
+def process_one() -> bool:
+    """ジョブを1件処理する（ジョブがなければ False）"""
+    db = SessionLocal()
+    try:
+        job = claim_job(db)
+        if job is None:
+            return False
+
+        print(f"🎬 変換開始: job={job.id} {job.source_path}（{job.attempts}回目）")
+        started = datetime.utcnow()
+        try:
+            file_size = transcode(job.source_path)
+        except subprocess.CalledProcessError as e:
+            error = e.stderr.decode(errors="replace") if e.stderr else str(e)
+            print(f"❌ 変換エラー: job={job.id} {error.strip()[-500:]}")
+            fail_job(db, job, error)
+            return True
+        except Exception as e:
+            print(f"❌ 変換エラー: job={job.id} {e}")
+            fail_job(db, job, str(e))
+            return True
+
+        complete_job(db, job, file_size)
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        print(f"✅ 変換完了: job={job.id}（{elapsed:.1f}秒、{file_size} bytes）")
+        return True
+    except Exception as e:
+        print(f"❌ ジョブ処理中にエラーが発生しました: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+def worker_loop(once: bool) -> None:
+    while not stop_event.is_set():
+        if process_one():
+            continue
+        if once:
+            return
+        stop_event.wait(TRANSCODE_POLL_SECONDS)
+
+
+def parse_args():
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="動画トランスコードワーカー")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=TRANSCODE_CONCURRENCY,
+        help="同時に実行する変換の数",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="未処理のジョブがなくなったら終了する",
+    )
+    return parser.parse_args()
+
+
+def main():
+    """メイン処理"""
+    args = parse_args()
+    concurrency = max(1, args.concurrency)
+    print(f"🚀 トランスコードワーカーを開始します（同時実行数: {concurrency}）")
+
+    # 停止シグナルを受けたら、処理中の変換が終わってから終了する
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    threads = [
+        threading.Thread(target=worker_loop, args=(args.once,), name=f"transcode-{i}", daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(timeout=1)
+
+    print("👋 トランスコードワーカーを終了しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -314,7 +314,7 @@ const ArticleDetail: React.FC = () => {
     };
 
     const handleLike = async () => {
-        if (!isAuthenticated) {
+        if (!isAuthenticated || !user?.id) {
             setShowAuthModal(true);
             return;
         }
@@ -342,7 +342,9 @@ const ArticleDetail: React.FC = () => {
                 }, 800);
             }
 
-            const response = await axios.post(`${API_BASE_URL}/articles/${article?.id}/like`);
+            const response = await axios.post(
+                `${API_BASE_URL}/articles/${article?.id}/like?user_id=${user.id}`
+            );
             if (article) {
                 setArticle({ ...article, like_count: response.data.like_count });
             }
@@ -5,11 +5,12 @@ import { API_BASE_URL } from '../config/api';
 interface Article {
     id: number;
     title: string;
-    content?: string;
+    summary?: string;
     thumbnail_image?: string;
     thumbnail_url?: string;
     category?: string[];
     username?: string;
+    like_count?: number;
     likes_count?: number;
     access_count?: number;
     comment_count?: number;
@@ -176,7 +177,7 @@ const Articles: React.FC<ArticlesProps> = ({
         } else {
             return (
                 <div className="article-meta">
-                    <p>❤️ {article.likes_count || 0}</p>
+                    <p>❤️ {article.like_count ?? article.likes_count ?? 0}</p>
                     <p>💬 {article.comment_count || 0}</p>
                     <p>📅 {formatDate(article.public_at)}</p>
                     <p>👁️‍🗨️ {article.access_count || 0}</p>